@@ -1,49 +1,254 @@
-# File: arbitrage.py
+import asyncio
 import logging
-from config import Config
+import time
+from latency import Trace
+from log_setup import TickLogger
 
 logger = logging.getLogger(__name__)
 
 class ArbitrageEngine:
-    def __init__(self, price_collector):
+    """决策任务：被行情更新唤醒，对所有有更新的交易对做一次价差计算并下单
+
+    每个交易对同时最多只有一个套利在执行，执行期间该交易对的新机会直接跳过，
+    避免波动时重复、重叠地调用 execute_pair。单交易所三角套利的三条腿共用同一个交易所的余额，
+    每个交易所同时最多执行一个三角环。
+    """
+
+    def __init__(self, price_collector, trader, latency=None, risk=None, reconciliation=None, journal=None,
+                 tables=None):
         self.price_collector = price_collector
+        self.trader = trader
+        self.latency = latency  # 可选的 LatencyTracker，记录每次套利各阶段的耗时
+        self.risk = risk  # 可选的 RiskEngine，下单前的内存风控检查
+        self.reconciliation = reconciliation  # 可选的 Reconciliation，记录发出的套利订单，与交易所成交记录对账
+        self.journal = journal  # 可选的 Journal，记录每个机会的处理结果、订单和成交
+        self.tables = tables  # 可选的 MarketTables，按数量步长取整下单数量，过滤低于最小数量 / 金额的机会
+        self.in_flight = {}  # symbol（三角套利为 ('triangle', venue)）-> 正在执行的套利任务
+        self.evaluation_count = 0
+        self.opportunity_count = 0
+        self.triangle_count = 0
+        self.skipped_count = 0
+        self.rejected_count = 0
+        self.tick_log = TickLogger(logger)  # 逐 tick 的机会日志按交易对限流
 
     def check_arbitrage(self):
-        with self.price_collector.lock:
-            price_binance = self.price_collector.prices['binance']
-            price_okx = self.price_collector.prices['okx']
+        # 使用价格矩阵对所有有更新的交易对做向量化计算
+        self.evaluation_count += 1
+        opportunities = self.price_collector.scan()
+        for opportunity in opportunities:
+            self.opportunity_count += 1
+            self.tick_log.log(opportunity.symbol, 'opportunity',
+                              "%s 当前可成交价差为 %.2f，扣费后 %.1f bps (卖 %s %.2f / 买 %s %.2f)，适合套利",
+                              opportunity.symbol, opportunity.spread, opportunity.edge * 1e4, opportunity.sell_ex,
+                              opportunity.sell_price, opportunity.buy_ex, opportunity.buy_price,
+                              **opportunity._asdict())
+        return opportunities
 
-        # 确保价格数据存在
-        if not all([price_binance, price_okx]):
-            logger.warning("Missing prices for Binance or OKX.")
+    def check_triangles(self):
+        # 只重算经过有更新报价的三角环
+        triangles = self.price_collector.scan_triangles()
+        for triangle in triangles:
+            self.triangle_count += 1
+            self.tick_log.log(('triangle', triangle.venue, triangle.path), 'triangle',
+                              "%s 三角套利 %s 扣费后 %.1f bps (%s)", triangle.venue, '→'.join(triangle.path),
+                              triangle.edge * 1e4,
+                              ', '.join(f"{side} {symbol} {price:.8g}" for symbol, side, price in triangle.legs))
+        return triangles
+
+    async def run(self):
+        logger.info("ArbitrageEngine is running...")
+        while True:
+            await self.price_collector.wait_for_update()
+            opportunities = self.check_arbitrage()
+            decision_ns = time.perf_counter_ns()
+            for opportunity in opportunities:
+                # 触发交易逻辑
+                self.execute_arbitrage(opportunity, decision_ns)
+            for triangle in self.check_triangles():
+                self.execute_triangle(triangle)
+
+    def execute_arbitrage(self, opportunity, decision_ns=None):
+        symbol = opportunity.symbol
+        if symbol in self.in_flight:
+            self.skipped_count += 1
+            logger.debug("Arbitrage on %s still in flight, skipping.", symbol)
+            if self.journal is not None:
+                self.journal.opportunity(opportunity, 'seen', 'in flight')
             return None
 
-        # 计算价格差
-        spread = abs(price_binance - price_okx)
-        logger.info(f"Checking arbitrage... Binance: {price_binance}, OKX: {price_okx}, Spread: {spread:.2f}")
-
-        # 如果价格差超过阈值，认为适合套利
-        if spread >= Config.SPREAD_THRESHOLD:
-            logger.info(f"Arbitrage opportunity detected! Spread: {spread:.2f} - Suitable for arbitrage!")
-            if price_binance > price_okx:
-                return ('binance', 'okx', price_binance, price_okx)
-            else:
-                return ('okx', 'binance', price_okx, price_binance)
+        collector = self.price_collector
+        row = collector.symbol_map.row[symbol]
+        quantity = collector.quantities[row]
+        if self.tables is not None:
+            col = collector.symbol_map.col
+            quantity, reason = self.tables.pair_order(row, col[opportunity.sell_ex], col[opportunity.buy_ex],
+                                                      opportunity.sell_price, opportunity.buy_price)
+            if reason is not None:
+                self.rejected_count += 1
+                self.tick_log.log(('tables', symbol), 'order_rejected', "Cannot trade %s: %s", symbol, reason)
+                if self.journal is not None:
+                    self.journal.opportunity(opportunity, 'rejected', reason, quantity)
+                return None
+        ticket = None
+        if self.risk is not None:
+            if not self.risk.can_trade(opportunity, quantity):
+                self.rejected_count += 1
+                self.tick_log.log(('risk', symbol), 'risk_rejected', "Risk check rejected %s: %s",
+                                  symbol, self.risk.last_reason)
+                if self.journal is not None:
+                    self.journal.opportunity(opportunity, 'rejected', self.risk.last_reason, quantity)
+                return None
+            ticket = self.risk.open_pair(opportunity, quantity)
+
+        trace = None
+        if self.latency is not None:
+            trace = self.start_trace(opportunity, decision_ns or time.perf_counter_ns())
+
+        # 交易在后台任务中执行，行情接收和决策循环都不会被阻塞
+        decided_at = time.time() if self.journal is not None else None
+        task = asyncio.create_task(self._run_trade(opportunity, quantity, trace, ticket, decided_at))
+        self.in_flight[symbol] = task
+        task.add_done_callback(lambda _: self.in_flight.pop(symbol, None))
+        return task
+
+    def execute_triangle(self, triangle):
+        key = ('triangle', triangle.venue)
+        if key in self.in_flight:
+            self.skipped_count += 1
+            logger.debug("Triangular arbitrage on %s still in flight, skipping.", triangle.venue)
+            if self.journal is not None:
+                self.journal.cycle(triangle, 'seen', 'in flight')
+            return None
+        if self.risk is not None and not self.risk.can_trade_venue(triangle.venue):
+            self.rejected_count += 1
+            self.tick_log.log(('risk', key), 'risk_rejected', "Risk check rejected triangle on %s: %s",
+                              triangle.venue, self.risk.last_reason)
+            if self.journal is not None:
+                self.journal.cycle(triangle, 'rejected', self.risk.last_reason)
+            return None
+
+        # 第一条腿按该交易对配置的下单数量，矩阵中的预计成交价也是按这个数量计算的；
+        # 后面的腿在 Trader.execute_cycle 里按实际得到的数量同样检查最小数量和金额
+        collector = self.price_collector
+        symbol, _, price = triangle.legs[0]
+        row = collector.symbol_map.row[symbol]
+        quantity = collector.quantities[row]
+        if self.tables is not None:
+            floored = self.tables.floor_amount(row, collector.symbol_map.col[triangle.venue], quantity, price)
+            if not floored:
+                self.rejected_count += 1
+                self.tick_log.log(('tables', key), 'order_rejected', "Cannot trade triangle on %s: %s %s below "
+                                  "minimum amount or notional", triangle.venue, symbol, quantity)
+                if self.journal is not None:
+                    self.journal.cycle(triangle, 'rejected', 'below minimum amount or notional', quantity)
+                return None
+            quantity = floored
+        decided_at = time.time() if self.journal is not None else None
+        task = asyncio.create_task(self._run_triangle(triangle, quantity, decided_at))
+        self.in_flight[key] = task
+        task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        return task
+
+    async def _run_triangle(self, triangle, quantity, decided_at=None):
+        logger.info("Executing triangular arbitrage on %s: %s (%.1f bps)", triangle.venue, '->'.join(triangle.path),
+                    triangle.edge * 1e4)
+        result = None
+        on_send, sent = self._journal_sends(lambda: self.journal.cycle(triangle, 'executed', None, quantity,
+                                                                        decided_at))
+        try:
+            result = await self.trader.execute_cycle(triangle.venue, triangle.legs, quantity, on_send=on_send)
+        finally:
+            if self.risk is not None:
+                # 折算成风控货币记入盈亏、停留在中间货币的敞口，并更新熔断状态
+                self.risk.close_cycle(triangle.legs, result)
+            if self.reconciliation is not None:
+                self.reconciliation.record_cycle(triangle, result)
+            if self.journal is not None:
+                self._journal_cycle(triangle, quantity, result, decided_at, sent)
+
+        if result.success:
+            logger.info("Triangular arbitrage executed successfully.")
         else:
-            logger.info(f"Current spread: {spread:.2f} - Not suitable for arbitrage.")
-        return None
+            logger.error("Triangular arbitrage %s: %s", result.status, result.reason)
+        return result
 
-    def run(self):
-        while True:
-            opportunity = self.check_arbitrage()
-            if opportunity:
-                sell_ex, buy_ex, sell_price, buy_price = opportunity
-                logger.info(f"Arbitrage opportunity detected! Sell {sell_ex} at {sell_price:.2f}, Buy {buy_ex} at {buy_price:.2f}")
-                # 触发交易逻辑
-                self.execute_arbitrage(sell_ex, buy_ex)
-            time.sleep(1)  # 防止频繁交易
-            time.sleep(0.1)
+    def start_trace(self, opportunity, decision_ns):
+        """以两条腿中较新的那条报价作为触发本次决策的行情"""
+        collector = self.price_collector
+        row = collector.symbol_map.row[opportunity.symbol]
+        sell_col = collector.symbol_map.col[opportunity.sell_ex]
+        buy_col = collector.symbol_map.col[opportunity.buy_ex]
+        col, venue = (sell_col, opportunity.sell_ex)
+        if collector.parsed_ns[row, buy_col] > collector.parsed_ns[row, sell_col]:
+            col, venue = (buy_col, opportunity.buy_ex)
+        return Trace(opportunity.symbol, venue, int(collector.received_ns[row, col]),
+                     int(collector.parsed_ns[row, col]), decision_ns)
+
+    async def _run_trade(self, opportunity, quantity, trace=None, ticket=None, decided_at=None):
+        logger.info("Executing arbitrage on %s between %s and %s", opportunity.symbol, opportunity.sell_ex, opportunity.buy_ex)
+        result = None
+        on_send, sent = self._journal_sends(lambda: self.journal.opportunity(opportunity, 'executed', None, quantity,
+                                                                              decided_at))
+        try:
+            result = await self.trader.execute_pair(opportunity.sell_ex, opportunity.buy_ex, opportunity.symbol,
+                                                    quantity, opportunity.sell_price, opportunity.buy_price,
+                                                    trace=trace, on_send=on_send)
+        finally:
+            if ticket is not None:
+                # 按实际成交更新风控状态
+                self.risk.close_pair(ticket, result)
+            if self.reconciliation is not None:
+                self.reconciliation.record_pair(opportunity.symbol, result)
+            if self.journal is not None:
+                self._journal_trade(opportunity, quantity, result, decided_at, sent)
+        if trace is not None:
+            self.latency.finish(trace)
+
+        if result.success:
+            logger.info("Arbitrage trade executed successfully.")
+        else:
+            logger.error("Arbitrage trade %s: %s", result.status, result.reason)
+        return result
+
+    def _journal_sends(self, record):
+        """返回交给交易模块的 (on_send, sent)：第一条腿发出前调用 record() 写入 executed 的记录，
+        id 放进 sent；每条腿发出前写入带客户端订单号的订单记录。没有日志时 on_send 为 None"""
+        sent = []
+        if self.journal is None:
+            return None, sent
+
+        def on_send(venue, symbol, side, amount, client_order_id):
+            if not sent:
+                sent.append(record())
+            self.journal.order_sent(sent[0], venue, symbol, side, amount, client_order_id)
+        return on_send, sent
+
+    def _journal_trade(self, opportunity, quantity, result, decided_at, sent=()):
+        """发出了订单时按客户端订单号更新两条腿的结果；没有发出订单（交易模块的下单前检查未通过或执行异常）
+        时记为 rejected"""
+        if sent:
+            self.journal.pair(sent[0], opportunity.symbol, quantity, result)
+        elif result is None:
+            self.journal.opportunity(opportunity, 'rejected', 'error', quantity, decided_at)
+        elif result.status == 'rejected':
+            self.journal.opportunity(opportunity, 'rejected', result.reason, quantity, decided_at)
+        else:
+            opportunity_id = self.journal.opportunity(opportunity, 'executed', None, quantity, decided_at)
+            self.journal.pair(opportunity_id, opportunity.symbol, quantity, result)
+
+    def _journal_cycle(self, triangle, quantity, result, decided_at, sent=()):
+        """与 _journal_trade 相同，没有完整成交的环把执行结果记在 reason 中"""
+        if sent:
+            self.journal.cycle_result(sent[0], triangle, result)
+        elif result is None:
+            self.journal.cycle(triangle, 'rejected', 'error', quantity, ts=decided_at)
+        elif result.status == 'rejected':
+            self.journal.cycle(triangle, 'rejected', result.reason, quantity, ts=decided_at)
+        else:
+            cycle_id = self.journal.cycle(triangle, 'executed', None, quantity, decided_at)
+            self.journal.cycle_result(cycle_id, triangle, result)
 
-    def execute_arbitrage(self, sell_exchange, buy_exchange):
-        # 实际的交易逻辑
-        logger.info(f"Executing arbitrage between {sell_exchange} and {buy_exchange}")
+    async def drain(self):
+        """等待所有正在执行的套利完成"""
+        if self.in_flight:
+            await asyncio.gather(*self.in_flight.values(), return_exceptions=True)
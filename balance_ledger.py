@@ -0,0 +1,187 @@
+# File: balance_ledger.py
+import asyncio
+import logging
+import time
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class Reservation:
+    """下单时预扣的余额，成交回报到达后用 confirm 修正，失败时用 release 退回"""
+
+    __slots__ = ('venue', 'symbol', 'side', 'quantity', 'price', 'base', 'quote')
+
+    def __init__(self, venue, symbol, side, quantity, price):
+        self.venue = venue
+        self.symbol = symbol
+        self.side = side
+        self.quantity = quantity
+        self.price = price
+        self.base, self.quote = symbol.split('/')
+
+    @property
+    def currency(self):
+        """被预扣的币种"""
+        return self.base if self.side == 'sell' else self.quote
+
+    @property
+    def amount(self):
+        """被预扣的数量"""
+        return self.quantity if self.side == 'sell' else self.quantity * self.price
+
+
+class BalanceLedger:
+    """本地维护的各交易所可用余额
+
+    启动时从交易所拉一次余额，之后下单时乐观预扣、成交时按回报入账，
+    下单前的检查只是一次内存查询。后台任务通过私有 websocket（ccxt.pro watch_balance）
+    或定时 REST 查询与交易所对账，偏差超过 Config.BALANCE_DRIFT_TOLERANCE 时告警。
+
+    每次本地入账（confirm / release / adjust）递增该交易所的版本号。REST 查询在请求前记下版本号，
+    返回时版本号已变说明快照可能是入账之前的余额，丢弃而不覆盖账本。
+    """
+
+    def __init__(self, exchanges, notifier=None, resync_interval=None, drift_tolerance=None, drift_min_abs=None):
+        self.exchanges = exchanges
+        self.notifier = notifier
+        self.resync_interval = resync_interval or Config.BALANCE_RESYNC_INTERVAL
+        self.drift_tolerance = Config.BALANCE_DRIFT_TOLERANCE if drift_tolerance is None else drift_tolerance
+        self.drift_min_abs = Config.BALANCE_DRIFT_MIN_ABS if drift_min_abs is None else drift_min_abs
+        self.balances = {venue: {} for venue in exchanges}  # venue -> {currency: free}
+        self.pending = {venue: 0 for venue in exchanges}    # 尚未确认的预扣数量
+        self.last_sync = {venue: 0.0 for venue in exchanges}
+        self.generation = {venue: 0 for venue in exchanges}  # 本地入账的版本号
+        self.tasks = []
+        self.resync_tasks = set()  # request_resync 发起的后台查询，保留引用直到完成
+
+    def available(self, venue, currency):
+        return self.balances[venue].get(currency, 0.0)
+
+    def reserve(self, venue, symbol, side, quantity, price):
+        """发单前乐观预扣余额，返回 Reservation"""
+        reservation = Reservation(venue, symbol, side, quantity, price)
+        self._add(venue, reservation.currency, -reservation.amount)
+        self.pending[venue] += 1
+        return reservation
+
+    def release(self, reservation):
+        """订单失败，退回预扣的余额"""
+        self._add(reservation.venue, reservation.currency, reservation.amount)
+        self.pending[reservation.venue] -= 1
+        self.generation[reservation.venue] += 1
+
+    def confirm(self, reservation, order):
+        """按实际成交修正余额：退回未成交部分，计入买到/卖得的币种，扣除手续费"""
+        filled = order.get('filled')
+        if filled is None:
+            filled = reservation.quantity
+        cost = order.get('cost')
+        if cost is None:
+            average = order.get('average') or order.get('price') or reservation.price
+            cost = filled * average
+
+        venue = reservation.venue
+        if reservation.side == 'sell':
+            self._add(venue, reservation.base, reservation.quantity - filled)
+            self._add(venue, reservation.quote, cost)
+        else:
+            self._add(venue, reservation.quote, reservation.amount - cost)
+            self._add(venue, reservation.base, filled)
+
+        fee = order.get('fee') or {}
+        if fee.get('cost') and fee.get('currency'):
+            self._add(venue, fee['currency'], -fee['cost'])
+        self.pending[venue] -= 1
+        self.generation[venue] += 1
+
+    def adjust(self, venue, currency, amount):
+        """记入交易之外的已知余额变化（如再平衡的提币和充值），避免下次对账误报偏差"""
+        self._add(venue, currency, amount)
+        self.generation[venue] += 1
+
+    def _add(self, venue, currency, amount):
+        balances = self.balances[venue]
+        balances[currency] = balances.get(currency, 0.0) + amount
+
+    async def seed(self):
+        """启动时并发拉取所有交易所的余额"""
+        await asyncio.gather(*(self.resync(venue) for venue in self.exchanges))
+
+    async def resync(self, venue):
+        """用 REST 余额覆盖本地账本，有未确认订单或查询期间有新的入账时跳过，避免覆盖掉预扣和成交"""
+        generation = self.generation[venue]
+        try:
+            balance = await self.exchanges[venue].fetch_balance()
+        except Exception as e:
+            logger.error(f"Failed to fetch balance on {venue}: {e}")
+            return
+        self.apply_snapshot(venue, balance, generation)
+
+    def request_resync(self, venue):
+        """在后台发起一次 resync，不等待结果"""
+        task = asyncio.create_task(self.resync(venue))
+        self.resync_tasks.add(task)
+        task.add_done_callback(self.resync_tasks.discard)
+        return task
+
+    def apply_snapshot(self, venue, balance, generation=None):
+        """用交易所推送或查询到的余额快照校准本地账本；generation 为请求快照时的版本号，推送的快照为 None"""
+        if self.pending[venue]:
+            logger.debug(f"Skip balance sync on {venue}: {self.pending[venue]} orders in flight")
+            return
+        if generation is not None and generation != self.generation[venue]:
+            logger.debug(f"Skip stale balance snapshot on {venue}: ledger changed while fetching")
+            return
+        remote = {currency: float(amount) for currency, amount in (balance.get('free') or {}).items()
+                  if amount is not None}
+        if self.last_sync[venue]:
+            self.check_drift(venue, remote)
+        self.balances[venue] = remote
+        self.last_sync[venue] = time.time()
+
+    def check_drift(self, venue, remote):
+        """比较本地账本与交易所余额，返回相对偏差超过容忍度、且绝对偏差不低于该币种下限的 {currency: (local, remote)}"""
+        local = self.balances[venue]
+        drifted = {}
+        for currency in set(local) | set(remote):
+            local_amount = local.get(currency, 0.0)
+            remote_amount = remote.get(currency, 0.0)
+            diff = abs(local_amount - remote_amount)
+            if diff < self.drift_min_abs.get(currency, 0.0):
+                continue  # 灰尘余额的相对偏差没有意义
+            scale = max(abs(remote_amount), abs(local_amount), 1e-12)
+            if diff / scale > self.drift_tolerance:
+                drifted[currency] = (local_amount, remote_amount)
+        if drifted:
+            msg = f"Balance drift on {venue}: " + ', '.join(
+                f"{currency} local={local_amount} exchange={remote_amount}"
+                for currency, (local_amount, remote_amount) in drifted.items())
+            logger.warning(msg)
+            if self.notifier is not None:
+                self.notifier.send_alert(msg)
+        return drifted
+
+    async def run(self):
+        """后台校准：支持 watch_balance 的交易所走私有推送，其余定时轮询"""
+        self.tasks = [asyncio.create_task(self._sync_loop(venue)) for venue in self.exchanges]
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def _sync_loop(self, venue):
+        exchange = self.exchanges[venue]
+        while True:
+            if getattr(exchange, 'has', {}).get('watchBalance') and Config.USE_PRIVATE_STREAMS:
+                try:
+                    balance = await exchange.watch_balance()
+                    self.apply_snapshot(venue, balance)
+                    continue
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Balance stream on {venue} failed, falling back to REST: {e}")
+            await asyncio.sleep(self.resync_interval)
+            await self.resync(venue)
+
+    def stop(self):
+        for task in self.tasks + list(self.resync_tasks):
+            task.cancel()
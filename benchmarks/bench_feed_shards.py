@@ -0,0 +1,146 @@
+# File: benchmarks/bench_feed_shards.py
+"""多进程行情解析的吞吐基准
+
+工作进程从内存中预先生成的 OKX books 帧（不经过网络）尽快解析、维护订单簿并写入共享内存报价表，
+主进程按 doorbell 通知把报价写入价格矩阵。总帧数固定，分别用 1 / 2 / 4 / 8 个工作进程，报告：
+- 所有工作进程合计的解析吞吐（帧/秒），以及与单进程内直接解析（PriceCollector）的对比
+- 主进程实际写入矩阵的报价数（同一槽位的多次写入在两次读取之间会被合并）
+- 报价从工作进程解析完成到写入主进程矩阵的延迟分布，以及读到写了一半的槽位的次数
+
+吞吐只有在机器有足够的空闲核时才会随进程数增长，核数少于进程数时各进程互相抢占。
+
+用法: python benchmarks/bench_feed_shards.py [总帧数]
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_collector import PriceCollector  # noqa: E402
+from feed_shards import ShardCollector, ShardedPriceCollector, shard_plan  # noqa: E402
+from latency import Histogram  # noqa: E402
+from quote_table import QuoteTable  # noqa: E402
+
+SYMBOLS = [f"C{i}/USDT" for i in range(100)]
+VENUES = ['okx']
+
+
+def okx_frames(rows, count):
+    """每个交易对一个快照，之后按交易对轮流生成 count 个增量帧"""
+    frames = []
+    seq_ids = {}
+    for row in rows:
+        seq_ids[row] = 1
+        frames.append(okx_frame(SYMBOLS[row], 1, 100.0 + row, 'snapshot'))
+    for i in range(count):
+        row = rows[i % len(rows)]
+        seq_ids[row] += 1
+        frames.append(okx_frame(SYMBOLS[row], seq_ids[row], 100.0 + row + (i % 7) * 0.01))
+    return frames
+
+
+def okx_frame(symbol, seq_id, price, action='update'):
+    data = {'bids': [[f"{price:.2f}", '10', '0', '1'], [f"{price - 0.01:.2f}", '5', '0', '1']],
+            'asks': [[f"{price + 0.01:.2f}", '10', '0', '1'], [f"{price + 0.02:.2f}", '5', '0', '1']],
+            'ts': str(int(time.time() * 1000)), 'seqId': seq_id, 'prevSeqId': seq_id - 1 if action == 'update' else -1}
+    return json.dumps({'arg': {'channel': 'books', 'instId': symbol.replace('/', '-')}, 'action': action, 'data': [data]})
+
+
+def synthetic_shard(table_name, shape, doorbell, rows, count, results):
+    """工作进程：解析预先生成的帧，返回 (帧数, 开始, 结束) 的 perf_counter 时间"""
+    table = QuoteTable(*shape, name=table_name)
+    fd = doorbell.fileno()
+    os.set_blocking(fd, False)
+    frames = okx_frames(rows, count)
+
+    async def main():
+        collector = ShardCollector(table, fd, 'okx', rows, SYMBOLS, VENUES)
+        start = time.perf_counter()
+        for i, frame in enumerate(frames):
+            collector.on_okx_frame(frame)
+            if i % 64 == 63:
+                await asyncio.sleep(0)  # 让出一次，发出合并后的 doorbell 通知
+        await asyncio.sleep(0)
+        return time.perf_counter() - start, start
+
+    elapsed, start = asyncio.run(main())
+    results.put((len(frames), start, start + elapsed))
+    table.close()
+
+
+class BenchCollector(ShardedPriceCollector):
+    """记录每次读取到的报价从工作进程解析完成到写入矩阵的延迟"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.handoff = Histogram()
+
+    def poll(self):
+        before = self.parsed_ns.copy()
+        count = super().poll()
+        if count:
+            now = time.perf_counter_ns()
+            for parsed_ns in self.parsed_ns[self.parsed_ns != before].tolist():
+                self.handoff.record((now - parsed_ns) // 1000)
+        return count
+
+
+async def bench_shards(shards, total):
+    collector = BenchCollector(None, SYMBOLS, VENUES, shards=shards)
+    plan = shard_plan(collector.symbol_map, shards)
+    results = collector.context.Queue()
+    processes = [
+        collector.context.Process(target=synthetic_shard, args=(collector.table.name, collector.table.shape,
+                                                                collector.doorbell_write, rows, total // len(plan),
+                                                                results))
+        for _, rows in plan
+    ]
+    loop = asyncio.get_running_loop()
+    fd = collector.doorbell_read.fileno()
+    os.set_blocking(fd, False)
+    loop.add_reader(fd, collector.on_doorbell)
+    for process in processes:
+        process.start()
+    reports = [await loop.run_in_executor(None, results.get) for _ in processes]
+    for process in processes:
+        await loop.run_in_executor(None, process.join)
+    loop.remove_reader(fd)
+    collector.poll()
+    collector.processes = processes
+    collector.stop()
+
+    frames = sum(count for count, _, _ in reports)
+    wall = max(end for _, _, end in reports) - min(start for _, start, _ in reports)
+    return {'shards': len(plan), 'frames': frames, 'rate': frames / wall, 'applied': collector.tick_count,
+            'handoff': collector.handoff.summary(), 'torn': collector.table.torn}
+
+
+def bench_single(total):
+    """单进程基准：在同一个进程里解析并写入价格矩阵"""
+    collector = PriceCollector(None, symbols=SYMBOLS, venues=VENUES)
+    collector.fetch_snapshots = False
+    frames = okx_frames(list(range(len(SYMBOLS))), total)
+    start = time.perf_counter()
+    for frame in frames:
+        collector.on_okx_frame(frame)
+    return len(frames) / (time.perf_counter() - start)
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    print(f"cpus: {os.cpu_count()}, symbols: {len(SYMBOLS)}, frames: {total}")
+    single = bench_single(total)
+    print(f"single process (in-loop):  {single:>10,.0f} frames/s")
+    for shards in (1, 2, 4, 8):
+        report = asyncio.run(bench_shards(shards, total))
+        handoff = report['handoff']
+        print(f"{report['shards']} shard(s):               {report['rate']:>10,.0f} frames/s "
+              f"({report['rate'] / single:.2f}x), applied {report['applied']:,} of {report['frames']:,} quotes, "
+              f"handoff p50={handoff.get('p50')}us p99={handoff.get('p99')}us, torn reads {report['torn']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# File: benchmarks/bench_journal.py
+"""套利日志的开销与吞吐基准
+
+1. 交易路径上记录一个机会（组装 tuple + put_nowait）的耗时分布
+2. 后台批量写入 SQLite（WAL）的吞吐：尽可能快地记录时每秒写入的记录数，
+   以及按固定速率记录时事件循环的 p99 / 最大停顿（写线程与事件循环争用 GIL 的影响）
+3. 按交易对 / 交易所 / 时间范围查询的耗时
+
+用法: python benchmarks/bench_journal.py [记录数]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from journal import Journal, query  # noqa: E402
+from latency import Histogram  # noqa: E402
+from price_matrix import Opportunity  # noqa: E402
+from trader import LegResult, PairResult  # noqa: E402
+
+SYMBOLS = [f"C{i}/USDT" for i in range(100)]
+
+
+async def loop_stalls(stop, stalls):
+    """每 1ms 醒来一次，记录实际睡眠超出的时间"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        stalls.append(time.perf_counter() - start - 0.001)
+
+
+async def run(path, count, rate=None):
+    """rate 为每秒记录的机会数，None 表示尽可能快"""
+    journal = Journal(path, queue_size=count * 3)
+    await journal.start()
+    opportunities = [Opportunity(symbol, 'binance', 'okx', 101.0, 100.0, 1.0, 0.001) for symbol in SYMBOLS]
+    order = {'id': '1', 'status': 'closed', 'filled': 0.01, 'average': 100.0,
+             'fee': {'cost': 0.001, 'currency': 'USDT'}}
+    result = PairResult('filled', LegResult('binance', 'sell', order, filled=True),
+                        LegResult('okx', 'buy', order, filled=True))
+
+    stop = asyncio.Event()
+    stalls = []
+    watcher = asyncio.create_task(loop_stalls(stop, stalls))
+    enqueue = Histogram()
+    start = time.perf_counter()
+    for i in range(count):
+        opportunity = opportunities[i % len(opportunities)]
+        t0 = time.perf_counter_ns()
+        if i % 10:
+            journal.opportunity(opportunity, 'seen', 'in flight')
+        else:
+            opportunity_id = journal.opportunity(opportunity, 'executed', None, 0.01)
+            journal.pair(opportunity_id, opportunity.symbol, 0.01, result)
+        enqueue.record(time.perf_counter_ns() - t0)
+        if rate is not None and i % 100 == 99:
+            await asyncio.sleep(max(start + (i + 1) / rate - time.perf_counter(), 0))
+        elif i % 1000 == 0:
+            await asyncio.sleep(0)
+    while journal.written < count + count // 10 * 4:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await watcher
+    await journal.close()
+    stalls.sort()
+    return enqueue.summary(), journal.written, elapsed, stalls[int(len(stalls) * 0.99)], stalls[-1]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'journal.db')
+        enqueue, written, elapsed, _, _ = asyncio.run(run(path, count))
+        print(f"enqueue:         p50={enqueue['p50']}ns p99={enqueue['p99']}ns max={enqueue['max']}ns")
+        print(f"written:         {written} records in {elapsed:.2f}s ({written / elapsed:,.0f} records/s)")
+        for rate in (1000, 10000):
+            _, written, elapsed, p99, worst = asyncio.run(run(os.path.join(tmp, f"paced{rate}.db"), rate * 3, rate))
+            print(f"{rate:>6} opp/s:    loop stall p99={p99 * 1e3:.2f}ms max={worst * 1e3:.2f}ms "
+                  f"({written / elapsed:,.0f} records/s)")
+
+        start = time.perf_counter()
+        rows = query(path, 'opportunities', symbol=SYMBOLS[7])
+        print(f"query symbol:    {len(rows)} rows in {(time.perf_counter() - start) * 1e3:.1f}ms")
+        start = time.perf_counter()
+        rows = query(path, 'fills', venue='okx', start=time.time() - 60)
+        print(f"query venue:     {len(rows)} rows in {(time.perf_counter() - start) * 1e3:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# File: benchmarks/bench_logging.py
+"""逐 tick 日志开销基准：旧的同步 f-string 日志 vs 队列 + 惰性格式化 + 限流
+
+只统计行情处理线程（调用方）上的耗时；后台写线程的耗时不计入。
+用法: python benchmarks/bench_logging.py [tick 数]
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_setup import TickLogger, setup_logging  # noqa: E402
+
+
+def legacy_tick(logger, price, spread, threshold):
+    # 旧实现每个 tick 的日志：价格一行、价差一行、判断结果一行
+    logger.info(f"Binance BTC Price: {price}")
+    logger.info(f"当前价格差值为 {spread:.2f}")
+    logger.info(f"当前价格差值为 {spread:.2f} < {threshold}，不适合套利")
+
+
+def sampled_tick(tick_log, price, spread, threshold):
+    tick_log.log('BTC/USDT', 'spread', "BTC/USDT price %.2f spread %.2f threshold %.2f",
+                 price, spread, threshold, price=price, spread=spread)
+
+
+def run(label, ticks, use_queue, sampled):
+    with tempfile.TemporaryDirectory() as tmp:
+        devnull = open(os.devnull, 'w')
+        saved_stderr, sys.stderr = sys.stderr, devnull  # StreamHandler 默认写 stderr
+        try:
+            listener = setup_logging(log_file=os.path.join(tmp, 'bench.log'),
+                                     structured_file=os.path.join(tmp, 'bench.jsonl') if sampled else None,
+                                     use_queue=use_queue)
+            logger = logging.getLogger('bench')
+            tick_log = TickLogger(logger, interval=1.0)
+            start = time.perf_counter()
+            for i in range(ticks):
+                price = 60000.0 + (i % 100) * 0.01
+                if sampled:
+                    sampled_tick(tick_log, price, 3.5, 10.0)
+                else:
+                    legacy_tick(logger, price, 3.5, 10.0)
+            elapsed = time.perf_counter() - start
+            if listener is not None:
+                listener.stop()
+        finally:
+            sys.stderr = saved_stderr
+            for handler in list(logging.getLogger().handlers):
+                handler.close()
+                logging.getLogger().removeHandler(handler)
+            devnull.close()
+    print(f"{label:<40} {elapsed / ticks * 1e6:8.2f} us/tick")
+
+
+def main():
+    ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    run('sync handlers, 3 f-string lines', ticks, use_queue=False, sampled=False)
+    run('queue handler, 3 f-string lines', ticks, use_queue=True, sampled=False)
+    run('queue handler, sampled structured', ticks, use_queue=True, sampled=True)
+
+
+if __name__ == '__main__':
+    main()
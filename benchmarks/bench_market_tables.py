@@ -0,0 +1,129 @@
+# File: benchmarks/bench_market_tables.py
+"""每个套利机会的定价开销基准：预先算好的交易规则表 vs 每次调用 ccxt 辅助函数
+
+N 个交易对、两个交易所，交易对信息为合成的 ccxt markets（binance 按小数位数、okx 按步长表示精度），
+每个机会需要：扣除两边 taker 费率后的净收益、按两边数量步长取整的下单数量、最小数量和最小金额检查。报告：
+- 价格矩阵 evaluate + opportunities（按表中各交易对各交易所的费率计算扣费收益）平均到每个机会的耗时，
+  分别是只有一个脏行（逐行标量路径）和所有行都是脏行（向量化路径）
+- 下单前定价：MarketTables.pair_order 与 ccxt 路径（market() 查表、taker 费率、amount_to_precision、limits）的对比
+
+用法: python benchmarks/bench_market_tables.py [交易对数] [机会数]
+"""
+import math
+import os
+import random
+import sys
+import time
+
+import ccxt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from market_tables import MarketTables  # noqa: E402
+from price_matrix import Opportunity, PriceMatrix, SymbolMap  # noqa: E402
+
+VENUES = ['binance', 'okx']
+
+
+def build_exchanges(symbols):
+    binance, okx = ccxt.binance(), ccxt.okx()
+    binance_markets, okx_markets = [], []
+    for i, symbol in enumerate(symbols):
+        base, quote = symbol.split('/')
+        market = {'symbol': symbol, 'base': base, 'quote': quote, 'baseId': base, 'quoteId': quote,
+                  'type': 'spot', 'spot': True, 'active': True, 'maker': 0.0008, 'taker': 0.001,
+                  'limits': {'amount': {'min': 1e-5}, 'cost': {'min': 5.0}}}
+        binance_markets.append(dict(market, id=f"{base}{quote}", precision={'amount': 5, 'price': 2}))
+        okx_markets.append(dict(market, id=f"{base}-{quote}", taker=0.0015 if i % 2 else 0.001,
+                                precision={'amount': 1e-6, 'price': 0.01}, limits={'amount': {'min': 1e-6}}))
+    binance.set_markets(binance_markets)
+    okx.set_markets(okx_markets)
+    return {'binance': binance, 'okx': okx}
+
+
+def ccxt_pricing(exchanges, opportunity, quantity):
+    """不用规则表时每个机会的定价：全部经由 ccxt 的 market dict 和精度函数"""
+    symbol = opportunity.symbol
+    sell_ex, buy_ex = exchanges[opportunity.sell_ex], exchanges[opportunity.buy_ex]
+    sell_market, buy_market = sell_ex.market(symbol), buy_ex.market(symbol)
+    net = math.log(opportunity.sell_price / opportunity.buy_price) - math.log(
+        (1 + buy_market['taker']) / (1 - sell_market['taker']))
+    quantity = min(float(sell_ex.amount_to_precision(symbol, quantity)),
+                   float(buy_ex.amount_to_precision(symbol, quantity)))
+    for market, price in ((sell_market, opportunity.sell_price), (buy_market, opportunity.buy_price)):
+        limits = market['limits']
+        if quantity < (limits['amount']['min'] or 0.0) or quantity * price < (limits['cost']['min'] or 0.0):
+            return net, 0.0
+    return net, quantity
+
+
+def table_pricing(tables, matrix, row, d, edge, opportunity):
+    """规则表路径：净收益来自矩阵中预先算好的费率下限，数量和限制来自嵌套 list"""
+    net = edge - matrix.fee_floor_rows[row][d]
+    sell_col, buy_col = matrix.pairs[d]
+    quantity, _ = tables.pair_order(row, sell_col, buy_col, opportunity.sell_price, opportunity.buy_price)
+    return net, quantity
+
+
+def bench_evaluate(matrix, rows, rounds):
+    """每轮把 rows 行写成有机会的报价后做一次 opportunities，返回平均到每个机会的微秒数"""
+    now = time.time()
+    count = 0
+    elapsed = 0.0
+    for i in range(rounds):
+        for row in rows:
+            price = 100.0 + row + (i % 5) * 0.01
+            matrix.update(row, 0, price * 1.01, price * 1.0101, now, now)
+            matrix.update(row, 1, price, price * 1.0001, now, now)
+        start = time.perf_counter()
+        count += len(matrix.opportunities(now))
+        elapsed += time.perf_counter() - start
+    return elapsed / max(count, 1) * 1e6
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    symbols = [f"C{i}/USDT" for i in range(n)]
+    symbol_map = SymbolMap(symbols, VENUES)
+    exchanges = build_exchanges(symbols)
+    tables = MarketTables(symbol_map, exchanges, [0.0123456] * n)
+    tables.load()
+
+    matrix = PriceMatrix(symbol_map, min_samples=10 ** 9)
+    matrix.set_fees(tables.taker)
+    # 统计样本永远不足，入场阈值固定为费率下限，出场阈值为 inf（每次都重新触发），只测计算开销
+    matrix.entry[:] = matrix.entry_floors
+    matrix.exit[:] = math.inf
+    print(f"symbols: {n}, venues: {len(VENUES)}, opportunities: {count}")
+    print(f"evaluate + net edge, 1 dirty row (scalar):    {bench_evaluate(matrix, [0], count):8.2f} us/opportunity")
+    print(f"evaluate + net edge, {n} dirty rows (vector): "
+          f"{bench_evaluate(matrix, range(n), max(count // n, 1)):8.2f} us/opportunity")
+
+    rng = random.Random(1)
+    cases = []
+    for _ in range(count):
+        row = rng.randrange(n)
+        d = rng.randrange(len(matrix.pairs))
+        sell_col, buy_col = matrix.pairs[d]
+        buy_price = 100.0 + row
+        sell_price = buy_price * (1 + rng.uniform(0.002, 0.01))
+        cases.append((row, d, math.log(sell_price / buy_price),
+                      Opportunity(symbols[row], VENUES[sell_col], VENUES[buy_col], sell_price, buy_price,
+                                  sell_price - buy_price, 0.0)))
+
+    start = time.perf_counter()
+    table_results = [table_pricing(tables, matrix, row, d, edge, opportunity) for row, d, edge, opportunity in cases]
+    table_us = (time.perf_counter() - start) / count * 1e6
+    start = time.perf_counter()
+    ccxt_results = [ccxt_pricing(exchanges, opportunity, 0.0123456) for _, _, _, opportunity in cases]
+    ccxt_us = (time.perf_counter() - start) / count * 1e6
+
+    mismatched = sum(abs(a[0] - b[0]) > 1e-12 or abs(a[1] - b[1]) > 1e-12 for a, b in zip(table_results, ccxt_results))
+    print(f"pre-trade pricing, market tables:  {table_us:8.2f} us/opportunity")
+    print(f"pre-trade pricing, ccxt helpers:   {ccxt_us:8.2f} us/opportunity ({ccxt_us / table_us:.1f}x)")
+    print(f"results differing between the two: {mismatched}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# File: benchmarks/bench_order_book.py
+"""订单簿更新吞吐量基准：回放一段突发的 depthUpdate 消息
+
+用法: python benchmarks/bench_order_book.py [消息数]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from order_book import OrderBook, BinanceBookSync  # noqa: E402
+
+
+def make_burst(count, mid=60000.0, tick=0.01, depth=1000, levels_per_msg=20, seed=7):
+    """生成 count 条连续序号的增量消息，价格围绕 mid 随机游走，约 1/4 的档位被删除"""
+    rng = random.Random(seed)
+    messages = []
+    update_id = 1000
+    for _ in range(count):
+        mid += rng.uniform(-0.5, 0.5)
+        bids, asks = [], []
+        for _ in range(levels_per_msg):
+            offset = rng.randint(1, depth) * tick
+            size = '0' if rng.random() < 0.25 else f"{rng.uniform(0.001, 2):.5f}"
+            if rng.random() < 0.5:
+                bids.append([f"{mid - offset:.2f}", size])
+            else:
+                asks.append([f"{mid + offset:.2f}", size])
+        messages.append({'e': 'depthUpdate', 's': 'BTCUSDT', 'U': update_id + 1, 'u': update_id + levels_per_msg,
+                         'b': bids, 'a': asks})
+        update_id += levels_per_msg
+    return messages
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    messages = make_burst(count)
+    snapshot_bids = [[f"{60000 - i * 0.01:.2f}", '1'] for i in range(1, 1001)]
+    snapshot_asks = [[f"{60000 + i * 0.01:.2f}", '1'] for i in range(1, 1001)]
+
+    book = OrderBook('binance', 'BTC/USDT')
+    sync = BinanceBookSync(book)
+    sync.on_snapshot(snapshot_bids, snapshot_asks, 1000)
+
+    levels = sum(len(m['b']) + len(m['a']) for m in messages)
+    start = time.perf_counter()
+    for msg in messages:
+        sync.on_diff(msg)
+    elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(count):
+        book.sell_vwap(0.5)
+        book.buy_vwap(0.5)
+    vwap_elapsed = time.perf_counter() - start
+
+    print(f"messages:        {count}")
+    print(f"level updates:   {levels}")
+    print(f"book depth:      {len(book.bids)} bids / {len(book.asks)} asks")
+    print(f"msgs/sec:        {count / elapsed:,.0f}")
+    print(f"levels/sec:      {levels / elapsed:,.0f}")
+    print(f"us per message:  {elapsed / count * 1e6:.2f}")
+    print(f"us per vwap:     {vwap_elapsed / (2 * count) * 1e6:.2f}")
+
+
+if __name__ == '__main__':
+    main()
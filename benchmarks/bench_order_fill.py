@@ -0,0 +1,71 @@
+# File: benchmarks/bench_order_fill.py
+"""订单确认延迟基准：在模拟的私有推送上比较旧的固定轮询与 OrderTracker
+
+用法: python benchmarks/bench_order_fill.py [订单数]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_exchange import FakeExchange  # noqa: E402
+from order_tracker import OrderTracker  # noqa: E402
+
+SYMBOL = 'BTC/USDT'
+
+
+def make_exchange(fill_delay):
+    return FakeExchange('binance', {'BTC': 1e6, 'USDT': 1e12}, {SYMBOL: (60000.0, 60001.0)},
+                        fill_delay=fill_delay, order_stream=True)
+
+
+async def legacy_wait(exchange, order_id):
+    """旧实现：最多 3 次 fetch_order，每次之后 sleep 1 秒"""
+    for _ in range(3):
+        order = await exchange.fetch_order(order_id, SYMBOL)
+        if order['status'] == 'closed':
+            return order
+        await asyncio.sleep(1)
+    return None
+
+
+async def measure(name, fill_delay, count, wait, stream_down=False):
+    exchange = make_exchange(fill_delay)
+    tracker = OrderTracker({'binance': exchange}, deadline=5, poll_first=0.01, poll_max=0.5)
+    runner = asyncio.create_task(tracker.run())
+    await asyncio.sleep(0)
+    exchange.set_stream_down(stream_down)
+    await asyncio.sleep(0.01)
+
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        order = await exchange.create_market_buy_order(SYMBOL, 0.001)
+        if wait == 'legacy':
+            result = await legacy_wait(exchange, order['id'])
+        else:
+            result = await tracker.wait('binance', order['id'], SYMBOL)
+        assert result is not None and result['status'] == 'closed'
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    tracker.stop()
+    runner.cancel()
+    latencies.sort()
+    print(f"{name:<34} fill_delay={fill_delay * 1000:>5.0f}ms  "
+          f"p50={statistics.median(latencies):8.2f}ms  max={latencies[-1]:8.2f}ms  "
+          f"fetch_order calls={exchange.calls.count('fetch_order')}")
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for fill_delay in (0.005, 0.05):
+        await measure('legacy polling (1s sleep)', fill_delay, count, 'legacy')
+        await measure('tracker, stream up', fill_delay, count, 'tracker')
+        await measure('tracker, stream down (adaptive)', fill_delay, count, 'tracker', stream_down=True)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,133 @@
+# File: benchmarks/bench_pipeline.py
+"""完整 main.py 流水线在本地模拟交易所上的压测
+
+每个推送速率启动一个 sim_exchange.py 进程和一个 main.py 进程（SIM_URL 指向模拟交易所，在临时目录里运行，
+日志、SQLite 和交易对缓存都不落在仓库目录），预热后在测量窗口内对比两边的计数，报告：
+- 模拟交易所推送的行情帧数 / 秒，以及 main.py 实际解析的帧数 / 秒（跟不上时推送积压在模拟交易所的发送队列里）
+- tick-to-order 延迟分位数（收到触发行情到发出订单，价差场景默认 spikes，周期性出现套利机会）
+- 事件循环延迟分位数（LatencyTracker.monitor_loop 采样）
+解析速率达到推送速率 95% 以上且发送队列没有积压的最高速率即为可持续的消息速率。
+
+用法: python benchmarks/bench_pipeline.py [速率,速率,...] [--duration 秒] [--symbols BTC/USDT,ETH/USDT]
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def get_json(url):
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return json.load(response)
+
+
+def wait_for(predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if predicate():
+                return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def parsed_frames(metrics):
+    stages = metrics['stages']
+    return sum(stages.get(venue, {}).get('parsed', {}).get('count', 0) for venue in ('binance', 'okx'))
+
+
+def stop(process):
+    if process.poll() is None:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def run_rate(rate, args):
+    sim_port, metrics_port = free_port(), free_port()
+    sim_url = f"http://127.0.0.1:{sim_port}"
+    metrics_url = f"http://127.0.0.1:{metrics_port}/metrics"
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(os.environ, SIM_URL=sim_url, METRICS_PORT=str(metrics_port), SYMBOLS=args.symbols,
+                   JOURNAL_DB=os.path.join(workdir, 'journal.db'), RECON_DB=os.path.join(workdir, 'recon.db'),
+                   MARKET_CACHE_DIR=os.path.join(workdir, 'markets'), RECORD_DIR='')
+        sim = subprocess.Popen([sys.executable, os.path.join(ROOT, 'sim_exchange.py'), '--port', str(sim_port),
+                                '--rate', str(rate), '--scenario', args.scenario, '--latency', str(args.latency),
+                                '--symbols', args.symbols],
+                               cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        bot = None
+        try:
+            if not wait_for(lambda: get_json(f"{sim_url}/sim/stats") is not None, 10):
+                raise RuntimeError('simulated exchange did not start')
+            bot = subprocess.Popen([sys.executable, os.path.join(ROOT, 'main.py')], cwd=workdir, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            if not wait_for(lambda: parsed_frames(get_json(metrics_url)) > 0, 30):
+                raise RuntimeError('main.py did not start receiving market data')
+            time.sleep(args.warmup)
+
+            sim_start, bot_start = get_json(f"{sim_url}/sim/stats"), get_json(metrics_url)
+            start = time.monotonic()
+            time.sleep(args.duration)
+            sim_end, bot_end = get_json(f"{sim_url}/sim/stats"), get_json(metrics_url)
+            elapsed = time.monotonic() - start
+        finally:
+            if bot is not None:
+                stop(bot)
+            stop(sim)
+
+    sent = sum(sim_end['frames'].values()) - sum(sim_start['frames'].values())
+    received = parsed_frames(bot_end) - parsed_frames(bot_start)
+    stages = bot_end['stages']
+    tick_to_order = {venue: stages.get(venue, {}).get('tick_to_order', {'count': 0}) for venue in ('binance', 'okx')}
+    return {'rate': rate, 'sent': sent / elapsed, 'received': received / elapsed, 'backlog': sim_end['backlog'],
+            'orders': sim_end['orders'], 'tick_to_order': tick_to_order,
+            'loop_lag': stages.get('loop', {}).get('lag', {'count': 0})}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='main.py 流水线在本地模拟交易所上的压测')
+    parser.add_argument('rates', nargs='?', default='500,2000,8000', help='每个交易所每秒推送的行情帧数，逗号分隔')
+    parser.add_argument('--duration', type=float, default=20.0, help='测量窗口（秒）')
+    parser.add_argument('--warmup', type=float, default=10.0, help='开始测量前的预热时间（秒）')
+    parser.add_argument('--symbols', default='BTC/USDT,ETH/USDT')
+    parser.add_argument('--scenario', default='spikes')
+    parser.add_argument('--latency', type=float, default=0.005, help='模拟交易所 REST 请求的延迟（秒）')
+    args = parser.parse_args()
+
+    sustained = None
+    print(f"cpus: {os.cpu_count()}, symbols: {args.symbols}, window: {args.duration:.0f}s")
+    for rate in (int(rate) for rate in args.rates.split(',')):
+        report = run_rate(rate, args)
+        lag = report['loop_lag']
+        orders = ', '.join(f"{venue} n={summary['count']} p50={summary.get('p50')}us p99={summary.get('p99')}us"
+                           for venue, summary in report['tick_to_order'].items())
+        print(f"rate {rate}/venue: sent {report['sent']:,.0f} msg/s, parsed {report['received']:,.0f} msg/s, "
+              f"sim backlog {report['backlog']}, orders {report['orders']}")
+        print(f"    tick-to-order: {orders}")
+        print(f"    event-loop lag: p50={lag.get('p50')}us p99={lag.get('p99')}us max={lag.get('max')}us")
+        if report['received'] >= 0.95 * report['sent'] and report['backlog'] < rate:
+            sustained = report['received']
+    print(f"sustained: {sustained:,.0f} msg/s" if sustained else "sustained: none of the tested rates")
+
+
+if __name__ == '__main__':
+    main()
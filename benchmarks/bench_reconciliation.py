@@ -0,0 +1,79 @@
+# File: benchmarks/bench_reconciliation.py
+"""对账任务的吞吐基准
+
+在两个本地模拟交易所上生成一批套利成交（另外混入若干单边成交和手动成交），
+然后对一个新的 SQLite 库跑一轮完整对账（分页拉取、写库、匹配），再模拟重启后跑第二轮，
+确认游标生效、不会重新下载历史。
+
+用法: python benchmarks/bench_reconciliation.py [套利次数]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+from fake_exchange import FakeExchange  # noqa: E402
+from reconciliation import Reconciliation  # noqa: E402
+from trader import LegResult, PairResult  # noqa: E402
+
+SYMBOLS = ['BTC/USDT', 'ETH/USDT']
+
+
+async def generate(exchanges, recon, count, unhedged, manual):
+    for i in range(count):
+        symbol = SYMBOLS[i % len(SYMBOLS)]
+        sell = await exchanges['binance'].create_order(symbol, 'market', 'sell', 0.01)
+        if i < unhedged:
+            buy_leg = LegResult('okx', 'buy', error='rejected')
+            status = 'unhedged'
+        else:
+            buy = await exchanges['okx'].create_order(symbol, 'market', 'buy', 0.01)
+            buy_leg = LegResult('okx', 'buy', buy, filled=True)
+            status = 'filled'
+        recon.record_pair(symbol, PairResult(status, LegResult('binance', 'sell', sell, filled=True), buy_leg))
+    for i in range(manual):
+        await exchanges['okx'].create_order(SYMBOLS[0], 'market', 'buy', 0.02)
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    prices = {'BTC/USDT': (60000.0, 60001.0), 'ETH/USDT': (3000.0, 3000.5)}
+    balances = {'BTC': 1e6, 'ETH': 1e6, 'USDT': 1e12}
+    exchanges = {'binance': FakeExchange('binance', balances, prices),
+                 'okx': FakeExchange('okx', balances, prices, newest_first=True)}
+    Config.RECON_SETTLE_DELAY = -1.0  # 基准里生成的成交立即核对
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'recon.db')
+        recon = Reconciliation(exchanges, symbols=SYMBOLS, path=path)
+        await generate(exchanges, recon, count, unhedged=3, manual=2)
+        fills = sum(len(exchange.trades) for exchange in exchanges.values())
+
+        start = time.perf_counter()
+        report = await recon.run_once()
+        elapsed = time.perf_counter() - start
+        calls = sum(exchange.calls.count('fetch_my_trades') for exchange in exchanges.values())
+        print(f"first run:  {fills} fills, {report['fetched']} fetched in {calls} pages, {report['checked']} pairs, "
+              f"{len(report['unhedged'])} unhedged, {len(report['pnl_drift'])} drift, "
+              f"{len(report['orphaned'])} orphaned in {elapsed:.3f}s")
+        await recon.close()
+
+        # 重启：新的 Reconciliation 从库里的游标继续
+        recon = Reconciliation(exchanges, symbols=SYMBOLS, path=path)
+        for exchange in exchanges.values():
+            exchange.calls.clear()
+        start = time.perf_counter()
+        report = await recon.run_once()
+        elapsed = time.perf_counter() - start
+        calls = sum(exchange.calls.count('fetch_my_trades') for exchange in exchanges.values())
+        print(f"restart:    {report['fetched']} fetched in {calls} pages, {report['checked']} pairs, "
+              f"{len(report['orphaned'])} orphaned in {elapsed:.3f}s")
+        await recon.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
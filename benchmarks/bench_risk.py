@@ -0,0 +1,118 @@
+# File: benchmarks/bench_risk.py
+"""下单前风控检查的开销基准
+
+1. 单独测量 RiskEngine.can_trade（含 open_pair / close_pair）的耗时分布，持仓、库存覆盖 100 个交易对
+2. 测量进程内 tick-to-order 路径（解析 OKX 帧 -> 价格矩阵 -> 决策 -> 风控 -> 发出订单）
+   在有、无风控时的耗时分布。成交使用回放用的 SimulatedTrader，下单不经过网络，
+   这是 tick-to-order 的下限，风控开销相对它的比例是最保守的估计。
+
+用法: python benchmarks/bench_risk.py [次数]
+"""
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from arbitrage import ArbitrageEngine  # noqa: E402
+from data_collector import PriceCollector  # noqa: E402
+from latency import Histogram, LatencyTracker  # noqa: E402
+from price_matrix import Opportunity  # noqa: E402
+from replay import SimulatedTrader  # noqa: E402
+from risk_control import RiskEngine  # noqa: E402
+from trader import LegResult, PairResult  # noqa: E402
+
+SYMBOLS = [f"C{i}/USDT" for i in range(100)]
+
+
+def unlimited_risk():
+    return RiskEngine(max_loss=math.inf, max_symbol_exposure=math.inf, symbol_exposure_limits={},
+                      max_venue_inventory=math.inf, max_open_notional=math.inf)
+
+
+def bench_check(count):
+    risk = unlimited_risk()
+    for i, symbol in enumerate(SYMBOLS):
+        risk.on_fill('binance', symbol, 'sell', 1.0, 100.0 + i)
+        risk.on_fill('okx', symbol, 'buy', 1.0, 99.0 + i)
+    opportunities = [Opportunity(symbol, 'binance', 'okx', 101.0 + i, 100.0 + i, 1.0, 0.001)
+                     for i, symbol in enumerate(SYMBOLS)]
+    order = {'filled': 0.01, 'price': 100.0, 'fee': {'cost': 0.001, 'currency': 'USDT'}}
+    result = PairResult('filled', LegResult('binance', 'sell', order, filled=True),
+                        LegResult('okx', 'buy', order, filled=True))
+
+    check = Histogram()
+    cycle = Histogram()
+    for i in range(count):
+        opportunity = opportunities[i % len(opportunities)]
+        start = time.perf_counter_ns()
+        ok = risk.can_trade(opportunity, 0.01)
+        checked = time.perf_counter_ns()
+        ticket = risk.open_pair(opportunity, 0.01)
+        risk.close_pair(ticket, result)
+        done = time.perf_counter_ns()
+        assert ok
+        check.record(checked - start)
+        cycle.record(done - start)
+    return check.summary(), cycle.summary()
+
+
+def okx_frame(symbol, seq_id, price, action='update'):
+    data = {'bids': [[f"{price:.2f}", '10', '0', '1']], 'asks': [[f"{price + 0.01:.2f}", '10', '0', '1']],
+            'ts': str(int(time.time() * 1000)), 'seqId': seq_id, 'prevSeqId': seq_id - 1 if action == 'update' else -1}
+    return json.dumps({'arg': {'channel': 'books', 'instId': symbol.replace('/', '-')}, 'action': action, 'data': [data]})
+
+
+async def bench_tick_to_order(count, with_risk):
+    trader = SimulatedTrader()
+    latency = LatencyTracker()
+    collector = PriceCollector(trader, symbols=SYMBOLS, venues=['binance', 'okx'], latency=latency)
+    collector.fetch_snapshots = False
+    matrix = collector.matrix
+    # 关闭自适应阈值，让每个 tick 都触发一次套利
+    matrix.min_samples = 1 << 62
+    matrix.entry[:] = -math.inf
+    matrix.exit[:] = math.inf
+    engine = ArbitrageEngine(collector, trader, latency, unlimited_risk() if with_risk else None)
+
+    for i, symbol in enumerate(SYMBOLS):
+        collector.on_binance_snapshot({'symbol': symbol, 'bids': [[200.0 + i, 10.0]], 'asks': [[200.01 + i, 10.0]],
+                                       'nonce': 1})
+        collector.on_okx_frame(okx_frame(symbol, 1, 100.0 + i, 'snapshot'))
+    decision = asyncio.create_task(engine.run())
+    await asyncio.sleep(0)
+
+    seq_ids = [1] * len(SYMBOLS)
+    for i in range(count):
+        row = i % len(SYMBOLS)
+        seq_ids[row] += 1
+        collector.on_okx_frame(okx_frame(SYMBOLS[row], seq_ids[row], 100.0 + row + (i % 7) * 0.01), time.time_ns())
+        # 第一次让出：决策任务运行并创建下单任务；第二次：下单任务运行
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+    decision.cancel()
+    await engine.drain()
+    return latency.histogram('okx', 'tick_to_order').summary(), engine.rejected_count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    check, cycle = bench_check(count)
+    print(f"can_trade:                       p50={check['p50']}ns p99={check['p99']}ns max={check['max']}ns")
+    print(f"can_trade + open/close_pair:     p50={cycle['p50']}ns p99={cycle['p99']}ns max={cycle['max']}ns")
+
+    ticks = min(count, 20000)
+    without, _ = asyncio.run(bench_tick_to_order(ticks, False))
+    with_risk, rejected = asyncio.run(bench_tick_to_order(ticks, True))
+    print(f"tick-to-order without risk:      p50={without['p50']}us p99={without['p99']}us (n={without['count']})")
+    print(f"tick-to-order with risk:         p50={with_risk['p50']}us p99={with_risk['p99']}us "
+          f"(n={with_risk['count']}, rejected={rejected})")
+    print(f"can_trade share of p50 path:     {check['p50'] / 1000 / with_risk['p50'] * 100:.2f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# File: benchmarks/bench_spread_stats.py
+"""价差统计与自适应阈值的逐 tick 开销基准
+
+每个 tick 更新一个交易对在一个交易所的报价，随后对脏行做一次完整的 evaluate（过期检查、
+各方向价差、阈值、环形缓冲区更新），对比不同交易对数量和窗口长度下的单次耗时。
+
+用法: python benchmarks/bench_spread_stats.py [tick 数]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from price_matrix import SymbolMap, PriceMatrix  # noqa: E402
+
+
+def run(symbol_count, window, ticks, batch, seed=7):
+    rng = np.random.default_rng(seed)
+    symbols = [f"C{i}/USDT" for i in range(symbol_count)]
+    matrix = PriceMatrix(SymbolMap(symbols, ['binance', 'okx']), {'binance': 0.001, 'okx': 0.001},
+                         max_age=5.0, window=window, min_samples=10)
+    mids = rng.uniform(1, 1000, symbol_count)
+    now = time.time()
+    for row in range(symbol_count):
+        for col in range(2):
+            matrix.update(row, col, mids[row] * 0.9999, mids[row] * 1.0001, now, now)
+    rows = rng.integers(0, symbol_count, ticks)
+    cols = rng.integers(0, 2, ticks)
+    noise = rng.normal(0, 2e-4, ticks)
+
+    hits = 0
+    start = time.perf_counter()
+    for i in range(ticks):
+        row = rows[i]
+        mid = mids[row] * (1 + noise[i])
+        matrix.update(row, cols[i], mid * 0.9999, mid * 1.0001, now, now)
+        if i % batch == batch - 1:
+            hits += len(matrix.opportunities(now))
+    elapsed = time.perf_counter() - start
+    return elapsed, hits
+
+
+def main():
+    ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    print(f"{'symbols':>8} {'window':>7} {'ticks/eval':>10} {'us/tick':>8} {'us/eval':>8}")
+    for symbol_count in (10, 100, 500):
+        for window in (100, 1000, 10000):
+            for batch in (1, 20):
+                elapsed, _ = run(symbol_count, window, ticks, batch)
+                evaluations = ticks // batch
+                print(f"{symbol_count:>8} {window:>7} {batch:>10} {elapsed / ticks * 1e6:>8.1f} "
+                      f"{elapsed / evaluations * 1e6:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# File: benchmarks/bench_triangular.py
+"""三角套利检测的增量计算基准
+
+N 个货币两两组成交易对（N*(N-1)/2 个交易对，每个交易所 N*(N-1)*(N-2)/3 个三角环），
+随机选一个交易对写入新报价后做一次检测，对比：
+- 增量：只刷新该交易对的两条边，重算经过它们的环（TriangleScanner.evaluate）
+- 全量：每个 tick 把所有报价标记为脏，重算整张图的所有环
+报告每个 tick 的耗时和平均重算的环数。
+
+用法: python benchmarks/bench_triangular.py [货币数,货币数,...] [tick 数]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from price_matrix import PriceMatrix, SymbolMap  # noqa: E402
+from triangular import TriangleScanner  # noqa: E402
+
+VENUES = ['binance', 'okx']
+FEES = {'binance': 0.001, 'okx': 0.001}
+
+
+def build(currencies):
+    names = [f"C{i}" for i in range(currencies)]
+    prices = {name: 1.0 + i for i, name in enumerate(names)}
+    symbols = [f"{base}/{quote}" for i, base in enumerate(names) for quote in names[i + 1:]]
+    matrix = PriceMatrix(SymbolMap(symbols, VENUES), FEES)
+    scanner = TriangleScanner(matrix, FEES, min_edge=0.001)
+    now = time.time()
+    for row, symbol in enumerate(symbols):
+        base, quote = symbol.split('/')
+        mid = prices[base] / prices[quote]
+        for col in range(len(VENUES)):
+            matrix.update(row, col, mid * 0.9999, mid * 1.0001, now, now)
+            scanner.mark(row, col)
+    scanner.evaluate(now)
+    return matrix, scanner, symbols
+
+
+def bench(currencies, ticks, full):
+    matrix, scanner, symbols = build(currencies)
+    rng = random.Random(1)
+    updates = []
+    for _ in range(ticks):
+        row, col = rng.randrange(len(symbols)), rng.randrange(len(VENUES))
+        mid = (matrix.bids[row, col] + matrix.asks[row, col]) / 2 * (1 + rng.gauss(0, 1e-4))
+        updates.append((row, col, mid * 0.9999, mid * 1.0001))
+    now = time.time()
+    evaluated = scanner.evaluated
+    start = time.perf_counter()
+    for row, col, bid, ask in updates:
+        matrix.update(row, col, bid, ask, now, now)
+        if full:
+            scanner.dirty[:] = True
+        else:
+            scanner.mark(row, col)
+        scanner.opportunities(now)
+    elapsed = time.perf_counter() - start
+    return len(symbols), len(scanner), elapsed / ticks * 1e6, (scanner.evaluated - evaluated) / ticks
+
+
+def main():
+    sizes = [int(n) for n in sys.argv[1].split(',')] if len(sys.argv) > 1 else [10, 20, 30, 40]
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    print(f"venues: {len(VENUES)}, ticks: {ticks}")
+    for currencies in sizes:
+        symbols, cycles, incremental, touched = bench(currencies, ticks, full=False)
+        _, _, full, _ = bench(currencies, ticks, full=True)
+        print(f"{currencies:>3} currencies, {symbols:>4} symbols, {cycles:>6} cycles: "
+              f"incremental {incremental:8.1f} us/tick ({touched:.0f} cycles), "
+              f"full rescan {full:9.1f} us/tick ({cycles} cycles), {full / incremental:6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -15,23 +15,140 @@ class Config:
     # 交易参数
     SYMBOL = 'BTC/USDT'
     QUANTITY = 0.001  # 每次交易数量
-    SPREAD_THRESHOLD = 10.0  # 触发套利的价差阈值
-    MAX_SLIPPAGE = 10.0  # 最大允许滑点
+    # 监控的交易对（ccxt 统一格式，逗号分隔），默认只监控 SYMBOL
+    SYMBOLS = [s.strip() for s in os.getenv('SYMBOLS', SYMBOL).split(',') if s.strip()]
+    VENUES = ['binance', 'okx']
+    ORDER_QUANTITIES = {SYMBOL: QUANTITY}  # 各交易对的下单数量，未配置的使用 QUANTITY
+    MAX_SLIPPAGE_BPS = 10.0  # 成交均价相对预计成交价的最大允许滑点（两条腿合计，基点）
+
+    TAKER_FEES = {'binance': 0.001, 'okx': 0.001}  # 各交易所 taker 费率，交易对信息里没有费率时使用
+    MARKET_TABLE_REFRESH = 3600.0  # 账户费率档位和交易规则表（步长、最小数量 / 金额）的刷新间隔（秒）
+
+    # 价差统计与自适应阈值（价差为对数价差：log(卖出价 / 买入价)，小价差时约等于 卖出价 / 买入价 - 1）
+    SPREAD_WINDOW = 1000  # 每个交易对每个方向的滚动窗口样本数
+    SPREAD_EWMA_ALPHA = 0.01  # 价差 EWMA 的平滑系数
+    SPREAD_MIN_SAMPLES = 100  # 样本数不足时不入场
+    SPREAD_ENTRY_Z = 3.0  # 价差高于 EWMA 多少个标准差时入场
+    SPREAD_EXIT_Z = 1.0  # 价差回落到 EWMA + 该倍数标准差以下后，该方向才能再次入场
+    MIN_NET_EDGE = 0.0005  # 扣除双边 taker 手续费后的最小收益（对数价差，直接加在手续费下限上）
+    MAX_QUOTE_AGE = 5.0  # 报价的最大年龄（秒），超过后视为缺失
+    # 单交易所三角套利（SYMBOLS 中的交易对构成三角环时才生效，如 BTC/USDT,ETH/USDT,ETH/BTC）
+    TRIANGULAR_ENABLED = os.getenv('TRIANGULAR', '1') == '1'
+    TRIANGULAR_MIN_EDGE = 0.001  # 三次兑换扣除 taker 手续费后的最小相对收益
+    TRIANGULAR_START = ['USDT', 'USDC', 'BTC', 'ETH']  # 三角环优先从这些货币出发（按顺序），第一条腿按该交易对的下单数量
+
+    # 风控配置（金额均以 RISK_CURRENCY 计；计价币种不是它的交易对按 计价币种/RISK_CURRENCY 的最新标记价折算，
+    # 没有标记价时拒绝下单）
+    RISK_CURRENCY = 'USDT'
+    RISK_MAX_LOSS = 100.0  # 已实现 + 未实现亏损达到该值时触发总开关，停止新的套利
+    RISK_MAX_SYMBOL_EXPOSURE = 1000.0  # 单个交易对的净敞口上限，按任一条腿失败时的最坏情况检查
+    RISK_SYMBOL_EXPOSURE_LIMITS = {}  # 各交易对单独的净敞口上限
+    RISK_MAX_VENUE_INVENTORY = 5000.0  # 单个交易所单个交易对相对启动时的库存变化上限
+    RISK_MAX_OPEN_NOTIONAL = 2000.0  # 单个交易所未完成订单的名义金额上限
+    RISK_MAX_CONSECUTIVE_FAILURES = 3  # 同一交易所连续失败的腿数达到该值时熔断
+    RISK_BREAKER_COOLDOWN = 60.0  # 熔断持续时间（秒）
+
+    # 库存再平衡配置（position_manager.py）
+    REBALANCE_BANDS = {'BTC': (0.3, 0.7), 'USDT': (0.3, 0.7)}  # 各币种在单个交易所的持有量占所有交易所合计的比例区间，越界时调回平均份额
+    REBALANCE_MIN_TRANSFER = {'BTC': 0.001, 'USDT': 50.0}  # 小于该数量的划转不执行
+    REBALANCE_NETWORKS = {'BTC': 'BTC', 'USDT': 'TRC20'}  # 提币使用的链
+    REBALANCE_FUNDING_ACCOUNTS = {'okx': ('trading', 'funding')}  # 提币 / 充值走资金账户的交易所：(交易账户, 资金账户)
+    REBALANCE_ARRIVAL_SLACK = 1e-6  # 到账数量与（提币数量 - 提币手续费）之间允许的相对误差（链上精度取整）
+    REBALANCE_CHECK_INTERVAL = 5.0  # 用本地余额账本检查是否越界的间隔（秒）
+    REBALANCE_INTERVAL = 3600.0  # 定时再平衡的间隔（秒）
+    REBALANCE_MIN_TRIGGER_INTERVAL = 300.0  # 越界提前触发与上一轮再平衡之间的最小间隔（秒），计划无法消除越界时避免反复拉余额
+    REBALANCE_TRANSFER_TIMEOUT = 3600.0  # 在途划转超过该时间仍未到账时告警（秒）
+    REBALANCE_DRY_RUN = os.getenv('REBALANCE_DRY_RUN', '1') == '1'  # 只记录划转计划，不实际提币
+
+    # 套利日志配置（journal.py）
+    JOURNAL_DB = os.getenv('JOURNAL_DB', 'journal.db')  # 机会、订单和成交的 SQLite 日志
+    JOURNAL_QUEUE_SIZE = 100000  # 待写入队列长度，满了之后丢弃新记录
+    JOURNAL_BATCH_SIZE = 1000  # 每个事务最多写入的记录数
+    JOURNAL_FLUSH_INTERVAL = 0.5  # 一批记录最多等待多久后写入（秒），也是崩溃时最多丢失的时间窗口
+
+    # 对账配置（reconciliation.py）
+    RECON_DB = os.getenv('RECON_DB', 'reconciliation.db')  # 成交、拉取游标和套利记录的本地 SQLite 库
+    RECON_INTERVAL = 300.0  # 对账间隔（秒）
+    RECON_PAGE_LIMITS = {'binance': 1000, 'okx': 100}  # fetch_my_trades 每页条数（各交易所的上限）
+    # 带 since 查询时返回窗口内最新一页（从新到旧）的交易所，按 billId 往回翻页（OKX fills-history 不接受 since 加 limit）
+    RECON_NEWEST_FIRST = ('okx',)
+    RECON_START_LOOKBACK = 86400.0  # 没有游标时从多久以前开始拉取成交（秒）
+    RECON_SETTLE_DELAY = 60.0  # 套利结束多久后才核对，等交易所成交记录落地（秒）
+    RECON_QTY_TOLERANCE = 1e-6  # 两条腿成交数量的相对误差容忍度
+    RECON_PNL_TOLERANCE = 0.01  # 成交记录算出的盈亏与下单回报的偏差容忍度（计价币种）
+
+    # 启动预热配置（warmup.py）
+    MARKET_CACHE_DIR = os.getenv('MARKET_CACHE_DIR', '.market_cache')  # 交易对信息的本地缓存目录
+    MARKET_CACHE_TTL = 6 * 3600  # 交易对缓存的有效期（秒），过期后先用旧缓存，后台刷新
+    HTTP_POOL_SIZE = 2  # 每个交易所预先建立并保持的 HTTP 连接数
+    HTTP_KEEPALIVE_INTERVAL = 10.0  # 保活请求的间隔（秒），需小于 aiohttp 的空闲连接超时（15 秒）
+    CLOCK_SYNC_INTERVAL = 300.0  # 重新测量时钟偏差的间隔（秒）
+    CLOCK_OFFSET_WARN = 1000  # 与交易所的时钟偏差超过该值时告警（毫秒）
+
+    # 余额账本配置
+    BALANCE_RESYNC_INTERVAL = 30  # 与交易所 REST 余额对账的间隔（秒）
+    BALANCE_DRIFT_TOLERANCE = 0.001  # 本地账本与交易所余额的相对偏差超过该值时告警
+    BALANCE_DRIFT_MIN_ABS = {'BTC': 1e-5, 'ETH': 1e-4, 'USDT': 1.0, 'USDC': 1.0}  # 各币种绝对偏差低于该值时不告警（灰尘余额），未列出的币种为 0
+    USE_PRIVATE_STREAMS = True  # 优先使用交易所私有 websocket 推送余额/订单
+
+    # 订单状态跟踪配置（私有推送断开时的 REST 轮询参数）
+    ORDER_DEADLINE = 10.0  # 等待订单终态的截止时间（秒）
+    ORDER_POLL_FIRST = 0.05  # 首次轮询间隔（秒）
+    ORDER_POLL_MAX = 1.0  # 退避后的最大轮询间隔（秒）
+    ORDER_STREAM_GRACE = 2.0  # 推送在线但迟迟没有结果时，转为轮询前的等待时间（秒）
 
     # WebSocket配置
     #  BINANCE_WS_URL = 'wss://testnet.binance.vision/ws/btcusdt@ticker'  # 使用测试网的WebSocket URL
     BINANCE_WS_URL = 'wss://testnet.binance.vision/ws'  # 使用测试网的WebSocket URL
     OKX_WS_URL = 'wss://ws.okx.com:8443/ws/v5/public'  # OKX的WebSocket URL（模拟账户）
+    WS_MAX_STREAMS_PER_CONNECTION = {'binance': 200, 'okx': 100}  # 单条连接订阅的交易对上限，超过后分到多条连接
+    WS_PING_INTERVAL = 20.0  # 协议层 ping 间隔，也是等待 pong 的超时（秒）
+    WS_HEARTBEATS = {'okx': 'ping'}  # 需要应用层心跳的交易所及其心跳消息
+    WS_HEARTBEAT_INTERVAL = 15.0  # 连接空闲多久后发送应用层心跳（秒）
+    WS_STALE_TIMEOUT = 30.0  # 超过该时间没有收到任何帧，视为连接假死并重连（秒）
+    WS_RECONNECT_BASE = 0.5  # 重连退避的初始间隔（秒），每次失败翻倍并加随机抖动
+    WS_RECONNECT_MAX = 30.0  # 重连退避的最大间隔（秒）
+    OKX_RESYNC_INTERVAL = 1.0  # 同一交易对两次重新订阅之间的最小间隔（秒）
+    BINANCE_BOOK_BUFFER = 1000  # 等待快照期间每个交易对最多缓存的增量消息数（100ms 一条约 100 秒），超过后清空缓存并重新订阅
+    FEED_SHARDS = int(os.getenv('FEED_SHARDS', 0))  # 行情解析的工作进程数，0 表示在主进程内解析（单进程）
+
+    # 本地模拟交易所配置（python sim_exchange.py 启动；设置 SIM_URL 后 main.py 的行情和下单都连到模拟交易所）
+    SIM_URL = os.getenv('SIM_URL')  # 例如 http://127.0.0.1:18080
+    SIM_PORT = int(os.getenv('SIM_PORT', 18080))
+    SIM_RATE = int(os.getenv('SIM_RATE', 1000))  # 每个交易所每秒推送的行情帧数
+    SIM_SCENARIO = os.getenv('SIM_SCENARIO', 'spikes')  # 价差场景，见 sim_exchange.SCENARIOS
+    SIM_NOISE_BPS = 2.0  # 两个交易所中间价各自的随机偏差（基点）
+    SIM_LATENCY = float(os.getenv('SIM_LATENCY', 0.005))  # REST 请求的固定延迟（秒）
+    SIM_JITTER = float(os.getenv('SIM_JITTER', 0.005))  # REST 请求的随机附加延迟上限（秒）
+    SIM_FAIL_RATE = float(os.getenv('SIM_FAIL_RATE', 0.0))  # 下单请求返回 503 的概率
+    SIM_BALANCE = 100000.0  # 每个币种的初始资金（按计价币种折算）
 
     # 日志配置
     LOG_FILE = 'arbitrage.log'
+    LOG_ASYNC = True  # 日志经队列由后台线程写入，行情处理路径上不做磁盘/终端 I/O
+    LOG_TICK_INTERVAL = 1.0  # 逐 tick 日志（如套利机会）同一交易对的最小输出间隔（秒）
+    STRUCTURED_LOG_FILE = os.getenv('STRUCTURED_LOG_FILE')  # 设置后额外输出一份 JSON 行格式的日志
+
+    # 延迟统计配置
+    METRICS_PORT = int(os.getenv('METRICS_PORT', 9108))  # 本地指标接口端口，0 表示关闭
+    LATENCY_DUMP_FILE = 'latency.json'  # 退出时写出的延迟统计
+    LOOP_LAG_INTERVAL = 0.01  # 事件循环延迟的采样间隔（秒）
+
+    # 行情录制配置（设置 RECORD_DIR 后记录所有原始帧，可用 replay.py 回放）
+    RECORD_DIR = os.getenv('RECORD_DIR')
+    RECORD_MAX_BYTES = int(os.getenv('RECORD_MAX_BYTES', 256 * 1024 * 1024))  # 单个文件的滚动大小
 
     # 邮件通知配置
     SMTP_SERVER = os.getenv('SMTP_SERVER')
     SMTP_PORT = int(os.getenv('SMTP_PORT', 587))
+    SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', '1') == '1'  # 本地测试用的 SMTP 服务可以关闭 STARTTLS
     EMAIL = os.getenv('EMAIL')
     EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD')
     ALERT_RECIPIENTS = os.getenv('ALERT_RECIPIENTS', '').split(',')
     # Telegram通知配置
     TELEGRAM_BOT_API_TOKEN = os.getenv('TELEGRAM_BOT_API_TOKEN')
-    TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
\ No newline at end of file
+    TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
+    # 通知服务配置
+    NOTIFY_QUEUE_SIZE = 1000  # 通知队列长度，满了之后丢弃新通知
+    NOTIFY_DIGEST_WINDOW = 5.0  # 通知进入队列后等待合并的时间（秒）
+    NOTIFY_MIN_INTERVALS = {'email': 60.0, 'telegram': 1.0}  # 每个通道两次发送的最小间隔（秒）
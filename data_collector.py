@@ -1,120 +1,255 @@
 # File: data_collector.py
 import asyncio
 import json
-import websockets
 import logging
-from config import Config
 import time
+from functools import partial
+import numpy as np
+from config import Config
+from order_book import OrderBook, BinanceBookSync, OkxBookSync
+from price_matrix import SymbolMap, PriceMatrix
+from triangular import TriangleScanner
+from ws_manager import FeedSupervisor
 
 logger = logging.getLogger(__name__)
 
 class PriceCollector:
-    def __init__(self, arbitrage_engine, trader):
-        self.arbitrage_engine = arbitrage_engine  # 保存传入的 arbitrage_engine 实例
-        self.trader = trader  # 保存传入的 trader 实例
-        self.prices = {
-            'binance': None,
-            'okx': None
+    """行情接收：只负责解析帧、维护订单簿，并把最新报价写入价格矩阵
+
+    价格矩阵的每个格子就是一个最新值槽位：新报价直接覆盖旧报价并标记脏行，
+    决策任务（ArbitrageEngine.run）被 updated 事件唤醒后一次性处理所有脏行，
+    负载高时中间的 tick 自然被合并掉，不会积压。
+    """
+
+    def __init__(self, trader, symbols=None, venues=None, recorder=None, latency=None):
+        self.trader = trader  # 保存传入的 trader 实例（用于拉取深度快照）
+        self.recorder = recorder  # 可选的 FrameRecorder，记录原始帧用于回放
+        self.latency = latency  # 可选的 LatencyTracker
+        self.fetch_snapshots = True  # 回放时关闭，快照从录制文件读取
+        # 交易对命名在启动时统一映射好，收到消息时只查一次 dict
+        self.symbol_map = SymbolMap(symbols or Config.SYMBOLS, venues or Config.VENUES)
+        self.matrix = self.build_matrix()
+        self.triangles = self.build_triangles()  # 交易对构成三角环时的单交易所三角套利检测
+        self.clock = time.time  # 判断报价是否过期用的墙钟，回放时替换为录制时间
+        self.quantities = [Config.ORDER_QUANTITIES.get(symbol, Config.QUANTITY) for symbol in self.symbol_map.symbols]
+        # 每个交易所、每个交易对维护一份增量更新的 L2 订单簿，用可成交的 VWAP 代替最新成交价
+        self.books = {
+            venue: [OrderBook(venue, symbol) for symbol in self.symbol_map.symbols]
+            for venue in self.symbol_map.venues
         }
-        self.lock = asyncio.Lock()
-        self.last_okx_time = time.time()
+        self.binance_syncs = [BinanceBookSync(book) for book in self.books.get('binance', [])]
+        self.okx_syncs = [OkxBookSync(book) for book in self.books.get('okx', [])]
+        self.snapshot_tasks = {}
+        self.okx_resync_times = [0.0] * len(self.okx_syncs)  # 上次请求重新订阅的时间，避免重复请求
+        self.feeds = []  # 每个交易所一个 FeedSupervisor，run() 时创建
+        self.updated = asyncio.Event()  # 有新报价写入矩阵时置位，唤醒决策任务
+        self.tick_count = 0  # 写入矩阵的报价次数
+        # 每个报价的本地接收 / 解析完成时间（perf_counter_ns），用于追踪从行情到下单的延迟
+        shape = (len(self.symbol_map.symbols), len(self.symbol_map.venues))
+        self.received_ns = np.zeros(shape, dtype=np.int64)
+        self.parsed_ns = np.zeros(shape, dtype=np.int64)
 
-    async def binance_ws(self):
-        try:
-            async with websockets.connect(Config.BINANCE_WS_URL) as ws:
-                logger.info("Connected to Binance WebSocket...")
-                subscribe_message = {
-                    "method": "SUBSCRIBE",
-                    "params": [
-                        "btcusdt@ticker"
-                    ],
-                    "id": 1
-                }
-                await ws.send(json.dumps(subscribe_message))
-                while True:
-                    try:
-                        msg = await ws.recv()
-                        msg = json.loads(msg)
-                        if 's' in msg and msg['s'] == 'BTCUSDT' and 'c' in msg:
-                            price = float(msg['c'])
-                            async with self.lock:
-                                self.prices['binance'] = price
-                            logger.info(f"Binance BTC Price: {price}")
-                            self.check_arbitrage_opportunity()  # 检查是否有套利机会
-                    except Exception as e:
-                        logger.error(f"Error in Binance WebSocket: {e}")
-        except Exception as e:
-            logger.error(f"Error in connecting to Binance WebSocket: {e}")
+    def build_matrix(self):
+        return PriceMatrix(self.symbol_map, Config.TAKER_FEES, Config.MAX_QUOTE_AGE, Config.SPREAD_WINDOW,
+                           Config.SPREAD_EWMA_ALPHA, Config.SPREAD_MIN_SAMPLES, Config.SPREAD_ENTRY_Z,
+                           Config.SPREAD_EXIT_Z, Config.MIN_NET_EDGE)
+
+    def build_triangles(self):
+        """交易对能构成三角环时建三角套利检测，否则返回 None，行情路径上没有额外开销"""
+        if self.matrix is None or not Config.TRIANGULAR_ENABLED:
+            return None
+        scanner = TriangleScanner(self.matrix, Config.TAKER_FEES, Config.TRIANGULAR_MIN_EDGE, Config.MAX_QUOTE_AGE,
+                                  Config.TRIANGULAR_START)
+        if not len(scanner):
+            return None
+        logger.info("Triangular detection on %d cycles", len(scanner))
+        return scanner
+
+    def apply_tables(self, tables):
+        """MarketTables 建好或刷新后，按各交易对各交易所的实际 taker 费率重算价差和三角环的手续费"""
+        if self.matrix is not None:
+            self.matrix.set_fees(tables.taker)
+        if self.triangles is not None:
+            self.triangles.set_fees(tables.taker)
+
+    def binance_feed(self, rows=None):
+        """Binance 行情连接：每条连接用一个 SUBSCRIBE 订阅一组交易对的增量深度流，rows 默认为全部交易对"""
+        natives = self.symbol_map.natives('binance')
+
+        def subscribe(rows):
+            params = [f"{natives[row].lower()}@depth@100ms" for row in rows]
+            return [json.dumps({"method": "SUBSCRIBE", "params": params, "id": 1})]
+
+        rows = list(range(len(natives))) if rows is None else rows
+        return FeedSupervisor('binance', Config.BINANCE_WS_URL, rows, subscribe,
+                              self._binance_ws_frame, on_down=partial(self.on_feed_down, 'binance'))
+
+    def _binance_ws_frame(self, frame, received_wall_ns):
+        if self.recorder is not None:
+            self.recorder.record('binance', frame, received_wall_ns)
+        resync = self.on_binance_frame(frame, received_wall_ns)
+        if resync is not None:
+            # 等快照时缓存溢出，重新订阅该交易对的增量流
+            params = [f"{resync.lower()}@depth@100ms"]
+            return [json.dumps({"method": "UNSUBSCRIBE", "params": params, "id": 2}),
+                    json.dumps({"method": "SUBSCRIBE", "params": params, "id": 3})]
+        return None
+
+    def on_binance_frame(self, frame, received_wall_ns=None):
+        """处理一帧 Binance 原始消息（实时接收和回放共用），缓存溢出时返回需要重新订阅的交易对"""
+        received_ns = time.perf_counter_ns()
+        msg = json.loads(frame)
+        if msg.get('e') != 'depthUpdate':
+            return None
+        row = self.symbol_map.by_native['binance'].get(msg.get('s'))
+        if row is None:
+            return None
+        sync = self.binance_syncs[row]
+        if not sync.on_diff(msg) or not sync.book.synced:
+            self.update_quote('binance', row)  # 订单簿不可用，作废矩阵中的旧报价
+            self.request_binance_snapshot(row)  # 尚未同步或序号断开，（重新）拉快照
+            if sync.overflowed:
+                sync.overflowed = False
+                return msg['s']
+            return None
+        self.update_quote('binance', row, msg.get('E', 0), received_wall_ns or time.time_ns(), received_ns)
+
+    def request_binance_snapshot(self, row):
+        if not self.fetch_snapshots:
+            return  # 回放时快照来自录制文件
+        task = self.snapshot_tasks.get(row)
+        if task is None or task.done():
+            self.snapshot_tasks[row] = asyncio.create_task(self.load_binance_snapshot(row))
 
-    async def okx_ws(self):
+    async def load_binance_snapshot(self, row):
+        """拉取 REST 深度快照，用 lastUpdateId 与增量流对齐"""
+        symbol = self.symbol_map.symbols[row]
         try:
-            async with websockets.connect(Config.OKX_WS_URL) as ws:
-                logger.info("Connected to OKX WebSocket...")
-                subscribe_message = {
-                    "op": "subscribe",
-                    "args": [
-                        {
-                            "channel": "tickers",
-                            "instId": "BTC-USDT"
-                        }
-                    ]
-                }
-                await ws.send(json.dumps(subscribe_message))
-                while True:
-                    try:
-                        msg = await ws.recv()
-                        msg = json.loads(msg)
-                        if 'data' in msg and isinstance(msg['data'], list):
-                            for data in msg['data']:
-                                if 'last' in data:
-                                    price = float(data['last'])
-                                    async with self.lock:
-                                        self.prices['okx'] = price
-                                    
-                                    current_time = time.time()
-                                    if current_time - self.last_okx_time >= 5:
-                                        self.last_okx_time = current_time
-                                        logger.info(f"OKX BTC Price: {price}")
-                                        self.check_arbitrage_opportunity()  # 检查是否有套利机会
-
-                    except Exception as e:
-                        logger.error(f"Error in OKX WebSocket: {e}")
+            snapshot = await self.trader.exchanges['binance'].fetch_order_book(symbol, 1000)
+            snapshot = {'symbol': symbol, 'bids': snapshot['bids'], 'asks': snapshot['asks'], 'nonce': snapshot['nonce']}
+            if self.recorder is not None:
+                self.recorder.record('binance_snapshot', json.dumps(snapshot))
+            self.on_binance_snapshot(snapshot)
         except Exception as e:
-            logger.error(f"Error in connecting to OKX WebSocket: {e}")
-
-    def check_arbitrage_opportunity(self):
-        binance_price = self.prices.get('binance')
-        okx_price = self.prices.get('okx')
-        
-        if binance_price is not None and okx_price is not None:
-            spread = abs(binance_price - okx_price)
-            logger.info(f"当前价格差值为 {spread:.2f}")
-
-            if spread > Config.SPREAD_THRESHOLD:
-                logger.info(f"当前价格差值为 {spread:.2f} > {Config.SPREAD_THRESHOLD}，适合套利")
-                
-                # 调用 Trader 的 execute_pair 方法执行套利交易
-                self.execute_arbitrage_trade(binance_price, okx_price)
+            logger.error(f"Failed to load Binance {symbol} order book snapshot: {e}")
+
+    def on_binance_snapshot(self, snapshot):
+        row = self.symbol_map.row.get(snapshot['symbol'])
+        if row is None:
+            return
+        if self.binance_syncs[row].on_snapshot(snapshot['bids'], snapshot['asks'], snapshot['nonce']):
+            logger.info(f"Binance {snapshot['symbol']} order book synced at update id {snapshot['nonce']}")
+            # 快照没有事件时间，按加载时刻计算报价年龄
+            self.update_quote('binance', row, received_wall_ns=int(self.clock() * 1e9))
+
+    def okx_feed(self, rows=None):
+        """OKX 行情连接：每条连接用一个多 args 的 subscribe 订阅一组交易对的 books 频道，rows 默认为全部交易对"""
+        natives = self.symbol_map.natives('okx')
+
+        def subscribe(rows):
+            args = [{"channel": "books", "instId": natives[row]} for row in rows]
+            return [json.dumps({"op": "subscribe", "args": args})]
+
+        rows = list(range(len(natives))) if rows is None else rows
+        return FeedSupervisor('okx', Config.OKX_WS_URL, rows, subscribe,
+                              self._okx_ws_frame, on_down=partial(self.on_feed_down, 'okx'),
+                              heartbeat=Config.WS_HEARTBEATS.get('okx'))
+
+    def _okx_ws_frame(self, frame, received_wall_ns):
+        if self.recorder is not None:
+            self.recorder.record('okx', frame, received_wall_ns)
+        resync = self.on_okx_frame(frame, received_wall_ns)
+        if resync is not None:
+            # 序号断开，重新订阅该交易对以获取新的快照
+            arg = [{"channel": "books", "instId": resync}]
+            return [json.dumps({"op": "unsubscribe", "args": arg}), json.dumps({"op": "subscribe", "args": arg})]
+        return None
+
+    def on_okx_frame(self, frame, received_wall_ns=None):
+        """处理一帧 OKX 原始消息，序号断开时返回需要重新订阅的 instId"""
+        received_ns = time.perf_counter_ns()
+        msg = json.loads(frame)
+        data_list = msg.get('data')
+        if not isinstance(data_list, list):
+            return None
+        inst_id = msg.get('arg', {}).get('instId')
+        row = self.symbol_map.by_native['okx'].get(inst_id)
+        if row is None:
+            return None
+        sync = self.okx_syncs[row]
+        action = msg.get('action')
+        resync = None
+        event_ms = 0
+        for data in data_list:
+            if not sync.on_message(action, data):
+                resync = inst_id
+                break
+            event_ms = int(data.get('ts', 0))
+        if action == 'update' and sync.seq_id is None:
+            resync = inst_id  # 只有增量没有快照（快照丢失），同样需要重新订阅
+        if resync is not None:
+            now = time.monotonic()
+            if now - self.okx_resync_times[row] < Config.OKX_RESYNC_INTERVAL:
+                resync = None
             else:
-                logger.info(f"当前价格差值为 {spread:.2f} < {Config.SPREAD_THRESHOLD}，不适合套利")
-
-    def execute_arbitrage_trade(self, binance_price, okx_price):
-        # 调用 Trader 类的 execute_pair 方法来执行交易
-        # sell_ex 和 buy_ex 可以根据价格决定，假设是卖出 binance，买入 okx
-        sell_ex = 'binance'
-        buy_ex = 'okx'
-        
-        # 调用 execute_pair 来执行套利交易
-        trade_successful = self.trader.execute_pair(sell_ex, buy_ex)
-        
-        if trade_successful:
-            logger.info("Arbitrage trade executed successfully.")
-        else:
-            logger.error("Arbitrage trade failed.")
-    
+                self.okx_resync_times[row] = now
+        self.update_quote('okx', row, event_ms, received_wall_ns or time.time_ns(), received_ns)
+        return resync
+
+    def on_feed_down(self, venue, rows):
+        """连接断开：作废这些交易对的订单簿和矩阵中的报价，重连后从新快照开始"""
+        syncs = self.binance_syncs if venue == 'binance' else self.okx_syncs
+        col = self.symbol_map.col[venue]
+        for row in rows:
+            syncs[row].invalidate()
+            self.matrix.invalidate(col, row)
+            if self.triangles is not None:
+                self.triangles.mark(row, col)
+        logger.warning("%s feed down, invalidated %d quotes", venue, len(rows))
+        self.updated.set()
+
+    def update_quote(self, venue, row, event_ms=0, received_wall_ns=0, received_ns=0):
+        """把订单簿按下单数量计算的 (卖出均价, 买入均价) 写入价格矩阵，并唤醒决策任务
+
+        event_ms 为交易所事件时间，received_wall_ns / received_ns 为本地收到该帧的墙钟 / 单调时间。
+        """
+        book = self.books[venue][row]
+        quantity = self.quantities[row]
+        col = self.symbol_map.col[venue]
+        self.matrix.update(row, col, book.sell_vwap(quantity), book.buy_vwap(quantity),
+                           event_ms / 1000.0, received_wall_ns / 1e9)
+        if self.triangles is not None:
+            self.triangles.mark(row, col)
+        if received_ns:
+            parsed_ns = time.perf_counter_ns()
+            self.received_ns[row, col] = received_ns
+            self.parsed_ns[row, col] = parsed_ns
+            if self.latency is not None:
+                self.latency.on_frame(venue, event_ms, received_wall_ns, received_ns, parsed_ns)
+        self.tick_count += 1
+        self.updated.set()
+
+    async def wait_for_update(self):
+        """等待下一次报价更新；等待期间到达的多次更新只唤醒一次"""
+        await self.updated.wait()
+        self.updated.clear()
+
+    def scan(self):
+        """对有更新的交易对做向量化价差计算，返回超过阈值的 Opportunity 列表"""
+        return self.matrix.opportunities(self.clock())
+
+    def scan_triangles(self):
+        """只重算经过有更新报价的三角环，返回超过阈值的 TriangleOpportunity 列表"""
+        if self.triangles is None:
+            return []
+        return self.triangles.opportunities(self.clock())
+
     async def run(self):
         logger.info("PriceCollector is running...")
-        await asyncio.gather(
-            self.binance_ws(),
-            self.okx_ws()
-        )
+        feeds = {'binance': self.binance_feed, 'okx': self.okx_feed}
+        self.feeds = [feeds[venue]() for venue in self.symbol_map.venues if venue in feeds]
+        await asyncio.gather(*(feed.run() for feed in self.feeds))
+
+    def stop(self):
+        for feed in self.feeds:
+            feed.stop()
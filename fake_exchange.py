@@ -0,0 +1,248 @@
+# File: fake_exchange.py
+import asyncio
+import itertools
+import time
+
+import ccxt
+
+
+class FakeExchange:
+    """本地模拟的交易所，实现 Trader 用到的 ccxt 异步接口子集
+
+    用于在没有网络、不碰测试网的情况下验证余额账本、下单流程等逻辑。
+    市价单按当前 bid/ask 全部成交，手续费以计价币种扣除。设置 fill_delay 时订单先返回 open，
+    延迟后才成交；order_stream=True 时提供模拟的 watch_orders 私有推送。
+    newest_first=True 时 fetch_my_trades 按 OKX fills-history 的方式返回：带 since 时忽略 limit，
+    返回窗口内最新的 100 笔，从新到旧，可以用 params['after']（billId）往回翻页。
+    """
+
+    def __init__(self, name, balances=None, prices=None, fee_rate=0.001, latency=0.0,
+                 fill_delay=None, order_stream=False, deposit_delay=0.0, funding_account=False, newest_first=False,
+                 withdraw_fees=None):
+        self.id = name
+        self.has = {'watchBalance': False, 'watchOrders': order_stream, 'fetchDepositWithdrawFees': True}
+        self.fill_delay = fill_delay
+        self.order_updates = asyncio.Queue()
+        self.stream_down = False
+        self.balances = dict(balances or {})
+        self.prices = dict(prices or {})  # symbol -> (bid, ask)
+        self.fee_rate = fee_rate
+        self.latency = latency
+        self.orders = {}
+        self.failures = []
+        self.ids = itertools.count(1)
+        self.nonce = itertools.count(1)
+        self.calls = []  # 记录调用过的接口，便于统计 REST 请求次数
+        # 提币 / 充值：充值在 deposit_delay 秒后到账；funding_account=True 时充值先进入资金账户，
+        # 提币也从资金账户扣除，需要用 transfer 在交易账户和资金账户之间划转（模拟 OKX）
+        self.deposit_delay = deposit_delay
+        self.funding_account = funding_account
+        self.funding = {}
+        self.withdraw_fees = dict(withdraw_fees or {})  # 币种 -> 固定提币手续费，从到账数量中扣除
+        self.network = {}  # 交易所名 -> FakeExchange，由 link_exchanges 设置，充值地址为 '<交易所名>:<币种>'
+        self.deposits = []
+        self.withdrawals = []
+        self.trades = []  # 成交记录，按时间顺序，供 fetch_my_trades 查询
+        self.newest_first = newest_first
+
+    # ---- 测试辅助 ----
+
+    def set_price(self, symbol, bid, ask):
+        self.prices[symbol] = (bid, ask)
+
+    def fail_next(self, error=None):
+        """让下一次下单失败"""
+        self.failures.append(error or ccxt.ExchangeError(f"{self.id}: order rejected"))
+
+    def set_stream_down(self, down):
+        """模拟私有推送断开 / 恢复"""
+        self.stream_down = down
+        if down:
+            self.order_updates.put_nowait(None)  # 唤醒正在等待的 watch_orders
+
+    def adjust_balance(self, currency, amount):
+        """模拟账本之外的余额变化（充提、手动交易等）"""
+        self.balances[currency] = self.balances.get(currency, 0.0) + amount
+
+    async def _call(self, name):
+        self.calls.append(name)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    # ---- ccxt 接口 ----
+
+    async def fetch_balance(self, params=None):
+        await self._call('fetch_balance')
+        free = dict(self.funding if (params or {}).get('type') == 'funding' else self.balances)
+        return {'free': free, 'used': {currency: 0.0 for currency in free}, 'total': dict(free)}
+
+    async def fetch_ticker(self, symbol, params=None):
+        await self._call('fetch_ticker')
+        bid, ask = self.prices[symbol]
+        return {'symbol': symbol, 'bid': bid, 'ask': ask, 'last': (bid + ask) / 2, 'timestamp': int(time.time() * 1000)}
+
+    async def fetch_order_book(self, symbol, limit=None, params=None):
+        await self._call('fetch_order_book')
+        bid, ask = self.prices[symbol]
+        return {'symbol': symbol, 'bids': [[bid, 100.0]], 'asks': [[ask, 100.0]], 'nonce': next(self.nonce)}
+
+    async def create_market_sell_order(self, symbol, amount, params=None):
+        return await self.create_order(symbol, 'market', 'sell', amount, params=params)
+
+    async def create_market_buy_order(self, symbol, amount, params=None):
+        return await self.create_order(symbol, 'market', 'buy', amount, params=params)
+
+    async def create_order(self, symbol, type, side, amount, price=None, params=None):
+        await self._call('create_order')
+        if self.failures:
+            raise self.failures.pop(0)
+
+        base, quote = symbol.split('/')
+        bid, ask = self.prices[symbol]
+        fill_price = bid if side == 'sell' else ask
+        cost = amount * fill_price
+        fee = cost * self.fee_rate
+
+        if side == 'sell':
+            if self.balances.get(base, 0.0) < amount:
+                raise ccxt.InsufficientFunds(f"{self.id}: insufficient {base}")
+            self.adjust_balance(base, -amount)
+            self.adjust_balance(quote, cost - fee)
+        else:
+            if self.balances.get(quote, 0.0) < cost + fee:
+                raise ccxt.InsufficientFunds(f"{self.id}: insufficient {quote}")
+            self.adjust_balance(quote, -cost - fee)
+            self.adjust_balance(base, amount)
+
+        order_id = str(next(self.ids))
+        order = {
+            'id': order_id,
+            'clientOrderId': (params or {}).get('clientOrderId'),
+            'symbol': symbol,
+            'type': type,
+            'side': side,
+            'status': 'closed',
+            'amount': amount,
+            'filled': amount,
+            'remaining': 0.0,
+            'price': fill_price,
+            'average': fill_price,
+            'cost': cost,
+            'fee': {'cost': fee, 'currency': quote},
+            'timestamp': int(time.time() * 1000),
+            'info': {'symbol': symbol.replace('/', ''), 'exchange': self.id},
+        }
+        self.orders[order_id] = order
+        if self.fill_delay is not None:
+            order.update({'status': 'open', 'filled': 0.0, 'remaining': amount})
+            asyncio.get_running_loop().call_later(self.fill_delay, self._fill, order_id, amount)
+        else:
+            self._record_trade(order)
+        return dict(order)
+
+    def _record_trade(self, order):
+        trade_id = str(next(self.ids))
+        self.trades.append({'id': trade_id, 'order': order['id'], 'symbol': order['symbol'],
+                            'side': order['side'], 'amount': order['filled'], 'price': order['average'],
+                            'cost': order['cost'], 'fee': dict(order['fee']), 'timestamp': int(time.time() * 1000),
+                            'info': {'billId': trade_id}})
+
+    def _fill(self, order_id, amount):
+        order = self.orders[order_id]
+        order.update({'status': 'closed', 'filled': amount, 'remaining': 0.0})
+        self._record_trade(order)
+        if not self.stream_down:
+            self.order_updates.put_nowait(dict(order))
+
+    async def fetch_order(self, id, symbol=None, params=None):
+        await self._call('fetch_order')
+        if id not in self.orders:
+            raise ccxt.OrderNotFound(f"{self.id}: order {id} not found")
+        return dict(self.orders[id])
+
+    async def fetch_my_trades(self, symbol=None, since=None, limit=None, params=None):
+        await self._call('fetch_my_trades')
+        trades = [dict(trade) for trade in self.trades
+                  if (symbol is None or trade['symbol'] == symbol) and (since is None or trade['timestamp'] >= since)]
+        if self.newest_first:
+            after = (params or {}).get('after')
+            if after is not None:
+                trades = [trade for trade in trades if int(trade['id']) < int(after)]
+            page = 100 if since is not None or not limit else limit
+            return trades[::-1][:page]
+        return trades[:limit] if limit else trades
+
+    async def watch_orders(self, symbol=None, since=None, limit=None, params=None):
+        if self.stream_down:
+            raise ccxt.NetworkError(f"{self.id}: order stream disconnected")
+        update = await self.order_updates.get()
+        if update is None or self.stream_down:
+            raise ccxt.NetworkError(f"{self.id}: order stream disconnected")
+        updates = [update]
+        while not self.order_updates.empty():
+            update = self.order_updates.get_nowait()
+            if update is not None:
+                updates.append(update)
+        return updates
+
+    async def fetch_deposit_address(self, code, params=None):
+        await self._call('fetch_deposit_address')
+        return {'currency': code, 'address': f"{self.id}:{code}", 'tag': None,
+                'network': (params or {}).get('network')}
+
+    async def transfer(self, code, amount, fromAccount, toAccount, params=None):
+        await self._call('transfer')
+        accounts = {'funding': self.funding, 'trading': self.balances, 'spot': self.balances}
+        source, dest = accounts[fromAccount], accounts[toAccount]
+        if source.get(code, 0.0) < amount:
+            raise ccxt.InsufficientFunds(f"{self.id}: insufficient {code} in {fromAccount} account")
+        source[code] -= amount
+        dest[code] = dest.get(code, 0.0) + amount
+        return {'id': str(next(self.ids)), 'currency': code, 'amount': amount,
+                'fromAccount': fromAccount, 'toAccount': toAccount, 'status': 'ok'}
+
+    async def withdraw(self, code, amount, address, tag=None, params=None):
+        await self._call('withdraw')
+        account = self.funding if self.funding_account else self.balances
+        if account.get(code, 0.0) < amount:
+            raise ccxt.InsufficientFunds(f"{self.id}: insufficient {code} to withdraw")
+        dest = self.network.get(address.split(':')[0])
+        if dest is None:
+            raise ccxt.InvalidAddress(f"{self.id}: unknown address {address}")
+        account[code] -= amount
+        fee = self.withdraw_fees.get(code, 0.0)
+        withdrawal = {'id': str(next(self.ids)), 'currency': code, 'amount': amount, 'address': address,
+                      'fee': {'cost': fee, 'currency': code}, 'status': 'pending',
+                      'timestamp': int(time.time() * 1000)}
+        self.withdrawals.append(withdrawal)
+        asyncio.get_running_loop().call_later(self.deposit_delay, dest._deposit, code, amount - fee)
+        return dict(withdrawal)
+
+    async def fetch_deposit_withdraw_fees(self, codes=None, params=None):
+        await self._call('fetch_deposit_withdraw_fees')
+        return {code: {'withdraw': {'fee': fee, 'percentage': False}, 'deposit': {'fee': None, 'percentage': None},
+                       'networks': {}}
+                for code, fee in self.withdraw_fees.items() if codes is None or code in codes}
+
+    def _deposit(self, code, amount):
+        account = self.funding if self.funding_account else self.balances
+        account[code] = account.get(code, 0.0) + amount
+        self.deposits.append({'id': str(next(self.ids)), 'currency': code, 'amount': amount,
+                              'status': 'ok', 'timestamp': int(time.time() * 1000)})
+
+    async def fetch_deposits(self, code=None, since=None, limit=None, params=None):
+        await self._call('fetch_deposits')
+        deposits = [dict(deposit) for deposit in self.deposits
+                    if (code is None or deposit['currency'] == code) and (since is None or deposit['timestamp'] >= since)]
+        return deposits[-limit:] if limit else deposits
+
+    async def close(self):
+        pass
+
+
+def link_exchanges(exchanges):
+    """让一组 FakeExchange 之间可以互相提币充值"""
+    exchanges = list(exchanges)
+    network = {exchange.id: exchange for exchange in exchanges}
+    for exchange in exchanges:
+        exchange.network = network
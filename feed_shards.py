@@ -0,0 +1,243 @@
+# File: feed_shards.py
+import asyncio
+import logging
+import math
+import multiprocessing
+import os
+import time
+import numpy as np
+import ccxt.pro as ccxtpro
+from config import Config
+from data_collector import PriceCollector
+from quote_table import QuoteTable
+
+logger = logging.getLogger(__name__)
+
+
+def shard_plan(symbol_map, shards):
+    """把 (交易所, 交易对) 划分给 shards 个工作进程，返回 [(venue, rows)]
+
+    先按交易所分，每个交易所再把交易对轮流分给 shards // 交易所数 个进程（至少一个），
+    这样每个槽位只有一个写入进程，单个交易所的行情也可以分散到多个核上解析。
+    """
+    venues = [venue for venue in symbol_map.venues if venue in ('binance', 'okx')]
+    per_venue = max(1, shards // max(1, len(venues)))
+    rows = list(range(len(symbol_map.symbols)))
+    plan = []
+    for venue in venues:
+        count = min(per_venue, len(rows))
+        plan.extend((venue, rows[i::count]) for i in range(count))
+    return plan
+
+
+class PublicClients:
+    """工作进程里拉取 Binance 深度快照用的 ccxt 客户端，只访问公开接口；sim_url 不为空时指向本地模拟交易所"""
+
+    def __init__(self, sim_url=None):
+        binance = ccxtpro.binance({'enableRateLimit': True, 'options': {'fetchMarkets': ['spot']}})
+        binance.set_sandbox_mode(Config.BINANCE_SANDBOX)
+        if sim_url:
+            from sim_exchange import attach_exchange
+            attach_exchange(binance, 'binance', sim_url)
+        self.exchanges = {'binance': binance}
+
+    async def close(self):
+        await asyncio.gather(*(exchange.close() for exchange in self.exchanges.values()), return_exceptions=True)
+
+
+class ShardCollector(PriceCollector):
+    """工作进程中的行情接收：只处理一个交易所的一组交易对，报价写入共享内存报价表
+
+    解析帧和维护订单簿沿用 PriceCollector，update_quote 改为写报价表并通过 doorbell 管道通知主进程；
+    同一轮事件循环里的多次写入只通知一次。进程内不建价格矩阵，价差计算在主进程完成。
+    """
+
+    def __init__(self, table, doorbell, venue, rows, symbols=None, venues=None, trader=None):
+        super().__init__(trader, symbols, venues)
+        self.table = table
+        self.doorbell = doorbell  # 管道写端的文件描述符（非阻塞）
+        self.venue = venue
+        self.rows = rows
+        self.col = self.symbol_map.col[venue]
+        self.ring_pending = False
+
+    def build_matrix(self):
+        return None
+
+    def update_quote(self, venue, row, event_ms=0, received_wall_ns=0, received_ns=0):
+        book = self.books[venue][row]
+        quantity = self.quantities[row]
+        self.table.write(row, self.col, book.sell_vwap(quantity), book.buy_vwap(quantity), event_ms / 1000.0,
+                         received_wall_ns / 1e9, received_ns, time.perf_counter_ns() if received_ns else 0)
+        self.tick_count += 1
+        self.ring()
+
+    def on_feed_down(self, venue, rows):
+        syncs = self.binance_syncs if venue == 'binance' else self.okx_syncs
+        for row in rows:
+            syncs[row].invalidate()
+            self.table.write(row, self.col, None, None)
+        logger.warning("%s feed down, invalidated %d quotes", venue, len(rows))
+        self.ring()
+
+    def ring(self):
+        if not self.ring_pending:
+            self.ring_pending = True
+            asyncio.get_running_loop().call_soon(self._ring)
+
+    def _ring(self):
+        self.ring_pending = False
+        try:
+            os.write(self.doorbell, b'\0')
+        except BlockingIOError:
+            pass  # 管道已满，主进程还没读走之前的通知，不需要再写
+
+    async def run(self):
+        logger.info("Feed shard %s (%d symbols) is running in process %d", self.venue, len(self.rows), os.getpid())
+        feed = self.binance_feed(self.rows) if self.venue == 'binance' else self.okx_feed(self.rows)
+        self.feeds = [feed]
+        await feed.run()
+
+
+def run_shard(table_name, shape, doorbell, venue, rows, symbols, venues, url, sim_url=None):
+    """工作进程入口；url 为主进程配置的行情地址，sim_url 为主进程连接的模拟交易所地址
+    （工作进程重新导入 config，运行时的修改不会带过来）"""
+    from log_setup import setup_logging
+
+    setattr(Config, f"{venue.upper()}_WS_URL", url)
+    listener = setup_logging()
+    table = QuoteTable(*shape, name=table_name)
+    fd = doorbell.fileno()
+    os.set_blocking(fd, False)
+
+    async def main():
+        trader = PublicClients(sim_url) if venue == 'binance' else None
+        collector = ShardCollector(table, fd, venue, rows, symbols, venues, trader)
+        try:
+            await collector.run()
+        finally:
+            collector.stop()
+            if trader is not None:
+                await trader.close()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        table.close()
+        if listener is not None:
+            listener.stop()
+
+
+class ShardedPriceCollector(PriceCollector):
+    """多进程行情接收：各交易所 / 交易对分组的行情在独立的工作进程里解析，主进程只做决策和下单
+
+    对外接口与 PriceCollector 相同（价格矩阵、updated 事件、scan 等），ArbitrageEngine 不需要改动。
+    工作进程把报价写入共享内存报价表（QuoteTable）后写 doorbell 管道；主进程在事件循环里监听管道，
+    被唤醒后一次性取出所有写完的槽位写入价格矩阵，再唤醒决策任务。工作进程异常退出后会被重新拉起，
+    期间它负责的报价在矩阵中作废。分片模式不支持录制原始帧。
+    """
+
+    def __init__(self, trader=None, symbols=None, venues=None, latency=None, shards=None, restart_delay=1.0):
+        super().__init__(trader, symbols, venues, latency=latency)
+        self.shards = shard_plan(self.symbol_map, shards or Config.FEED_SHARDS)
+        shape = (len(self.symbol_map.symbols), len(self.symbol_map.venues))
+        self.table = QuoteTable(*shape)
+        self.last_seq = np.zeros(shape, dtype=np.uint64)
+        self.restart_delay = restart_delay
+        self.context = multiprocessing.get_context('spawn')
+        self.doorbell_read, self.doorbell_write = self.context.Pipe(duplex=False)
+        self.processes = [None] * len(self.shards)
+        self.stopped = False
+
+    def start_shard(self, index):
+        venue, rows = self.shards[index]
+        process = self.context.Process(
+            target=run_shard, name=f"feed-{venue}-{index}", daemon=True,
+            args=(self.table.name, self.table.shape, self.doorbell_write, venue, rows,
+                  self.symbol_map.symbols, self.symbol_map.venues, getattr(Config, f"{venue.upper()}_WS_URL"),
+                  Config.SIM_URL))
+        process.start()
+        self.processes[index] = process
+        logger.info("Started feed shard %s for %s (%d symbols)", process.name, venue, len(rows))
+
+    def on_doorbell(self):
+        """doorbell 可读：清空管道，把报价表中写完的槽位写入价格矩阵"""
+        try:
+            os.read(self.doorbell_read.fileno(), 65536)
+        except BlockingIOError:
+            pass
+        self.poll()
+
+    def poll(self):
+        slots, values = self.table.read_changed(self.last_seq)
+        if not slots.size:
+            return 0
+        cols = len(self.symbol_map.venues)
+        venues = self.symbol_map.venues
+        for slot, (bid, ask, event_time, received_time, received_ns, parsed_ns) in zip(slots.tolist(),
+                                                                                        values.tolist()):
+            row, col = divmod(slot, cols)
+            self.matrix.update(row, col, bid if bid > -math.inf else None, ask if ask < math.inf else None,
+                               event_time, received_time)
+            if self.triangles is not None:
+                self.triangles.mark(row, col)
+            if received_ns:
+                received_ns, parsed_ns = int(received_ns), int(parsed_ns)
+                self.received_ns[row, col] = received_ns
+                self.parsed_ns[row, col] = parsed_ns
+                if self.latency is not None:
+                    self.latency.on_frame(venues[col], int(event_time * 1000), int(received_time * 1e9),
+                                          received_ns, parsed_ns)
+        self.tick_count += slots.size
+        self.updated.set()
+        return slots.size
+
+    def on_shard_down(self, index):
+        """工作进程退出：作废它负责的报价（工作进程已不再写入，可以直接改矩阵和报价表）
+
+        报价表中的槽位也写成缺失报价：进程可能死在写了一半的槽位上，在新进程启动前把版本号恢复成偶数，
+        残留的半个报价不会被读到。
+        """
+        venue, rows = self.shards[index]
+        col = self.symbol_map.col[venue]
+        for row in rows:
+            self.table.write(row, col, None, None)
+            self.matrix.invalidate(col, row)
+            if self.triangles is not None:
+                self.triangles.mark(row, col)
+        self.updated.set()
+
+    async def run(self):
+        logger.info("ShardedPriceCollector is running with %d feed shards", len(self.shards))
+        loop = asyncio.get_running_loop()
+        fd = self.doorbell_read.fileno()
+        os.set_blocking(fd, False)
+        for index in range(len(self.shards)):
+            self.start_shard(index)
+        loop.add_reader(fd, self.on_doorbell)
+        try:
+            while not self.stopped:
+                await asyncio.sleep(self.restart_delay)
+                for index, process in enumerate(self.processes):
+                    if not self.stopped and not process.is_alive():
+                        logger.error("Feed shard %s exited with code %s, restarting", process.name, process.exitcode)
+                        self.on_shard_down(index)
+                        self.start_shard(index)
+        finally:
+            loop.remove_reader(fd)
+            self.stop()
+
+    def stop(self):
+        """结束所有工作进程并释放共享内存"""
+        if self.stopped:
+            return
+        self.stopped = True
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                process.join(5)
+        self.table.close()
@@ -0,0 +1,299 @@
+# File: journal.py
+import asyncio
+import itertools
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS opportunities (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,             -- unix 时间（秒）
+    symbol TEXT NOT NULL,
+    sell_venue TEXT NOT NULL,
+    buy_venue TEXT NOT NULL,
+    sell_price REAL NOT NULL,
+    buy_price REAL NOT NULL,
+    spread REAL NOT NULL,
+    edge REAL NOT NULL,           -- 扣除手续费后的相对收益
+    quantity REAL,
+    status TEXT NOT NULL,         -- seen / rejected / executed
+    reason TEXT
+);
+CREATE INDEX IF NOT EXISTS opportunities_ts ON opportunities (ts);
+CREATE INDEX IF NOT EXISTS opportunities_symbol ON opportunities (symbol, ts);
+CREATE INDEX IF NOT EXISTS opportunities_sell_venue ON opportunities (sell_venue, ts);
+CREATE INDEX IF NOT EXISTS opportunities_buy_venue ON opportunities (buy_venue, ts);
+
+CREATE TABLE IF NOT EXISTS cycles (
+    id INTEGER PRIMARY KEY,       -- 与 opportunities 共用 id 序列，订单和成交按 opportunity_id 关联
+    ts REAL NOT NULL,
+    venue TEXT NOT NULL,
+    path TEXT NOT NULL,           -- 货币路径，如 USDT>BTC>ETH>USDT
+    symbols TEXT NOT NULL,        -- 三条腿的交易对，逗号分隔
+    edge REAL NOT NULL,           -- 扣除手续费后的相对收益
+    quantity REAL,                -- 第一条腿的下单数量
+    status TEXT NOT NULL,         -- seen / rejected / executed
+    reason TEXT                   -- executed 时为没有完整成交的执行结果（partial / failed）
+);
+CREATE INDEX IF NOT EXISTS cycles_ts ON cycles (ts);
+CREATE INDEX IF NOT EXISTS cycles_venue ON cycles (venue, ts);
+
+CREATE TABLE IF NOT EXISTS orders (
+    ts REAL NOT NULL,
+    opportunity_id INTEGER,
+    venue TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    side TEXT NOT NULL,
+    order_id TEXT,
+    status TEXT,                  -- 交易所订单状态，发出后还没有结果时为 sent，下单失败时为 NULL
+    amount REAL NOT NULL,
+    filled REAL,
+    error TEXT,
+    client_order_id TEXT          -- 发出前生成的客户端订单号，结果按它更新这一行
+);
+CREATE INDEX IF NOT EXISTS orders_ts ON orders (ts);
+CREATE INDEX IF NOT EXISTS orders_symbol ON orders (symbol, ts);
+CREATE INDEX IF NOT EXISTS orders_venue ON orders (venue, ts);
+CREATE INDEX IF NOT EXISTS orders_opportunity ON orders (opportunity_id);
+
+CREATE TABLE IF NOT EXISTS fills (
+    ts REAL NOT NULL,
+    opportunity_id INTEGER,
+    venue TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    side TEXT NOT NULL,
+    order_id TEXT,
+    amount REAL NOT NULL,
+    price REAL NOT NULL,
+    fee REAL NOT NULL,
+    fee_currency TEXT
+);
+CREATE INDEX IF NOT EXISTS fills_ts ON fills (ts);
+CREATE INDEX IF NOT EXISTS fills_symbol ON fills (symbol, ts);
+CREATE INDEX IF NOT EXISTS fills_venue ON fills (venue, ts);
+"""
+
+INSERTS = {
+    'opportunities': 'INSERT OR IGNORE INTO opportunities VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+    'cycles': 'INSERT OR IGNORE INTO cycles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+    'orders': 'INSERT INTO orders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+    'fills': 'INSERT INTO fills VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+}
+
+# 发出时写入的记录在执行结束后更新；同一批里先执行插入，更新的行总是已经写入
+UPDATES = {
+    'order_results': 'UPDATE orders SET order_id = ?, status = ?, filled = ?, error = ? WHERE client_order_id = ?',
+    'cycle_results': 'UPDATE cycles SET reason = ? WHERE id = ?',
+}
+
+STATEMENTS = {**INSERTS, **UPDATES}
+
+
+class Journal:
+    """只追加的套利日志：机会和三角环（看到 / 被拒及原因 / 执行）、订单和成交
+
+    交易路径上的记录方法只组装一个 tuple 追加到对应表的待写列表（超过 queue_size 条时丢弃并计数），
+    不等待磁盘。套利在第一条腿发出前写入 executed 的机会记录，每条腿发出前写入带客户端订单号的订单记录
+    （order_sent），执行结束后再按客户端订单号更新结果，订单执行期间崩溃时日志里也有已发出的订单。后台任务在待写记录达到 batch_size 条或每隔 flush_interval 秒时整体换出待写列表，
+    在单独的线程里用一个事务 executemany 写入 SQLite（WAL 模式），崩溃时最多丢失尚未提交的一批。
+    """
+
+    def __init__(self, path=None, batch_size=None, flush_interval=None, queue_size=None):
+        self.path = path or Config.JOURNAL_DB
+        self.batch_size = batch_size or Config.JOURNAL_BATCH_SIZE
+        self.flush_interval = flush_interval or Config.JOURNAL_FLUSH_INTERVAL
+        self.queue_size = queue_size or Config.JOURNAL_QUEUE_SIZE
+        self.pending = {statement: [] for statement in STATEMENTS}
+        self.pending_count = 0
+        self.batch_ready = asyncio.Event()
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix='journal')
+        self.conn = None
+        # 机会 id 从启动时的纳秒时间戳开始递增，重启后不会与之前的记录重复
+        self.ids = itertools.count(time.time_ns())
+        self.dropped = 0
+        self.written = 0
+        self.task = None
+
+    # ---- 交易路径上的记录方法 ----
+
+    def opportunity(self, opportunity, status, reason=None, quantity=None, ts=None):
+        """记录一个套利机会及其处理结果，返回机会 id，供订单和成交关联；ts 默认为当前时间"""
+        opportunity_id = next(self.ids)
+        self._enqueue('opportunities', (opportunity_id, ts or time.time(), opportunity.symbol, opportunity.sell_ex,
+                                         opportunity.buy_ex, opportunity.sell_price, opportunity.buy_price,
+                                         opportunity.spread, opportunity.edge, quantity, status, reason))
+        return opportunity_id
+
+    def order_sent(self, opportunity_id, venue, symbol, side, amount, client_order_id):
+        """一条腿发出前记录订单（状态 sent），结果由 pair / cycle_result 按客户端订单号更新"""
+        self._enqueue('orders', (time.time(), opportunity_id, venue, symbol, side, None, 'sent', amount, None, None,
+                                 client_order_id))
+
+    def pair(self, opportunity_id, symbol, quantity, result):
+        """记录一次套利两条腿的订单结果，以及有成交的腿的成交"""
+        if result is None or result.status == 'rejected':
+            return
+        self._legs(opportunity_id, (symbol, symbol), (result.sell_leg, result.buy_leg), quantity)
+
+    def _legs(self, opportunity_id, symbols, legs, quantity):
+        now = time.time()
+        for symbol, leg in zip(symbols, legs):
+            order = leg.order or {}
+            amount = leg.amount or quantity or 0.0
+            if leg.client_order_id is None:
+                # 没有发出的腿，或没有经过 order_sent 记录的结果（如回放）
+                self._enqueue('orders', (now, opportunity_id, leg.exchange, symbol, leg.side, order.get('id'),
+                                         order.get('status'), amount, order.get('filled'), leg.error, None))
+            else:
+                self._enqueue('order_results', (order.get('id'), order.get('status'), order.get('filled'), leg.error,
+                                                leg.client_order_id))
+            if leg.filled:
+                fee = order.get('fee') or {}
+                self._enqueue('fills', (now, opportunity_id, leg.exchange, symbol, leg.side, order.get('id'),
+                                        order.get('filled') or amount, order.get('average') or order.get('price'),
+                                        fee.get('cost') or 0.0, fee.get('currency')))
+
+    def cycle(self, triangle, status, reason=None, quantity=None, ts=None):
+        """记录一个三角环及其处理结果，返回环的 id，供订单和成交关联"""
+        cycle_id = next(self.ids)
+        self._enqueue('cycles', (cycle_id, ts or time.time(), triangle.venue, '>'.join(triangle.path),
+                                 ','.join(symbol for symbol, _, _ in triangle.legs), triangle.edge, quantity, status,
+                                 reason))
+        return cycle_id
+
+    def cycle_result(self, cycle_id, triangle, result):
+        """记录一个执行了的三角环各条腿的订单结果和成交，没有完整成交时把执行结果记在环的 reason 中"""
+        if result is None or result.status == 'rejected':
+            return
+        if not result.success:
+            self._enqueue('cycle_results', (result.status, cycle_id))
+        self._legs(cycle_id, [symbol for symbol, _, _ in triangle.legs], result.legs, None)
+
+    def _enqueue(self, table, row):
+        if self.pending_count >= self.queue_size:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning("Journal queue full, dropped %d records", self.dropped)
+            return
+        self.pending[table].append(row)
+        self.pending_count += 1
+        if self.pending_count == self.batch_size:
+            self.batch_ready.set()
+
+    # ---- 后台写入 ----
+
+    def _open(self):
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(orders)')}
+        if 'client_order_id' not in columns:
+            # 旧版本建的库没有客户端订单号
+            self.conn.execute('ALTER TABLE orders ADD COLUMN client_order_id TEXT')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS orders_client ON orders (client_order_id)')
+
+    def _write(self, batch):
+        with self.conn:
+            for statement, rows in batch.items():
+                if rows:
+                    self.conn.executemany(STATEMENTS[statement], rows)
+
+    async def _db(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def start(self):
+        if self.task is None:
+            await self._db(self._open)
+            self.task = asyncio.create_task(self.run())
+        return self.task
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.batch_ready.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self):
+        """换出当前的待写记录并在写线程里提交；写入期间新的记录进入新的列表"""
+        self.batch_ready.clear()
+        if not self.pending_count:
+            return
+        batch, self.pending = self.pending, {statement: [] for statement in STATEMENTS}
+        count, self.pending_count = self.pending_count, 0
+        try:
+            await self._db(self._write, batch)
+            self.written += count
+        except Exception as e:
+            logger.error("Failed to write %d journal records: %s", count, e)
+
+    async def close(self):
+        """停止后台任务，把剩下的记录写完后关闭数据库"""
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        if self.conn is not None:
+            await self.flush()
+            await self._db(self.conn.close)
+        self.executor.shutdown()
+
+
+def query(path, table, start=None, end=None, symbol=None, venue=None, limit=None):
+    """按时间范围、交易对、交易所查询日志，返回 dict 列表（走 ts / symbol / venue 索引）"""
+    clauses, args = [], []
+    if start is not None:
+        clauses.append('ts >= ?')
+        args.append(start)
+    if end is not None:
+        clauses.append('ts < ?')
+        args.append(end)
+    if symbol is not None:
+        if table == 'cycles':
+            clauses.append("(',' || symbols || ',') LIKE ?")
+            args.append(f"%,{symbol},%")
+        else:
+            clauses.append('symbol = ?')
+            args.append(symbol)
+    if venue is not None:
+        if table == 'opportunities':
+            clauses.append('(sell_venue = ? OR buy_venue = ?)')
+            args.extend((venue, venue))
+        else:
+            clauses.append('venue = ?')
+            args.append(venue)
+    sql = f"SELECT * FROM {table}"
+    if clauses:
+        sql += ' WHERE ' + ' AND '.join(clauses)
+    sql += ' ORDER BY ts'
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        conn.row_factory = sqlite3.Row
+        return [dict(row) for row in conn.execute(sql, args)]
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='查询套利日志')
+    parser.add_argument('table', choices=sorted(INSERTS))
+    parser.add_argument('--db', default=Config.JOURNAL_DB)
+    parser.add_argument('--since', type=float, help='最近多少小时')
+    parser.add_argument('--symbol')
+    parser.add_argument('--venue')
+    parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args()
+    start = time.time() - args.since * 3600 if args.since else None
+    for record in query(args.db, args.table, start, symbol=args.symbol, venue=args.venue, limit=args.limit):
+        print(json.dumps(record, ensure_ascii=False))
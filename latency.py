@@ -0,0 +1,248 @@
+# File: latency.py
+import asyncio
+import json
+import logging
+import time
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# 每个 2 的幂区间分成 32 个子桶，相对误差约 3%（HDR Histogram 的对数-线性分桶）
+SUB_BUCKET_BITS = 6
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+SUB_BUCKET_HALF = SUB_BUCKET_COUNT >> 1
+MAX_EXPONENT = 40
+
+
+class Histogram:
+    """整数微秒值的对数-线性直方图，record 为 O(1)，内存固定约 1300 个计数"""
+
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (SUB_BUCKET_COUNT + MAX_EXPONENT * SUB_BUCKET_HALF)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    @staticmethod
+    def index(value):
+        if value < SUB_BUCKET_COUNT:
+            return value
+        exponent = value.bit_length() - SUB_BUCKET_BITS
+        return SUB_BUCKET_COUNT + (exponent - 1) * SUB_BUCKET_HALF + (value >> exponent) - SUB_BUCKET_HALF
+
+    @staticmethod
+    def value_at(index):
+        """桶的代表值（区间中点）"""
+        if index < SUB_BUCKET_COUNT:
+            return index
+        exponent = (index - SUB_BUCKET_COUNT) // SUB_BUCKET_HALF + 1
+        mantissa = (index - SUB_BUCKET_COUNT) % SUB_BUCKET_HALF + SUB_BUCKET_HALF
+        return (mantissa << exponent) + (1 << (exponent - 1))
+
+    def record(self, value):
+        value = int(value)
+        if value < 0:
+            value = 0
+        self.counts[min(self.index(value), len(self.counts) - 1)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        target = max(1, int(self.count * p / 100.0 + 0.5))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self.value_at(index), self.max)
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 1),
+            'min': self.min,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'p999': self.percentile(99.9),
+            'max': self.max,
+        }
+
+
+class FeedClock:
+    """单个交易所的行情延迟与时钟偏差估计（单位毫秒）
+
+    offset = 本地接收时间 - 交易所事件时间 = 网络/排队延迟 + 时钟偏差。
+    feed_delay 是 offset 的 EWMA；clock_skew 取最近两个窗口内的最小 offset，
+    最小值对应延迟最低的那条消息，近似于纯时钟偏差。
+    """
+
+    __slots__ = ('feed_delay', 'clock_skew', 'window_min', 'previous_min', 'window_start', 'window', 'alpha')
+
+    def __init__(self, window=60.0, alpha=0.05):
+        self.feed_delay = None
+        self.clock_skew = None
+        self.window_min = None
+        self.previous_min = None
+        self.window_start = time.monotonic()
+        self.window = window
+        self.alpha = alpha
+
+    def update(self, offset_ms):
+        if self.feed_delay is None:
+            self.feed_delay = offset_ms
+        else:
+            self.feed_delay += self.alpha * (offset_ms - self.feed_delay)
+
+        now = time.monotonic()
+        if now - self.window_start >= self.window:
+            self.previous_min = self.window_min
+            self.window_min = None
+            self.window_start = now
+        if self.window_min is None or offset_ms < self.window_min:
+            self.window_min = offset_ms
+        if self.previous_min is None:
+            self.clock_skew = self.window_min
+        else:
+            self.clock_skew = min(self.previous_min, self.window_min)
+
+
+class Trace:
+    """一次套利从行情到成交的各阶段时间戳（time.perf_counter_ns）"""
+
+    __slots__ = ('symbol', 'venue', 'received', 'parsed', 'decision', 'legs')
+
+    def __init__(self, symbol, venue, received, parsed, decision):
+        self.symbol = symbol
+        self.venue = venue          # 触发本次决策的行情来自哪个交易所
+        self.received = received
+        self.parsed = parsed
+        self.decision = decision
+        self.legs = {}              # venue -> {stage: ns}
+
+    def mark(self, venue, stage):
+        self.legs.setdefault(venue, {})[stage] = time.perf_counter_ns()
+
+
+# 每个阶段以及用来计算它的上一个阶段
+LEG_STAGES = (('order_sent', 'decision'), ('exchange_ack', 'order_sent'), ('fill_confirmed', 'exchange_ack'))
+
+
+class LatencyTracker:
+    """按交易所和阶段汇总延迟直方图，提供本地 HTTP 指标接口，退出时落盘"""
+
+    def __init__(self):
+        self.histograms = {}  # (venue, stage) -> Histogram，单位微秒
+        self.clocks = {}      # venue -> FeedClock
+        self.server = None
+        self.loop_task = None
+
+    def histogram(self, venue, stage):
+        key = (venue, stage)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        return histogram
+
+    def on_frame(self, venue, event_ms, received_wall_ns, received_ns, parsed_ns):
+        """每帧调用：记录交易所事件到本地接收的延迟，以及解析耗时"""
+        if event_ms:
+            offset_ms = received_wall_ns / 1e6 - event_ms
+            clock = self.clocks.get(venue)
+            if clock is None:
+                clock = self.clocks[venue] = FeedClock()
+            clock.update(offset_ms)
+            self.histogram(venue, 'feed_delay').record(max(offset_ms, 0.0) * 1000)
+        self.histogram(venue, 'parsed').record((parsed_ns - received_ns) // 1000)
+
+    def feed_delay_ms(self, venue):
+        clock = self.clocks.get(venue)
+        return None if clock is None else clock.feed_delay
+
+    def clock_skew_ms(self, venue):
+        clock = self.clocks.get(venue)
+        return None if clock is None else clock.clock_skew
+
+    def finish(self, trace):
+        """一次套利结束后，把各阶段耗时记入直方图"""
+        self.histogram(trace.venue, 'decision').record((trace.decision - trace.parsed) // 1000)
+        for venue, stages in trace.legs.items():
+            stages['decision'] = trace.decision
+            for stage, previous in LEG_STAGES:
+                if stage in stages and previous in stages:
+                    self.histogram(venue, stage).record((stages[stage] - stages[previous]) // 1000)
+            if 'order_sent' in stages:
+                self.histogram(venue, 'tick_to_order').record((stages['order_sent'] - trace.received) // 1000)
+            if 'fill_confirmed' in stages:
+                self.histogram(venue, 'tick_to_fill').record((stages['fill_confirmed'] - trace.received) // 1000)
+
+    def monitor_loop(self, interval=None):
+        """启动事件循环延迟采样：每 interval 秒 sleep 一次，实际醒来时间比预期晚多少记入 ('loop', 'lag')"""
+        self.loop_task = asyncio.create_task(self._loop_lag(interval or Config.LOOP_LAG_INTERVAL))
+        return self.loop_task
+
+    async def _loop_lag(self, interval):
+        histogram = self.histogram('loop', 'lag')
+        while True:
+            start = time.perf_counter_ns()
+            await asyncio.sleep(interval)
+            histogram.record((time.perf_counter_ns() - start) // 1000 - int(interval * 1e6))
+
+    def snapshot(self):
+        venues = {}
+        for (venue, stage), histogram in sorted(self.histograms.items()):
+            venues.setdefault(venue, {})[stage] = histogram.summary()
+        clocks = {venue: {'feed_delay_ms': clock.feed_delay, 'clock_skew_ms': clock.clock_skew}
+                  for venue, clock in self.clocks.items()}
+        return {'unit': 'us', 'stages': venues, 'clocks': clocks}
+
+    def dump(self, path=None):
+        path = path or Config.LATENCY_DUMP_FILE
+        data = self.snapshot()
+        if path:
+            with open(path, 'w') as f:
+                json.dump(data, f, indent=2)
+        for venue, stages in data['stages'].items():
+            for stage, summary in stages.items():
+                if summary['count']:
+                    logger.info("latency %s %s: n=%d p50=%sus p99=%sus max=%sus", venue, stage,
+                                summary['count'], summary['p50'], summary['p99'], summary['max'])
+
+    async def serve(self, host='127.0.0.1', port=None):
+        """启动本地指标接口，GET 任意路径返回 JSON 快照"""
+        port = port or Config.METRICS_PORT
+        self.server = await asyncio.start_server(self._handle, host, port)
+        logger.info("Metrics endpoint listening on http://%s:%d/metrics", host, port)
+        return self.server
+
+    async def _handle(self, reader, writer):
+        try:
+            await reader.readuntil(b'\r\n\r\n')
+            body = json.dumps(self.snapshot()).encode()
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                         b'Content-Length: ' + str(len(body)).encode() + b'\r\nConnection: close\r\n\r\n' + body)
+            await writer.drain()
+        except Exception as e:
+            logger.debug("Metrics request failed: %s", e)
+        finally:
+            writer.close()
+
+    async def close(self):
+        if self.loop_task is not None:
+            self.loop_task.cancel()
+            self.loop_task = None
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
@@ -0,0 +1,106 @@
+# File: log_setup.py
+import json
+import logging
+import logging.handlers
+import queue
+import time
+from config import Config
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """只把 LogRecord 放进队列，消息的 % 格式化留给后台写线程
+
+    标准 QueueHandler.prepare 会在调用线程里格式化消息；这里同进程内传递记录，
+    不需要序列化，直接入队即可。调用方需使用 logger.info('... %s', value) 的惰性写法；
+    参数是之后还会被修改的可变对象时，需要先自行格式化（TickLogger 在入队前渲染）。
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class StructuredFormatter(logging.Formatter):
+    """把记录输出为一行 JSON，附带 TickLogger 写入的 event / fields"""
+
+    def format(self, record):
+        data = {
+            'ts': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        event = getattr(record, 'event', None)
+        if event is not None:
+            data['event'] = event
+            data.update(record.fields)
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+class TickLogger:
+    """逐 tick 日志的限流器
+
+    同一个 key 在 interval 秒内最多输出一条，被压掉的条数记在下一条的 suppressed 字段里。
+    记录带有 event 和 fields 两个额外属性，供 StructuredFormatter 输出机器可读的 JSON。
+    通过限流的记录在调用线程里渲染消息、复制 fields（按 JSON 往返），后台写线程格式化时
+    不会读到调用方之后修改过的可变参数。
+    """
+
+    def __init__(self, logger, interval=None, level=logging.INFO):
+        self.logger = logger
+        self.interval = Config.LOG_TICK_INTERVAL if interval is None else interval
+        self.level = level
+        self.last = {}        # key -> 上次输出的 monotonic 时间
+        self.suppressed = {}  # key -> 被压掉的条数
+
+    def log(self, key, event, msg, *args, **fields):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        now = time.monotonic()
+        if now - self.last.get(key, -self.interval) < self.interval:
+            self.suppressed[key] = self.suppressed.get(key, 0) + 1
+            return
+        self.last[key] = now
+        fields['suppressed'] = self.suppressed.pop(key, 0)
+        if args:
+            msg = msg % args
+        fields = json.loads(json.dumps(fields, default=str))
+        self.logger.log(self.level, msg, extra={'event': event, 'fields': fields})
+
+
+def setup_logging(level=logging.INFO, log_file=None, structured_file=None, use_queue=None):
+    """配置根日志器，返回需要在退出时 stop() 的 QueueListener（同步模式下返回 None）
+
+    异步模式下，调用线程只做一次入队，格式化以及文件和终端写入都在后台线程完成。
+    """
+    log_file = log_file or Config.LOG_FILE
+    structured_file = structured_file or Config.STRUCTURED_LOG_FILE
+    use_queue = Config.LOG_ASYNC if use_queue is None else use_queue
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.FileHandler(log_file), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    if structured_file:
+        structured = logging.FileHandler(structured_file)
+        structured.setFormatter(StructuredFormatter())
+        handlers.append(structured)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    if not use_queue:
+        for handler in handlers:
+            root.addHandler(handler)
+        return None
+
+    log_queue = queue.SimpleQueue()
+    root.addHandler(DeferredQueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
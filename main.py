@@ -1,40 +1,100 @@
 # File: main.py
-import logging
 import asyncio
+import signal
 from data_collector import PriceCollector
+from feed_shards import ShardedPriceCollector
 from arbitrage import ArbitrageEngine
 from trader import Trader
 from config import Config
-
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(Config.LOG_FILE),
-        logging.StreamHandler()
-    ]
-)
+from recorder import FrameRecorder
+from log_setup import setup_logging
+from latency import LatencyTracker
+from risk_control import RiskEngine
+from position_manager import PositionManager
+from reconciliation import Reconciliation
+from journal import Journal
+from market_tables import MarketTables
 
 async def main():
-    # 初始化套利引擎
-    arbitrage_engine = ArbitrageEngine(None)  # 先创建套利引擎实例
-
     # 初始化交易模块
     trader = Trader()
+    if Config.SIM_URL:
+        # 行情和下单都连到本地模拟交易所（python sim_exchange.py），只在这时才导入模拟交易所（依赖 aiohttp web）
+        from sim_exchange import attach as attach_simulator
+        attach_simulator(trader, Config.SIM_URL)
+
+    # 配置了录制目录时记录原始行情帧（多进程行情解析时不支持录制）
+    recording = Config.RECORD_DIR and not Config.FEED_SHARDS
+    recorder = FrameRecorder(Config.RECORD_DIR, Config.RECORD_MAX_BYTES) if recording else None
+
+    # 延迟统计：各交易所、各阶段的直方图，本地 HTTP 接口查看，退出时落盘
+    latency = LatencyTracker()
+
+    # 初始化价格收集器：只负责接收行情、维护订单簿和价格矩阵
+    if Config.FEED_SHARDS:
+        # 多进程：行情在工作进程里解析，经共享内存报价表交给主进程
+        price_collector = ShardedPriceCollector(trader, latency=latency)
+    else:
+        price_collector = PriceCollector(trader, recorder=recorder, latency=latency)
+
+    # 交易规则表：各交易对各交易所的 taker 费率、数量步长、最小数量 / 金额，预热完成后建表并后台刷新；
+    # 价格矩阵按实际费率计算扣费后的收益，下单数量按步长取整
+    tables = MarketTables(price_collector.symbol_map, trader.exchanges, price_collector.quantities)
+    tables.subscribe(price_collector.apply_tables)
+    trader.tables = tables
+
+    # 内存风控：盈亏、库存、未完成订单和敞口限制，总开关和熔断
+    risk = RiskEngine(trader.notifier)
+    # kill -USR1 <pid> 手动触发总开关
+    asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, risk.kill, 'manual (SIGUSR1)')
+
+    # 对账：后台增量拉取交易所成交记录存入 SQLite，核对套利的两条腿、盈亏和孤立成交
+    reconciliation = Reconciliation(trader.exchanges, trader.notifier)
+
+    # 套利日志：机会、订单和成交经队列批量写入 SQLite，交易路径上不等待磁盘
+    journal = Journal()
+
+    # 初始化套利引擎：独立的决策任务，被行情更新唤醒后判断并下单
+    arbitrage_engine = ArbitrageEngine(price_collector, trader, latency, risk, reconciliation, journal, tables)
+
+    # 库存再平衡：后台任务，定时或本地账本越界时在交易所之间划转 BTC / USDT
+    position_manager = PositionManager(trader.exchanges, trader.notifier, trader.ledger)
 
-    # 初始化价格收集器并传递套利引擎和交易模块
-    price_collector = PriceCollector(arbitrage_engine, trader)  # 把套利引擎和交易模块传入
+    try:
+        if Config.METRICS_PORT:
+            await latency.serve(port=Config.METRICS_PORT)
+        latency.monitor_loop()
 
-    # 注入交易模块到套利引擎
-    arbitrage_engine.execute_arbitrage = lambda s, e: trader.execute_pair(s, e)
+        await journal.start()
 
-    # 启动价格收集
-    await price_collector.run()
+        # 拉取初始余额，启动余额账本的后台同步
+        await trader.start()
+        position_manager.start()
+        reconciliation.start()
 
-    # 启动套利引擎
-    await arbitrage_engine.run()
+        # 同时启动价格收集和套利引擎
+        await asyncio.gather(
+            price_collector.run(),
+            arbitrage_engine.run()
+        )
+    finally:
+        position_manager.stop()
+        await arbitrage_engine.drain()
+        await reconciliation.close()
+        await journal.close()
+        price_collector.stop()
+        await trader.close()
+        if recorder is not None:
+            recorder.close()
+        latency.dump()
+        await latency.close()
 
 if __name__ == "__main__":
-    # 运行主程序
-    asyncio.run(main())
+    # 配置日志：日志记录经队列交给后台线程写入文件和终端
+    log_listener = setup_logging()
+    try:
+        # 运行主程序
+        asyncio.run(main())
+    finally:
+        if log_listener is not None:
+            log_listener.stop()
@@ -0,0 +1,180 @@
+# File: market_tables.py
+import asyncio
+import logging
+import math
+
+import ccxt
+import numpy as np
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def market_step(value, precision_mode):
+    """ccxt 的精度字段换算成步长：DECIMAL_PLACES 模式是小数位数，TICK_SIZE 模式本身就是步长"""
+    if value is None:
+        return 0.0
+    if precision_mode == ccxt.DECIMAL_PLACES:
+        return 10.0 ** -value
+    if precision_mode == ccxt.TICK_SIZE:
+        return float(value)
+    return 0.0  # SIGNIFICANT_DIGITS 没有固定步长，不取整
+
+
+class MarketTables:
+    """各交易对、各交易所的交易规则表：taker 费率、数量步长、最小数量、最小名义金额
+
+    交易对信息加载之后（Trader.start 预热完成时）从 ccxt 的 markets 一次性算好，存成与价格矩阵
+    同形状的 (交易对, 交易所) 数组，另外保留一份嵌套 list 给逐个访问的下单路径用。行情和下单路径上
+    只做下标访问和算术，不再调用 ccxt 的 amount_to_precision 等每次都查 dict、解析字符串的辅助函数。
+
+    taker 费率依次取：账户实际的费率档位（fetch_trading_fees / fetch_trading_fee）、markets 中的默认费率、
+    Config.TAKER_FEES。启动时只按 markets 建表，不等待费率档位；后台任务立即拉取一次费率档位，之后每
+    refresh_interval 秒重新拉取并按（预热模块刷新过的）markets 重建，表变化后通知订阅方（价格矩阵和三角套利检测据此重算手续费下限）。
+    步长为 0 表示不取整，最小值为 0 表示不限制；交易所没有该交易对时 listed 为 False。
+    只下市价单，不需要价格步长。
+    """
+
+    def __init__(self, symbol_map, exchanges=None, quantities=None, fees=None, refresh_interval=None):
+        self.symbol_map = symbol_map
+        self.exchanges = exchanges or {}
+        symbols, venues = symbol_map.symbols, symbol_map.venues
+        shape = (len(symbols), len(venues))
+        self.quantities = quantities or [Config.ORDER_QUANTITIES.get(symbol, Config.QUANTITY) for symbol in symbols]
+        self.default_fees = Config.TAKER_FEES if fees is None else fees
+        self.refresh_interval = refresh_interval or Config.MARKET_TABLE_REFRESH
+        self.taker = np.tile([self.default_fees.get(venue, 0.0) for venue in venues], (shape[0], 1))
+        self.step = np.zeros(shape)
+        self.min_amount = np.zeros(shape)
+        self.min_notional = np.zeros(shape)
+        self.listed = np.ones(shape, dtype=bool)
+        self.account_fees = {}  # (venue, symbol) -> 账户费率档位的 taker 费率
+        self.unsupported = set()  # 不支持查询费率档位的交易所（如 binance 模拟盘没有 sapi）
+        self.listeners = []
+        self.task = None
+        self._publish()
+
+    def subscribe(self, callback):
+        """表变化时调用 callback(self)，订阅时立即调用一次"""
+        self.listeners.append(callback)
+        callback(self)
+
+    def load(self):
+        """按各交易所已加载的 markets 重建表；还没有 markets 的交易所保留原值"""
+        symbols, venues = self.symbol_map.symbols, self.symbol_map.venues
+        for col, venue in enumerate(venues):
+            exchange = self.exchanges.get(venue)
+            markets = getattr(exchange, 'markets', None)
+            if not markets:
+                continue
+            mode = exchange.precisionMode
+            for row, symbol in enumerate(symbols):
+                market = markets.get(symbol)
+                self.listed[row, col] = market is not None
+                if market is None:
+                    continue
+                precision = market.get('precision') or {}
+                limits = market.get('limits') or {}
+                taker = self.account_fees.get((venue, symbol), market.get('taker'))
+                self.taker[row, col] = self.default_fees.get(venue, 0.0) if taker is None else taker
+                self.step[row, col] = market_step(precision.get('amount'), mode)
+                self.min_amount[row, col] = (limits.get('amount') or {}).get('min') or 0.0
+                self.min_notional[row, col] = (limits.get('cost') or {}).get('min') or 0.0
+        self._publish()
+        unlisted = [(venues[col], symbols[row]) for row, col in zip(*np.nonzero(~self.listed))]
+        if unlisted:
+            logger.warning("Symbols not listed, orders will be rejected: %s", unlisted)
+
+    def _publish(self):
+        # 下单路径上逐个访问时 list 下标比 numpy 标量索引快
+        self.takers = self.taker.tolist()
+        self.steps = self.step.tolist()
+        self.min_amounts = self.min_amount.tolist()
+        self.min_notionals = self.min_notional.tolist()
+        self.listed_rows = self.listed.tolist()
+        for callback in self.listeners:
+            callback(self)
+
+    async def refresh_fees(self):
+        """并发拉取各交易所账户实际的 taker 费率档位，失败时保留上一次的结果"""
+        await asyncio.gather(*(self._refresh_venue_fees(venue) for venue in self.symbol_map.venues))
+
+    async def _refresh_venue_fees(self, venue):
+        symbols = self.symbol_map.symbols
+        exchange = self.exchanges.get(venue)
+        if exchange is None or venue in self.unsupported or not exchange.markets:
+            return
+        try:
+            if exchange.has.get('fetchTradingFees'):
+                fees = await exchange.fetch_trading_fees()
+            else:
+                # 没有批量接口（如 OKX）时逐个交易对并发查询，由 ccxt 的限速器排队
+                listed = [symbol for symbol in symbols if symbol in exchange.markets]
+                results = await asyncio.gather(*(exchange.fetch_trading_fee(symbol) for symbol in listed))
+                fees = dict(zip(listed, results))
+        except (ccxt.NotSupported, ccxt.BadRequest) as e:
+            self.unsupported.add(venue)
+            logger.info(f"Trading fee tiers not available on {venue}, using market defaults: {e}")
+            return
+        except Exception as e:
+            logger.warning(f"Failed to fetch trading fees on {venue}: {e}")
+            return
+        for symbol in symbols:
+            taker = (fees.get(symbol) or {}).get('taker')
+            if taker is not None:
+                self.account_fees[(venue, symbol)] = taker
+
+    async def run(self):
+        while True:
+            await self.refresh_fees()
+            self.load()
+            await asyncio.sleep(self.refresh_interval)
+
+    async def start(self):
+        """按 markets 的默认费率建表，费率档位由后台任务拉取，不阻塞启动"""
+        self.load()
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def floor_amount(self, row, col, amount, price=None):
+        """按数量步长向下取整，低于最小数量、或给出预计成交价时名义金额低于最小金额时返回 0"""
+        step = self.steps[row][col]
+        if step:
+            # 加一个很小的量，避免 0.003 / 0.001 = 2.9999999999999996 这类误差少取一个步长
+            amount = round(math.floor(amount / step + 1e-9) * step, 12)
+        if amount < self.min_amounts[row][col]:
+            return 0.0
+        if price is not None and amount * price < self.min_notionals[row][col]:
+            return 0.0
+        return amount
+
+    def pair_order(self, row, sell_col, buy_col, sell_price, buy_price):
+        """两条腿共同的下单数量和不能下单的原因，返回 (数量, 原因)，可以下单时原因为 None
+
+        数量为该交易对配置的下单数量按两个交易所中较粗的步长向下取整（步长为 10 的幂，较粗的整数倍也是较细的）。
+        """
+        listed = self.listed_rows[row]
+        if not (listed[sell_col] and listed[buy_col]):
+            return 0.0, 'symbol not listed'
+        steps = self.steps[row]
+        step = max(steps[sell_col], steps[buy_col])
+        quantity = self.quantities[row]
+        if step:
+            quantity = round(math.floor(quantity / step + 1e-9) * step, 12)
+        min_amounts = self.min_amounts[row]
+        if quantity <= 0.0 or quantity < min_amounts[sell_col] or quantity < min_amounts[buy_col]:
+            return 0.0, 'below minimum amount'
+        min_notionals = self.min_notionals[row]
+        if quantity * sell_price < min_notionals[sell_col] or quantity * buy_price < min_notionals[buy_col]:
+            return 0.0, 'below minimum notional'
+        return quantity, None
+
+    def taker_fee(self, venue, symbol):
+        row = self.symbol_map.row.get(symbol)
+        if row is None:
+            return self.default_fees.get(venue, 0.0)
+        return self.takers[row][self.symbol_map.col[venue]]
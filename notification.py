@@ -1,51 +1,266 @@
+import asyncio
 import logging
 import smtplib
+import threading
+import time
 from email.mime.text import MIMEText
 from config import Config
 
+try:
+    import telegram
+except ImportError:  # python-telegram-bot 未安装时只使用邮件通道
+    telegram = None
+
 logger = logging.getLogger(__name__)
 
-class Notifier:
+
+class Notification:
+    """一条待发送的通知"""
+
+    __slots__ = ('subject', 'body', 'channels', 'created')
+
+    def __init__(self, subject, body, channels):
+        self.subject = subject
+        self.body = body
+        self.channels = channels
+        self.created = time.monotonic()
+
+
+class EmailChannel:
+    """邮件通道：复用同一个 SMTP 会话，断开后自动重连；smtplib 是阻塞的，在线程中执行"""
+
+    name = 'email'
+
     def __init__(self):
         self.email_config = {
             'smtp_server': Config.SMTP_SERVER,
             'smtp_port': Config.SMTP_PORT,
             'email': Config.EMAIL,
             'password': Config.EMAIL_PASSWORD,
-            'recipients': Config.ALERT_RECIPIENTS
+            'recipients': [r for r in Config.ALERT_RECIPIENTS if r],
+            'starttls': Config.SMTP_STARTTLS,
         }
+        self.server = None
+        self.lock = threading.Lock()  # smtplib 会话不是线程安全的，同一时间只允许一个线程使用
+
+    @property
+    def enabled(self):
+        return bool(self.email_config['smtp_server'] and self.email_config['email'] and self.email_config['recipients'])
+
+    def _connect(self):
+        server = smtplib.SMTP(self.email_config['smtp_server'], self.email_config['smtp_port'], timeout=30)
+        if self.email_config['starttls']:
+            server.starttls()
+        if self.email_config['password']:
+            server.login(self.email_config['email'], self.email_config['password'])
+        self.server = server
+
+    def _send_email(self, subject, body):
+        msg = MIMEText(body)
+        msg['Subject'] = subject
+        msg['From'] = self.email_config['email']
+        msg['To'] = ', '.join(self.email_config['recipients'])
+
+        for attempt in range(2):
+            try:
+                if self.server is None:
+                    self._connect()
+                self.server.sendmail(self.email_config['email'], self.email_config['recipients'], msg.as_string())
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError, OSError):
+                # 会话被服务器关闭，丢弃后重连一次
+                self._close()
+                if attempt:
+                    raise
+
+    def _close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+            self.server = None
+
+    def _send_locked(self, subject, body):
+        with self.lock:
+            self._send_email(subject, body)
+
+    def _close_locked(self):
+        with self.lock:
+            self._close()
+
+    async def send(self, subject, body):
+        await asyncio.to_thread(self._send_locked, subject, body)
+
+    async def close(self):
+        await asyncio.to_thread(self._close_locked)
+
+
+class TelegramChannel:
+    """Telegram 通道（python-telegram-bot 20.x 的异步 Bot）"""
+
+    name = 'telegram'
+
+    def __init__(self):
+        self.chat_id = Config.TELEGRAM_CHAT_ID
+        self.bot = telegram.Bot(Config.TELEGRAM_BOT_API_TOKEN) if telegram and Config.TELEGRAM_BOT_API_TOKEN else None
+
+    @property
+    def enabled(self):
+        return self.bot is not None and bool(self.chat_id)
+
+    async def send(self, subject, body):
+        # 首次发送时初始化 Bot（校验 token 并打开 HTTP 连接池），close 时对应 shutdown
+        await self.bot.initialize()
+        await self.bot.send_message(chat_id=self.chat_id, text=f"{subject}\n{body}")
+
+    async def close(self):
+        if self.bot is not None:
+            await self.bot.shutdown()
+
+
+class Notifier:
+    """后台通知服务
+
+    交易路径上的 send_* 只做一次 put_nowait（队列满时丢弃并计数）。后台任务 run 按通道
+    合并短时间内的多条通知为摘要，并限制每个通道的发送频率：一条通知最早在进入队列
+    digest_window 秒后发出，同一通道两次发送之间至少间隔 NOTIFY_MIN_INTERVALS 秒。
+    """
+
+    def __init__(self, channels=None, queue_size=None, digest_window=None, min_intervals=None):
+        if channels is None:
+            channels = [channel for channel in (EmailChannel(), TelegramChannel()) if channel.enabled]
+        self.channels = {channel.name: channel for channel in channels}
+        self.queue = asyncio.Queue(maxsize=queue_size or Config.NOTIFY_QUEUE_SIZE)
+        self.digest_window = Config.NOTIFY_DIGEST_WINDOW if digest_window is None else digest_window
+        self.min_intervals = Config.NOTIFY_MIN_INTERVALS if min_intervals is None else min_intervals
+        self.pending = {name: [] for name in self.channels}
+        self.next_allowed = {name: 0.0 for name in self.channels}
+        self.dropped = 0
+        self.sent = 0
+        self.task = None
+        self.stopping = asyncio.Event()
 
     def send_alert(self, message):
         """发送紧急警报"""
         subject = "Arbitrage Bot Alert"
-        self._send_email(subject, message)
+        self._enqueue(Notification(subject, message, tuple(self.channels)))
 
     def send_trade_report(self, trade_result):
         """发送交易报告"""
         subject = "Arbitrage Trade Report"
         message = f"""
         Trade Details:
+        - Symbol: {trade_result['symbol']}
         - Sell Exchange: {trade_result['sell_exchange']}
         - Sell Price: {trade_result['sell_price']}
         - Buy Exchange: {trade_result['buy_exchange']}
         - Buy Price: {trade_result['buy_price']}
         - Quantity: {trade_result['quantity']}
-        - Slippage: {trade_result['slippage']:.2f}
-        - Estimated Profit: {trade_result['profit']:.2f} USDT
+        - Fees: {trade_result['fees']:.6g} {trade_result['quote']}
+        - Slippage: {trade_result['slippage_bps']:.1f} bps
+        - Net Profit: {trade_result['profit']:.6g} {trade_result['quote']}
         """
-        self._send_email(subject, message)
+        self._enqueue(Notification(subject, message, tuple(self.channels)))
 
-    def _send_email(self, subject, body):
+    def send_telegram(self, message):
+        """只通过 Telegram 发送"""
+        self._enqueue(Notification("Arbitrage Bot", message, ('telegram',)))
+
+    def _enqueue(self, notification):
+        try:
+            self.queue.put_nowait(notification)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 100 == 0:
+                logger.warning("Notification queue full, dropped %d notifications", self.dropped)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+        return self.task
+
+    async def run(self):
+        # 只在等待队列时响应 stopping；正在发送的批次总是发完，close 再负责最后一次强制发送
+        stop = asyncio.ensure_future(self.stopping.wait())
+        try:
+            while not self.stopping.is_set():
+                getter = asyncio.ensure_future(self.queue.get())
+                await asyncio.wait((getter, stop), timeout=self._seconds_until_due(),
+                                   return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    self._route(getter.result())
+                    while not self.queue.empty():
+                        self._route(self.queue.get_nowait())
+                else:
+                    getter.cancel()
+                if self.stopping.is_set():
+                    break
+                await self._dispatch(force=False)
+        finally:
+            stop.cancel()
+
+    def _route(self, notification):
+        for name in notification.channels:
+            if name in self.pending:
+                self.pending[name].append(notification)
+
+    def _due_time(self, name):
+        pending = self.pending[name]
+        if not pending:
+            return None
+        return max(pending[0].created + self.digest_window, self.next_allowed[name])
+
+    def _seconds_until_due(self):
+        due = [t for t in (self._due_time(name) for name in self.channels) if t is not None]
+        if not due:
+            return None
+        return max(min(due) - time.monotonic(), 0)
+
+    async def _dispatch(self, force):
+        now = time.monotonic()
+        for name, channel in self.channels.items():
+            due = self._due_time(name)
+            if due is None or (not force and due > now):
+                continue
+            batch, self.pending[name] = self.pending[name], []
+            subject, body = self._digest(batch)
+            self.next_allowed[name] = now + self.min_intervals.get(name, 0)
+            try:
+                await channel.send(subject, body)
+                self.sent += 1
+                logger.info("Sent %s notification (%d merged)", name, len(batch))
+            except Exception as e:
+                logger.error("Failed to send %s notification: %s", name, e)
+
+    @staticmethod
+    def _digest(batch):
+        """单条原样发送；多条合并为一封摘要"""
+        if len(batch) == 1:
+            return batch[0].subject, batch[0].body
+        subjects = sorted({n.subject for n in batch})
+        subject = f"{subjects[0]} (+{len(batch) - 1} more)" if len(subjects) == 1 else f"Arbitrage Bot Digest ({len(batch)})"
+        body = "\n\n".join(f"[{n.subject}]\n{n.body.strip()}" for n in batch)
+        return subject, body
+
+    async def close(self, timeout=10):
+        """停止后台任务，把队列和待发的通知立即发出，然后关闭连接"""
+        if self.task is not None:
+            # 通知后台任务停止并等它退出，避免正在线程中发送的批次丢失、或与下面的强制发送并发使用同一个 SMTP 会话
+            self.stopping.set()
+            try:
+                await asyncio.wait_for(self.task, timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Timed out waiting for the notification task to stop")
+            except asyncio.CancelledError:
+                if not self.task.cancelled():
+                    raise
+            self.task = None
+        while not self.queue.empty():
+            self._route(self.queue.get_nowait())
         try:
-            msg = MIMEText(body)
-            msg['Subject'] = subject
-            msg['From'] = self.email_config['email']
-            msg['To'] = ', '.join(self.email_config['recipients'])
-
-            with smtplib.SMTP(self.email_config['smtp_server'], self.email_config['smtp_port']) as server:
-                server.starttls()
-                server.login(self.email_config['email'], self.email_config['password'])
-                server.sendmail(self.email_config['email'], self.email_config['recipients'], msg.as_string())
-            logger.info("Alert email sent successfully")
-        except Exception as e:
-            logger.error(f"Failed to send email: {str(e)}")
+            await asyncio.wait_for(self._dispatch(force=True), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Timed out flushing notifications")
+        for channel in self.channels.values():
+            await channel.close()
@@ -0,0 +1,195 @@
+# File: order_book.py
+import logging
+from bisect import bisect_left
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class PriceLevels:
+    """按价格排序的一侧盘口
+
+    价格保存在有序列表中（买盘存负数，这样两侧都按从优到劣升序排列），
+    数量保存在 dict 中。已有价位的数量变化是 O(1)，新增/删除价位用二分查找定位，
+    查找是 O(log n)，插入/删除只是一次连续内存移动，深度在几千档以内时开销可以忽略。
+    """
+
+    __slots__ = ('sign', 'keys', 'sizes')
+
+    def __init__(self, descending=False):
+        self.sign = -1.0 if descending else 1.0
+        self.keys = []    # 有序的 sign * price
+        self.sizes = {}   # sign * price -> quantity
+
+    def clear(self):
+        self.keys.clear()
+        self.sizes.clear()
+
+    def update(self, price, quantity):
+        key = self.sign * price
+        if quantity == 0:
+            if self.sizes.pop(key, None) is not None:
+                del self.keys[bisect_left(self.keys, key)]
+        elif key in self.sizes:
+            self.sizes[key] = quantity
+        else:
+            self.sizes[key] = quantity
+            keys = self.keys
+            keys.insert(bisect_left(keys, key), key)
+
+    def best(self):
+        if not self.keys:
+            return None
+        return self.sign * self.keys[0]
+
+    def vwap(self, quantity):
+        """吃掉 quantity 数量时的成交均价，深度不足返回 None"""
+        remaining = quantity
+        cost = 0.0
+        sizes = self.sizes
+        for key in self.keys:
+            size = sizes[key]
+            if size >= remaining:
+                cost += key * remaining
+                return self.sign * cost / quantity
+            cost += key * size
+            remaining -= size
+        return None
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class OrderBook:
+    """单个交易所单个交易对的 L2 订单簿"""
+
+    def __init__(self, venue, symbol):
+        self.venue = venue
+        self.symbol = symbol
+        self.bids = PriceLevels(descending=True)
+        self.asks = PriceLevels()
+        self.synced = False  # 快照加载完成且序号连续时为 True
+
+    def reset(self):
+        self.bids.clear()
+        self.asks.clear()
+        self.synced = False
+
+    def load_snapshot(self, bids, asks):
+        self.bids.clear()
+        self.asks.clear()
+        self.apply(bids, asks)
+
+    def apply(self, bids, asks):
+        update = self.bids.update
+        for level in bids:
+            update(float(level[0]), float(level[1]))
+        update = self.asks.update
+        for level in asks:
+            update(float(level[0]), float(level[1]))
+
+    def best_bid(self):
+        return self.bids.best()
+
+    def best_ask(self):
+        return self.asks.best()
+
+    def sell_vwap(self, quantity):
+        """市价卖出 quantity 的预计成交均价（吃买盘）"""
+        if not self.synced:
+            return None
+        return self.bids.vwap(quantity)
+
+    def buy_vwap(self, quantity):
+        """市价买入 quantity 的预计成交均价（吃卖盘）"""
+        if not self.synced:
+            return None
+        return self.asks.vwap(quantity)
+
+
+class BinanceBookSync:
+    """Binance 增量深度流的同步逻辑
+
+    按官方文档的流程：先缓存增量消息，再用 REST 快照的 lastUpdateId 对齐，
+    之后每条消息的 U 必须等于上一条的 u + 1，否则需要重新拉快照。
+    快照一直拉不到时缓存最多 max_buffer 条，超过后清空并置 overflowed，由上层重新订阅。
+    """
+
+    def __init__(self, book, max_buffer=None):
+        self.book = book
+        self.last_update_id = None
+        self.buffer = []
+        self.max_buffer = max_buffer or Config.BINANCE_BOOK_BUFFER
+        self.overflowed = False
+
+    def on_snapshot(self, bids, asks, last_update_id):
+        self.book.load_snapshot(bids, asks)
+        self.last_update_id = last_update_id
+        buffered, self.buffer = self.buffer, []
+        self.book.synced = True
+        for msg in buffered:
+            if not self.on_diff(msg):
+                return False
+        return True
+
+    def on_diff(self, msg):
+        """处理一条 depthUpdate，返回 False 表示序号断开、需要重新拉快照"""
+        if self.last_update_id is None:
+            if len(self.buffer) >= self.max_buffer:
+                logger.warning(f"Binance depth buffer on {self.book.symbol} overflowed waiting for a snapshot, "
+                               f"dropped {len(self.buffer)} updates")
+                self.buffer = []
+                self.overflowed = True
+                return False
+            self.buffer.append(msg)
+            return True
+
+        first_id, final_id = msg['U'], msg['u']
+        if final_id <= self.last_update_id:
+            return True  # 快照之前的旧消息
+        if first_id > self.last_update_id + 1:
+            logger.warning(f"Binance depth gap on {self.book.symbol}: expected {self.last_update_id + 1}, got {first_id}")
+            self.invalidate()
+            return False
+
+        self.book.apply(msg['b'], msg['a'])
+        self.last_update_id = final_id
+        return True
+
+    def invalidate(self):
+        self.book.reset()
+        self.last_update_id = None
+        self.buffer = []
+
+
+class OkxBookSync:
+    """OKX books 频道的同步逻辑：snapshot 之后每条 update 的 prevSeqId 必须等于上一条的 seqId"""
+
+    def __init__(self, book):
+        self.book = book
+        self.seq_id = None
+
+    def on_message(self, action, data):
+        """处理一条 books 推送，返回 False 表示序号断开、需要重新订阅"""
+        if action == 'snapshot':
+            self.book.load_snapshot(data['bids'], data['asks'])
+            self.seq_id = data.get('seqId')
+            self.book.synced = True
+            return True
+
+        if self.seq_id is None:
+            return True  # 还没收到快照
+
+        prev_seq_id = data.get('prevSeqId')
+        if prev_seq_id != self.seq_id:
+            logger.warning(f"OKX depth gap on {self.book.symbol}: expected prevSeqId {self.seq_id}, got {prev_seq_id}")
+            self.invalidate()
+            return False
+
+        self.book.apply(data['bids'], data['asks'])
+        self.seq_id = data.get('seqId')
+        return True
+
+    def invalidate(self):
+        self.book.reset()
+        self.seq_id = None
@@ -0,0 +1,122 @@
+# File: order_tracker.py
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# ccxt 统一订单状态中的终态
+TERMINAL_STATUSES = ('closed', 'canceled', 'rejected', 'expired')
+
+
+class OrderTracker:
+    """基于私有订单推送的订单状态跟踪
+
+    每个交易所一个后台任务订阅 watch_orders，收到终态（成交 / 部分成交后撤销 / 拒绝）时
+    完成对应订单的 future。推送断开期间，或推送在 stream_grace 秒内没有给出结果时，
+    改用 REST 轮询：首个间隔很短，之后指数退避，超过截止时间仍未终结则返回最后一次查到的订单。
+    """
+
+    def __init__(self, exchanges, deadline=None, poll_first=None, poll_max=None, poll_backoff=2.0,
+                 stream_grace=None):
+        self.exchanges = exchanges
+        self.deadline = deadline or Config.ORDER_DEADLINE
+        self.stream_grace = stream_grace or Config.ORDER_STREAM_GRACE
+        self.poll_first = poll_first or Config.ORDER_POLL_FIRST
+        self.poll_max = poll_max or Config.ORDER_POLL_MAX
+        self.poll_backoff = poll_backoff
+        self.futures = {}                      # (venue, order_id) -> Future
+        self.recent = OrderedDict()            # 在 wait 之前就已到达的终态推送
+        self.stream_up = {venue: False for venue in exchanges}
+        self.tasks = []
+
+    def supports_stream(self, venue):
+        return Config.USE_PRIVATE_STREAMS and getattr(self.exchanges[venue], 'has', {}).get('watchOrders')
+
+    async def run(self):
+        venues = [venue for venue in self.exchanges if self.supports_stream(venue)]
+        for venue in venues:
+            self.stream_up[venue] = True  # 订阅出错前视为在线
+        self.tasks = [asyncio.create_task(self._stream_loop(venue)) for venue in venues]
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def _stream_loop(self, venue):
+        exchange = self.exchanges[venue]
+        retry_delay = 1
+        while True:
+            try:
+                orders = await exchange.watch_orders()
+                if not self.stream_up[venue]:
+                    logger.info(f"Order stream on {venue} is back up")
+                    self.stream_up[venue] = True
+                retry_delay = 1
+                for order in orders:
+                    self.on_order_update(venue, order)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.stream_up[venue]:
+                    logger.warning(f"Order stream on {venue} is down, falling back to REST polling: {e}")
+                self.stream_up[venue] = False
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 30)
+
+    def on_order_update(self, venue, order):
+        """处理一条订单推送；终态时完成等待中的 future，否则什么都不做"""
+        if order.get('status') not in TERMINAL_STATUSES:
+            return
+        key = (venue, str(order['id']))
+        future = self.futures.pop(key, None)
+        if future is not None:
+            if not future.done():
+                future.set_result(order)
+            return
+        # wait 还没开始（推送比下单响应先到），先缓存起来
+        self.recent[key] = order
+        while len(self.recent) > 1000:
+            self.recent.popitem(last=False)
+
+    async def wait(self, venue, order_id, symbol, deadline=None):
+        """等待订单进入终态，返回订单；超过截止时间仍未终结时返回最后查到的订单（可能为 None）"""
+        key = (venue, str(order_id))
+        order = self.recent.pop(key, None)
+        if order is not None:
+            return order
+
+        deadline = time.monotonic() + (deadline or self.deadline)
+        if self.stream_up.get(venue):
+            future = asyncio.get_running_loop().create_future()
+            self.futures[key] = future
+            try:
+                # 推送在线时先只等推送，超过 stream_grace 仍没有结果再转为轮询兜底
+                timeout = min(self.stream_grace, max(deadline - time.monotonic(), 0))
+                return await asyncio.wait_for(asyncio.shield(future), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"No order update for {order_id} on {venue} from stream, polling")
+            finally:
+                self.futures.pop(key, None)
+
+        return await self.poll(venue, order_id, symbol, deadline)
+
+    async def poll(self, venue, order_id, symbol, deadline):
+        """自适应 REST 轮询：首个间隔 poll_first，之后按 poll_backoff 退避到 poll_max"""
+        interval = self.poll_first
+        last = None
+        while True:
+            try:
+                last = await self.exchanges[venue].fetch_order(order_id, symbol)
+                if last.get('status') in TERMINAL_STATUSES:
+                    return last
+            except Exception as e:
+                logger.error(f"Failed to fetch order {order_id} on {venue}: {e}")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return last
+            await asyncio.sleep(min(interval, remaining))
+            interval = min(interval * self.poll_backoff, self.poll_max)
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
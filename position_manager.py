@@ -1,32 +1,322 @@
-from binance.client import Client as BinanceClient
-from okx import MarketData as OKXClient
+# File: position_manager.py
+import asyncio
+import logging
+import time
 from config import Config
 
+logger = logging.getLogger(__name__)
+
+
+class Transfer:
+    """一笔跨交易所划转：从 source 提币，充值到 dest"""
+
+    def __init__(self, currency, source, dest, amount):
+        self.currency = currency
+        self.source = source
+        self.dest = dest
+        self.amount = amount
+        self.withdrawal_id = None
+        self.started = None  # 提币时的毫秒时间戳，查询充值记录用
+        self.fee = None  # 提币手续费，到账数量 = amount - fee；未知时为 None
+
+    def __repr__(self):
+        return f"Transfer({self.amount} {self.currency} {self.source} -> {self.dest})"
+
+
 class PositionManager:
-    def __init__(self):
-        self.binance_client = BinanceClient(Config.BINANCE_API_KEY, Config.BINANCE_API_SECRET)
-        self.okx_client = OKXClient(Config.OKX_API_KEY, Config.OKX_API_SECRET)
-
-    def get_balance(self, exchange):
-        if exchange == "binance":
-            balance = self.binance_client.get_asset_balance(asset="BTC")
-            return float(balance["free"])
-        elif exchange == "okx":
-            balance = self.okx_client.get_account_balance(currency="BTC")
-            return float(balance["data"][0]["details"][0]["availBal"])
-
-    def sync_balance(self):
-        binance_balance = self.get_balance("binance")
-        okx_balance = self.get_balance("okx")
-        if binance_balance > okx_balance:
-            transfer_amount = binance_balance - okx_balance
-            self.transfer("binance", "okx", transfer_amount)
-        else:
-            transfer_amount = okx_balance - binance_balance
-            self.transfer("okx", "binance", transfer_amount)
-
-    def transfer(self, from_exchange, to_exchange, amount):
-        if from_exchange == "binance":
-            self.binance_client.transfer_spot_to_margin(asset="BTC", amount=amount)
-        elif from_exchange == "okx":
-            self.okx_client.transfer_spot_to_margin(currency="BTC", amount=amount)
\ No newline at end of file
+    """后台库存再平衡服务
+
+    与 Trader 共用 ccxt 异步客户端。每个币种在单个交易所的持有量占所有交易所合计的比例
+    应落在 Config.REBALANCE_BANDS 的区间内；越界时计算把各交易所调回平均份额所需的最少划转
+    （按余额从多到少配对，N 个交易所最多 N-1 笔），通过提币到目标交易所的充值地址完成。
+
+    触发方式有两种：每 check_interval 秒用本地余额账本（内存，不发请求）检查是否越界，
+    以及每 interval 秒一次的定时再平衡；执行前再并发拉取所有交易所的 REST 余额重新计算。
+    两处都用可用余额（free，账本记录的也是可用余额），越界检查和划转计划的口径一致。
+    越界触发距上一轮至少 min_trigger_interval 秒：dry_run、划转低于最小数量或提币失败时越界会一直存在，
+    冷却避免每次检查都拉 REST 余额；计划与上一轮相同时也不再重复记录。
+    整个过程在独立的后台任务里，不在交易路径上。某币种有在途划转时不再为它安排新的划转，
+    直到在目标交易所查到对应充值或超时。dry_run 时只记录划转计划。
+    """
+
+    def __init__(self, exchanges, notifier=None, ledger=None, bands=None, min_transfer=None, interval=None,
+                 check_interval=None, transfer_timeout=None, dry_run=None, min_trigger_interval=None):
+        self.exchanges = exchanges
+        self.notifier = notifier
+        self.ledger = ledger
+        self.bands = Config.REBALANCE_BANDS if bands is None else bands
+        self.min_transfer = Config.REBALANCE_MIN_TRANSFER if min_transfer is None else min_transfer
+        self.interval = interval or Config.REBALANCE_INTERVAL
+        self.check_interval = check_interval or Config.REBALANCE_CHECK_INTERVAL
+        self.min_trigger_interval = (Config.REBALANCE_MIN_TRIGGER_INTERVAL if min_trigger_interval is None
+                                     else min_trigger_interval)
+        self.transfer_timeout = transfer_timeout or Config.REBALANCE_TRANSFER_TIMEOUT
+        self.dry_run = Config.REBALANCE_DRY_RUN if dry_run is None else dry_run
+        self.in_flight = []  # 已提币、尚未到账的 Transfer
+        self.claimed_deposits = set()  # 已经对应到某笔划转的充值记录 (venue, id)
+        self.last_plan = []
+        self.task = None
+
+    # ---- 计划 ----
+
+    def plan(self, balances):
+        """根据 {venue: {currency: free}} 计算划转计划，返回 Transfer 列表"""
+        busy = {transfer.currency for transfer in self.in_flight}
+        transfers = []
+        for currency, (low, high) in self.bands.items():
+            if currency in busy:
+                continue
+            holdings = {venue: balances.get(venue, {}).get(currency, 0.0) for venue in self.exchanges}
+            total = sum(holdings.values())
+            if total <= 0 or all(low <= amount / total <= high for amount in holdings.values()):
+                continue
+
+            target = total / len(holdings)
+            surplus = sorted(((amount - target, venue) for venue, amount in holdings.items() if amount > target),
+                             reverse=True)
+            deficit = sorted(((target - amount, venue) for venue, amount in holdings.items() if amount < target),
+                             reverse=True)
+            minimum = self.min_transfer.get(currency, 0.0)
+            i = j = 0
+            while i < len(surplus) and j < len(deficit):
+                (extra, source), (missing, dest) = surplus[i], deficit[j]
+                amount = min(extra, missing)
+                if amount >= minimum:
+                    transfers.append(Transfer(currency, source, dest, amount))
+                surplus[i] = (extra - amount, source)
+                deficit[j] = (missing - amount, dest)
+                if surplus[i][0] <= minimum:
+                    i += 1
+                if deficit[j][0] <= minimum:
+                    j += 1
+        return transfers
+
+    def band_crossed(self, balances):
+        """任一没有在途划转的币种在某个交易所越界时返回 True"""
+        busy = {transfer.currency for transfer in self.in_flight}
+        for currency, (low, high) in self.bands.items():
+            if currency in busy:
+                continue
+            holdings = [balances.get(venue, {}).get(currency, 0.0) for venue in self.exchanges]
+            total = sum(holdings)
+            if total > 0 and any(not low <= amount / total <= high for amount in holdings):
+                return True
+        return False
+
+    # ---- 执行 ----
+
+    async def fetch_balances(self):
+        """并发拉取所有交易所的可用余额，任一失败时返回 None"""
+        results = await asyncio.gather(*(exchange.fetch_balance() for exchange in self.exchanges.values()),
+                                       return_exceptions=True)
+        balances = {}
+        for venue, result in zip(self.exchanges, results):
+            if isinstance(result, Exception):
+                logger.error(f"Rebalance skipped: failed to fetch balance on {venue}: {result}")
+                return None
+            balances[venue] = {currency: float(amount) for currency, amount in (result.get('free') or {}).items()
+                               if amount is not None}
+        return balances
+
+    async def rebalance(self):
+        """执行一轮再平衡，返回本轮的划转计划"""
+        await self.check_in_flight()
+        balances = await self.fetch_balances()
+        if balances is None:
+            return []
+        transfers = self.plan(balances)
+        repeated = self._plan_key(transfers) == self._plan_key(self.last_plan)
+        self.last_plan = transfers
+        if not transfers:
+            return transfers
+        if self.dry_run:
+            for transfer in transfers:
+                if repeated:
+                    logger.debug(f"Rebalance (dry run, unchanged): {transfer}")
+                else:
+                    logger.info(f"Rebalance (dry run): {transfer}")
+            return transfers
+        await asyncio.gather(*(self.execute(transfer) for transfer in transfers))
+        return transfers
+
+    @staticmethod
+    def _plan_key(transfers):
+        return [(t.currency, t.source, t.dest, round(t.amount, 8)) for t in transfers]
+
+    async def execute(self, transfer):
+        """提币到目标交易所的充值地址，异常不向外抛出"""
+        source = self.exchanges[transfer.source]
+        params = {}
+        network = Config.REBALANCE_NETWORKS.get(transfer.currency)
+        if network:
+            params['network'] = network
+        accounts = Config.REBALANCE_FUNDING_ACCOUNTS.get(transfer.source)
+        moved = False
+        try:
+            address = await self.exchanges[transfer.dest].fetch_deposit_address(transfer.currency, dict(params))
+            if accounts:
+                # 需要先从交易账户划到资金账户才能提币
+                await source.transfer(transfer.currency, transfer.amount, *accounts)
+                moved = True
+            transfer.started = int(time.time() * 1000)
+            withdrawal = await source.withdraw(transfer.currency, transfer.amount, address['address'],
+                                               address.get('tag'), params)
+        except Exception as e:
+            msg = f"Rebalance transfer {transfer} failed: {e}"
+            if moved:
+                # 提币失败：把划到资金账户的数量划回交易账户
+                trading, funding = accounts
+                try:
+                    await source.transfer(transfer.currency, transfer.amount, funding, trading)
+                except Exception as rollback_error:
+                    msg += (f"; {transfer.amount} {transfer.currency} left in {funding} account on "
+                            f"{transfer.source}: {rollback_error}")
+            logger.error(msg)
+            if self.notifier is not None:
+                self.notifier.send_alert(msg)
+            return
+        transfer.withdrawal_id = withdrawal.get('id')
+        transfer.fee = await self._withdraw_fee(transfer, withdrawal, network)
+        self.in_flight.append(transfer)
+        logger.info(f"Rebalance withdrawal {transfer.withdrawal_id} submitted: {transfer}")
+        if self.ledger is not None:
+            self.ledger.adjust(transfer.source, transfer.currency, -transfer.amount)
+            await self.ledger.resync(transfer.source)
+
+    async def _withdraw_fee(self, transfer, withdrawal, network):
+        """提币手续费：优先取提币记录里的 fee，没有时按 fetch_deposit_withdraw_fees 中对应链的 withdrawFee"""
+        fee = withdrawal.get('fee') or {}
+        if fee.get('cost') is not None and fee.get('currency') in (None, transfer.currency):
+            return float(fee['cost'])
+        source = self.exchanges[transfer.source]
+        if source.has.get('fetchDepositWithdrawFees'):
+            try:
+                fees = (await source.fetch_deposit_withdraw_fees([transfer.currency])).get(transfer.currency) or {}
+                withdraw = ((fees.get('networks') or {}).get(network) or fees).get('withdraw') or {}
+                if withdraw.get('fee') is not None:
+                    cost = float(withdraw['fee'])
+                    return cost * transfer.amount if withdraw.get('percentage') else cost
+            except Exception as e:
+                logger.warning(f"Failed to fetch {transfer.currency} withdrawal fee on {transfer.source}: {e}")
+        logger.warning(f"Withdrawal fee unknown for {transfer}, matching any deposit up to the withdrawn amount")
+        return None
+
+    async def check_in_flight(self):
+        """在目标交易所的充值记录里查找在途划转，到账或超时后移出"""
+        for transfer in list(self.in_flight):
+            amount = await self._arrived(transfer)
+            if amount:
+                self.in_flight.remove(transfer)
+                logger.info(f"Rebalance transfer arrived: {transfer}, credited {amount}")
+                await self._sweep(transfer.dest, transfer.currency, amount)
+            elif time.time() * 1000 - transfer.started > self.transfer_timeout * 1000:
+                self.in_flight.remove(transfer)
+                msg = f"Rebalance transfer {transfer} not credited after {self.transfer_timeout:.0f}s"
+                logger.error(msg)
+                if self.notifier is not None:
+                    self.notifier.send_alert(msg)
+
+    async def _arrived(self, transfer):
+        """返回对应充值的到账数量，还没到账时返回 0"""
+        try:
+            deposits = await self.exchanges[transfer.dest].fetch_deposits(transfer.currency, transfer.started)
+        except Exception as e:
+            logger.warning(f"Failed to fetch deposits on {transfer.dest}: {e}")
+            return 0.0
+        # 到账数量扣除了提币手续费；手续费未知时只要求不超过提币数量
+        slack = transfer.amount * Config.REBALANCE_ARRIVAL_SLACK
+        expected = transfer.amount - (transfer.fee or 0.0)
+        low = expected - slack if transfer.fee is not None else slack
+        for deposit in deposits:
+            key = (transfer.dest, deposit.get('id'))
+            amount = deposit.get('amount') or 0.0
+            if (deposit.get('status') == 'ok' and key not in self.claimed_deposits
+                    and low <= amount <= expected + slack):
+                self.claimed_deposits.add(key)
+                return amount
+        return 0.0
+
+    async def _sweep(self, venue, currency, credited):
+        """充值先到资金账户的交易所，把这笔到账的数量（不是资金账户的全部余额）划回交易账户，然后记入本地账本"""
+        accounts = Config.REBALANCE_FUNDING_ACCOUNTS.get(venue)
+        exchange = self.exchanges[venue]
+        if accounts:
+            trading, funding = accounts
+            try:
+                balance = await exchange.fetch_balance({'type': funding})
+                amount = min(credited, (balance.get('free') or {}).get(currency) or 0.0)
+                if amount > 0:
+                    await exchange.transfer(currency, amount, funding, trading)
+            except Exception as e:
+                logger.error(f"Failed to move {currency} deposit to trading account on {venue}: {e}")
+                return
+        if self.ledger is not None:
+            self.ledger.adjust(venue, currency, credited)
+            await self.ledger.resync(venue)
+
+    # ---- 调度 ----
+
+    def _ledger_balances(self):
+        return {venue: self.ledger.balances.get(venue, {}) for venue in self.exchanges}
+
+    async def run(self):
+        """定时再平衡，并在本地账本显示越界时提前触发；有在途划转时每次检查都查询是否到账"""
+        last_run = 0.0
+        while True:
+            if self.in_flight:
+                try:
+                    await self.check_in_flight()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Failed to check rebalance transfers: {e}")
+            since = time.monotonic() - last_run
+            due = since >= self.interval
+            triggered = (since >= self.min_trigger_interval and self.ledger is not None
+                         and self.band_crossed(self._ledger_balances()))
+            if due or triggered:
+                try:
+                    await self.rebalance()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Rebalance failed: {e}")
+                last_run = time.monotonic()
+            await asyncio.sleep(self.check_interval)
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+        return self.task
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+
+async def simulate(dry_run):
+    """用两个本地模拟交易所演示一轮再平衡：BTC 几乎全部在 binance，USDT 几乎全部在 okx"""
+    from fake_exchange import FakeExchange, link_exchanges
+
+    prices = {Config.SYMBOL: (60000.0, 60001.0)}
+    exchanges = {
+        'binance': FakeExchange('binance', {'BTC': 1.9, 'USDT': 10000.0}, prices, withdraw_fees={'BTC': 0.0002}),
+        'okx': FakeExchange('okx', {'BTC': 0.1, 'USDT': 110000.0}, prices, funding_account=True,
+                            withdraw_fees={'USDT': 1.0}),
+    }
+    link_exchanges(exchanges.values())
+    manager = PositionManager(exchanges, dry_run=dry_run)
+    print(f"before: {await manager.fetch_balances()}")
+    print(f"plan:   {await manager.rebalance()}")
+    await asyncio.sleep(0.05)
+    await manager.check_in_flight()
+    print(f"after:  {await manager.fetch_balances()}")
+    print(f"in flight: {manager.in_flight}")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='在本地模拟交易所上演示库存再平衡')
+    parser.add_argument('--dry-run', action='store_true', help='只计算划转计划，不提币')
+    args = parser.parse_args()
+    asyncio.run(simulate(args.dry_run))
@@ -0,0 +1,241 @@
+# File: price_matrix.py
+import logging
+import math
+from collections import namedtuple
+
+import numpy as np
+from spread_stats import SpreadStats
+
+logger = logging.getLogger(__name__)
+
+# spread 为绝对价差，edge 为扣除双边 taker 手续费后的相对收益（相对买入成本）
+Opportunity = namedtuple('Opportunity', ['symbol', 'sell_ex', 'buy_ex', 'sell_price', 'buy_price', 'spread', 'edge'])
+
+
+def binance_symbol(symbol):
+    return symbol.replace('/', '')
+
+
+def okx_symbol(symbol):
+    return symbol.replace('/', '-')
+
+
+# 各交易所的交易对命名规则，只在启动时调用一次
+SYMBOL_FORMATTERS = {
+    'binance': binance_symbol,
+    'okx': okx_symbol,
+}
+
+
+class SymbolMap:
+    """统一交易对名称（ccxt 格式 BTC/USDT）与各交易所原生名称之间的映射
+
+    映射在启动时一次性建好，行情处理时只做一次 dict 查找，不再拼接字符串。
+    """
+
+    def __init__(self, symbols, venues):
+        self.symbols = list(symbols)
+        self.venues = list(venues)
+        self.row = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.col = {venue: j for j, venue in enumerate(self.venues)}
+        self.native = {}     # (venue, symbol) -> 原生名称
+        self.by_native = {}  # venue -> {原生名称: 行号}
+        for venue in self.venues:
+            formatter = SYMBOL_FORMATTERS[venue]
+            rows = self.by_native[venue] = {}
+            for i, symbol in enumerate(self.symbols):
+                name = formatter(symbol)
+                self.native[(venue, symbol)] = name
+                rows[name] = i
+
+    def natives(self, venue):
+        return [self.native[(venue, symbol)] for symbol in self.symbols]
+
+
+class PriceMatrix:
+    """交易对 × 交易所 的可成交价格矩阵
+
+    bids[i, j] 是在交易所 j 卖出交易对 i 的预计成交价，asks[i, j] 是买入价。
+    缺失的报价用 -inf / +inf 表示，这样不需要特殊处理。
+    每次更新原地写入并标记该行为脏行，evaluate 只计算脏行。
+    event_times / received_times 记录每个报价的交易所事件时间和本地接收时间（墙钟秒），
+    本地接收时间超过 max_age 秒的报价视为缺失。
+
+    每个方向（卖出交易所, 买入交易所）的价差取对数 log(卖出价 / 买入价)，缺失报价对应 -inf，
+    不会产生 nan。价差写入 SpreadStats，入场阈值取 手续费下限 与 EWMA + entry_z 倍滚动标准差
+    中的较大者，其中手续费下限是扣除双边 taker 费后刚好不亏的价差再加 min_edge；样本数不足
+    min_samples 时不入场。触发一次后该方向需要价差回落到 EWMA + exit_z 倍标准差以下才会
+    再次触发，避免同一次价差偏离反复下单。阈值只在统计更新时重算并缓存。
+    """
+
+    SCALAR_ROWS = 8  # 脏行数不超过该值时逐行标量计算
+
+    def __init__(self, symbol_map, fees=None, max_age=0.0, window=1000, alpha=0.01, min_samples=100,
+                 entry_z=3.0, exit_z=1.0, min_edge=0.0):
+        self.symbol_map = symbol_map
+        shape = (len(symbol_map.symbols), len(symbol_map.venues))
+        self.bids = np.full(shape, -np.inf)
+        self.asks = np.full(shape, np.inf)
+        self.log_bids = np.full(shape, -np.inf)
+        self.log_asks = np.full(shape, np.inf)
+        self.event_times = np.zeros(shape)
+        self.received_times = np.zeros(shape)
+        self.dirty = np.zeros(shape[0], dtype=bool)
+        self.max_age = max_age
+        # 所有 (卖出列, 买入列) 组合
+        pairs = [(j, k) for j in range(shape[1]) for k in range(shape[1]) if j != k]
+        self.pairs = pairs
+        self.sell_cols = np.array([j for j, _ in pairs], dtype=np.int64)
+        self.buy_cols = np.array([k for _, k in pairs], dtype=np.int64)
+        self.min_edge = min_edge
+        self.stats = SpreadStats(shape[0], len(pairs), window, alpha)
+        self.min_samples = min_samples
+        self.entry_z = entry_z
+        self.exit_z = exit_z
+        self.entry = np.full((shape[0], len(pairs)), np.inf)
+        self.set_fees(fees)
+        self.exit = np.full((shape[0], len(pairs)), -np.inf)
+        self.armed = np.ones((shape[0], len(pairs)), dtype=bool)
+        self.stale_count = 0  # 因过期被作废的报价数
+
+    def set_fees(self, fees):
+        """按 taker 费率重算每个交易对每个方向的手续费下限
+
+        fees 为 {交易所: 费率}（所有交易对相同），或 (交易对, 交易所) 的费率数组（MarketTables.taker）。
+        费率提高时已缓存的入场阈值立即抬高到新的下限，降低时在该交易对下一次统计更新时生效。
+        """
+        if fees is None or isinstance(fees, dict):
+            fees = [(fees or {}).get(venue, 0.0) for venue in self.symbol_map.venues]
+        taker = np.broadcast_to(np.asarray(fees, dtype=float), self.bids.shape)
+        # 卖出得到 bid * (1 - 卖方费率)，买入花费 ask * (1 + 买方费率)，两者相等时的对数价差
+        self.fee_floors = np.log((1 + taker[:, self.buy_cols]) / (1 - taker[:, self.sell_cols]))
+        self.entry_floors = self.fee_floors + self.min_edge
+        np.maximum(self.entry, self.entry_floors, out=self.entry)
+        # 逐行标量路径用 list
+        self.fee_floor_rows = self.fee_floors.tolist()
+        self.entry_floor_rows = self.entry_floors.tolist()
+
+    def update(self, row, col, bid, ask, event_time=0.0, received_time=0.0):
+        if bid is None:
+            self.bids[row, col] = self.log_bids[row, col] = -np.inf
+        else:
+            self.bids[row, col] = bid
+            self.log_bids[row, col] = math.log(bid)
+        if ask is None:
+            self.asks[row, col] = self.log_asks[row, col] = np.inf
+        else:
+            self.asks[row, col] = ask
+            self.log_asks[row, col] = math.log(ask)
+        self.event_times[row, col] = event_time
+        self.received_times[row, col] = received_time
+        self.dirty[row] = True
+
+    def invalidate(self, col, row=None):
+        """行情断开时作废某个交易所（或其中一个交易对）的报价"""
+        rows = slice(None) if row is None else row
+        self.bids[rows, col] = self.log_bids[rows, col] = -np.inf
+        self.asks[rows, col] = self.log_asks[rows, col] = np.inf
+        self.dirty[rows] = True
+
+    def evaluate(self, now=None):
+        """对所有脏行计算各方向的对数价差并更新统计，返回超过入场阈值的 [(行号, 方向, 价差)] 并清除脏标记
+
+        脏行不多时逐行用 Python 标量计算（小数组上每次 numpy 调用的固定开销远大于计算本身），
+        脏行较多时整批向量化计算，两条路径结果相同。阈值用加入本次样本之前的统计计算。
+        """
+        rows = np.flatnonzero(self.dirty)
+        if rows.size == 0:
+            return []
+        self.dirty[:] = False
+        if rows.size > self.SCALAR_ROWS:
+            return self._evaluate_rows(rows, now)
+        hits = []
+        for row in rows.tolist():
+            self._evaluate_row(row, now, hits)
+        return hits
+
+    def _evaluate_row(self, row, now, hits):
+        bids = self.log_bids[row].tolist()
+        asks = self.log_asks[row].tolist()
+        if self.max_age and now is not None:
+            for col, received in enumerate(self.received_times[row].tolist()):
+                if now - received > self.max_age:
+                    if bids[col] != -math.inf:
+                        self.stale_count += 1
+                    bids[col] = -math.inf
+                    asks[col] = math.inf
+        edges = [bids[j] - asks[k] for j, k in self.pairs]
+
+        entry = self.entry[row].tolist()
+        exit_ = self.exit[row].tolist()
+        armed = self.armed[row].tolist()
+        complete = True
+        for d, edge in enumerate(edges):
+            ready = armed[d] or edge < exit_[d]
+            if ready and edge > entry[d]:
+                hits.append((row, d, edge))
+                ready = False
+            armed[d] = ready
+            if edge == -math.inf:
+                complete = False
+        self.armed[row] = armed
+
+        if complete:
+            count, scale, center = self.stats.push_row(row, edges)
+            if count < self.min_samples:
+                return
+            self.entry[row] = [max(floor, c + self.entry_z * s)
+                               for floor, c, s in zip(self.entry_floor_rows[row], center, scale)]
+            self.exit[row] = [c + self.exit_z * s for c, s in zip(center, scale)]
+
+    def _evaluate_rows(self, rows, now):
+        bids = self.log_bids[rows]
+        asks = self.log_asks[rows]
+        if self.max_age and now is not None:
+            stale = now - self.received_times[rows] > self.max_age
+            if stale.any():
+                self.stale_count += int(np.count_nonzero(stale & np.isfinite(bids)))
+                bids = np.where(stale, -np.inf, bids)
+                asks = np.where(stale, np.inf, asks)
+        edges = bids[:, self.sell_cols] - asks[:, self.buy_cols]
+
+        armed = self.armed[rows] | (edges < self.exit[rows])
+        hits = armed & (edges > self.entry[rows])
+        self.armed[rows] = armed & ~hits
+        hit_rows, hit_directions = np.nonzero(hits)
+        result = list(zip(rows[hit_rows].tolist(), hit_directions.tolist(), edges[hit_rows, hit_directions].tolist()))
+
+        complete = np.isfinite(edges).all(axis=1)
+        if not complete.all():
+            rows, edges = rows[complete], edges[complete]
+        if rows.size:
+            counts, scale, center = self.stats.push(rows, edges)
+            ready = counts >= self.min_samples
+            if not ready.all():
+                rows, scale, center = rows[ready], scale[ready], center[ready]
+            self.entry[rows] = np.maximum(self.entry_floors[rows], center + self.entry_z * scale)
+            self.exit[rows] = center + self.exit_z * scale
+        return result
+
+    def opportunities(self, now=None):
+        """返回脏行中超过入场阈值的机会列表（每个交易对取扣费后收益最大的方向），按收益从大到小排序"""
+        hits = self.evaluate(now)
+        if not hits:
+            return []
+        best = {}
+        fee_floors = self.fee_floor_rows
+        for row, d, edge in hits:
+            net = edge - fee_floors[row][d]
+            if row not in best or net > best[row][1]:
+                best[row] = (d, net)
+        symbols = self.symbol_map.symbols
+        venues = self.symbol_map.venues
+        result = []
+        for row, (d, net) in best.items():
+            sell_col, buy_col = self.pairs[d]
+            sell_price = float(self.bids[row, sell_col])
+            buy_price = float(self.asks[row, buy_col])
+            result.append(Opportunity(symbols[row], venues[sell_col], venues[buy_col], sell_price, buy_price,
+                                      sell_price - buy_price, math.expm1(net)))
+        result.sort(key=lambda opportunity: -opportunity.edge)
+        return result
@@ -0,0 +1,82 @@
+# File: quote_table.py
+import numpy as np
+from multiprocessing import shared_memory
+
+# 每个槽位的字段：卖出均价、买入均价、交易所事件时间（秒）、本地接收墙钟时间（秒）、
+# 本地接收 / 解析完成的 perf_counter_ns（同一台机器上各进程共用 CLOCK_MONOTONIC，可以直接相减）
+FIELDS = ('bid', 'ask', 'event_time', 'received_time', 'received_ns', 'parsed_ns')
+BID, ASK, EVENT_TIME, RECEIVED_TIME, RECEIVED_NS, PARSED_NS = range(len(FIELDS))
+
+
+class QuoteTable:
+    """共享内存中的最新报价表，(交易对, 交易所) 每个格子一个槽位，写入方和读取方都不加锁
+
+    每个槽位带一个 seqlock 风格的版本号：写入前版本号加 1（奇数表示正在写），写完字段后再加 1。
+    读取方先复制版本号，再复制字段，最后重新读版本号，两次一致且为偶数才说明读到的是完整的一次写入。
+    每个槽位只允许一个进程写入（按交易所 / 交易对分片保证），所以版本号本身不需要原子自增。
+    写入进程可能在两次写版本号之间退出，留下奇数版本号；下一次写入从奇数开始（不再加 1），
+    写完后仍是一个读取方没见过的偶数，奇偶性不会因此反转。
+
+    依赖 x86 的 TSO 内存序：同一进程的写入按程序顺序对其他进程可见，读取之间也不会重排。
+    在 ARM 等弱内存序的机器上需要在版本号和字段的读写之间加内存屏障。
+
+    name 为 None 时创建新的共享内存块（创建方负责 unlink），否则按名字连接已有的块。
+    缺失的报价与 PriceMatrix 一致，卖出均价为 -inf、买入均价为 inf。
+    """
+
+    def __init__(self, rows, cols, name=None):
+        self.shape = (rows, cols)
+        self.owner = name is None
+        seq_size = rows * cols * 8
+        size = seq_size + rows * cols * len(FIELDS) * 8
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.seq = np.ndarray((rows, cols), dtype=np.uint64, buffer=self.shm.buf)
+        self.data = np.ndarray((rows, cols, len(FIELDS)), dtype=np.float64, buffer=self.shm.buf, offset=seq_size)
+        # 扁平视图，读取时按槽位号批量取值
+        self.flat_seq = self.seq.reshape(-1)
+        self.flat_data = self.data.reshape(-1, len(FIELDS))
+        if self.owner:
+            self.seq[:] = 0
+            self.data[:] = 0.0
+            self.data[..., BID] = -np.inf
+            self.data[..., ASK] = np.inf
+        self.torn = 0  # 读取时遇到写了一半的槽位的次数
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def write(self, row, col, bid, ask, event_time=0.0, received_time=0.0, received_ns=0, parsed_ns=0):
+        """写入一个槽位，bid / ask 为 None 表示该方向没有报价"""
+        seq = int(self.seq[row, col]) | 1  # 上一个写入进程中途退出时版本号已是奇数
+        self.seq[row, col] = seq
+        self.data[row, col] = (-np.inf if bid is None else bid, np.inf if ask is None else ask,
+                               event_time, received_time, received_ns, parsed_ns)
+        self.seq[row, col] = seq + 1
+
+    def read_changed(self, last_seq):
+        """返回自 last_seq 以来写完的槽位 (槽位号数组, 字段数组)，并原地更新 last_seq
+
+        正在写或读取期间被改写的槽位本次跳过，不更新 last_seq：写入方写完后会再次通知，
+        下一次读取时再取，读取方不自旋等待。槽位号 = 行号 * 列数 + 列号。
+        """
+        seq = self.flat_seq.copy()
+        last = last_seq.reshape(-1)
+        slots = np.flatnonzero((seq != last) & (seq & 1 == 0))
+        if not slots.size:
+            return slots, self.flat_data[:0]
+        values = self.flat_data[slots]
+        stable = self.flat_seq[slots] == seq[slots]
+        if not stable.all():
+            self.torn += int(slots.size - np.count_nonzero(stable))
+            slots = slots[stable]
+            values = values[stable]
+        last[slots] = seq[slots]
+        return slots, values
+
+    def close(self):
+        """释放本进程的映射；创建方同时删除共享内存块"""
+        self.seq = self.data = self.flat_seq = self.flat_data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -1,22 +1,350 @@
-from trader import Trader
-from position_manager import PositionManager
-from notification import Notification
+# File: reconciliation.py
+import asyncio
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fills (
+    venue TEXT NOT NULL,
+    id TEXT NOT NULL,
+    order_id TEXT,
+    symbol TEXT NOT NULL,
+    side TEXT NOT NULL,
+    amount REAL NOT NULL,
+    price REAL NOT NULL,
+    cost REAL NOT NULL,
+    fee REAL NOT NULL,            -- 折算为计价币种的手续费
+    timestamp INTEGER NOT NULL,   -- 毫秒
+    pair_id INTEGER,              -- 对应的套利记录，NULL 表示还没有匹配
+    flagged INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (venue, id)
+);
+CREATE INDEX IF NOT EXISTS fills_order ON fills (venue, order_id);
+CREATE INDEX IF NOT EXISTS fills_unmatched ON fills (pair_id, flagged, timestamp);
+
+CREATE TABLE IF NOT EXISTS cursors (
+    venue TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    since INTEGER NOT NULL,       -- 下次 fetch_my_trades 的起始时间（毫秒，含）
+    PRIMARY KEY (venue, symbol)
+);
+
+CREATE TABLE IF NOT EXISTS pairs (
+    id INTEGER PRIMARY KEY,
+    created INTEGER NOT NULL,     -- 毫秒
+    symbol TEXT NOT NULL,
+    status TEXT NOT NULL,
+    sell_venue TEXT NOT NULL,
+    sell_order_id TEXT,
+    buy_venue TEXT NOT NULL,
+    buy_order_id TEXT,
+    pnl REAL NOT NULL,            -- 按下单回报计算的盈亏（计价币种，扣除手续费）
+    exchange_pnl REAL,            -- 按交易所成交记录计算的盈亏
+    issue TEXT,                   -- unhedged / pnl_drift，NULL 表示正常
+    reconciled INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS pairs_pending ON pairs (reconciled, created);
+CREATE INDEX IF NOT EXISTS pairs_sell_order ON pairs (sell_venue, sell_order_id);
+CREATE INDEX IF NOT EXISTS pairs_buy_order ON pairs (buy_venue, buy_order_id);
+
+CREATE TABLE IF NOT EXISTS cycle_legs (
+    created INTEGER NOT NULL,     -- 毫秒
+    venue TEXT NOT NULL,
+    path TEXT NOT NULL,           -- 三角环的货币路径
+    status TEXT NOT NULL,         -- 三角环的执行结果
+    leg INTEGER NOT NULL,
+    symbol TEXT NOT NULL,
+    side TEXT NOT NULL,
+    order_id TEXT
+);
+CREATE INDEX IF NOT EXISTS cycle_legs_order ON cycle_legs (venue, order_id);
+"""
+
+
+def fee_in_quote(fee, symbol, price):
+    """手续费折算为计价币种"""
+    if not fee or not fee.get('cost'):
+        return 0.0
+    if fee.get('currency') == symbol.split('/')[0]:
+        return fee['cost'] * price
+    return fee['cost']
+
+
+class ReconciliationStore:
+    """对账用的本地 SQLite 库：交易所成交、拉取游标和我们记录的套利
+
+    连接只在 Reconciliation 的单线程 executor 里使用，所有方法都是同步的。
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    def cursor_since(self, venue, symbol):
+        row = self.conn.execute('SELECT since FROM cursors WHERE venue = ? AND symbol = ?', (venue, symbol)).fetchone()
+        return row[0] if row else None
+
+    def save_fills(self, venue, symbol, trades, since):
+        """写入一页成交并推进游标，在同一个事务里提交，返回新写入的条数"""
+        rows = []
+        for trade in trades:
+            price = float(trade['price'])
+            rows.append((venue, str(trade['id']), trade.get('order'), trade['symbol'], trade['side'],
+                         float(trade['amount']), price, float(trade.get('cost') or trade['amount'] * price),
+                         fee_in_quote(trade.get('fee'), trade['symbol'], price), int(trade['timestamp'])))
+        with self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany('INSERT OR IGNORE INTO fills (venue, id, order_id, symbol, side, amount, price, cost, '
+                                  'fee, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            inserted = self.conn.total_changes - before
+            self.conn.execute('INSERT OR REPLACE INTO cursors (venue, symbol, since) VALUES (?, ?, ?)',
+                              (venue, symbol, since))
+        return inserted
+
+    def save_pairs(self, pairs):
+        with self.conn:
+            self.conn.executemany('INSERT INTO pairs (created, symbol, status, sell_venue, sell_order_id, buy_venue, '
+                                  'buy_order_id, pnl) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', pairs)
+
+    def save_cycles(self, legs):
+        with self.conn:
+            self.conn.executemany('INSERT INTO cycle_legs (created, venue, path, status, leg, symbol, side, order_id) '
+                                  'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', legs)
+
+    def leg_fills(self, venue, order_id):
+        """一个订单的 (成交数量, 成交金额, 手续费)"""
+        if order_id is None:
+            return 0.0, 0.0, 0.0
+        amount, cost, fee = self.conn.execute(
+            'SELECT TOTAL(amount), TOTAL(cost), TOTAL(fee) FROM fills WHERE venue = ? AND order_id = ?',
+            (venue, order_id)).fetchone()
+        return amount, cost, fee
+
+    def match(self, settled_before, qty_tolerance, pnl_tolerance):
+        """核对创建时间早于 settled_before 的未对账套利，返回 (核对数, 问题列表)"""
+        pending = self.conn.execute(
+            'SELECT id, symbol, status, sell_venue, sell_order_id, buy_venue, buy_order_id, pnl FROM pairs '
+            'WHERE reconciled = 0 AND created < ?', (settled_before,)).fetchall()
+        issues = []
+        updates = []
+        links = []
+        for pair_id, symbol, status, sell_venue, sell_order, buy_venue, buy_order, pnl in pending:
+            sold, proceeds, sell_fee = self.leg_fills(sell_venue, sell_order)
+            bought, cost, buy_fee = self.leg_fills(buy_venue, buy_order)
+            exchange_pnl = proceeds - cost - sell_fee - buy_fee
+            issue = None
+            if abs(sold - bought) > qty_tolerance * max(sold, bought, 1e-12):
+                issue = 'unhedged'
+                issues.append({'pair': pair_id, 'issue': issue, 'symbol': symbol, 'status': status,
+                               'sold': sold, 'bought': bought})
+            elif abs(exchange_pnl - pnl) > pnl_tolerance:
+                issue = 'pnl_drift'
+                issues.append({'pair': pair_id, 'issue': issue, 'symbol': symbol, 'pnl': pnl,
+                               'exchange_pnl': exchange_pnl})
+            updates.append((exchange_pnl, issue, pair_id))
+            links.extend(((pair_id, sell_venue, sell_order), (pair_id, buy_venue, buy_order)))
+        with self.conn:
+            self.conn.executemany('UPDATE pairs SET exchange_pnl = ?, issue = ?, reconciled = 1 WHERE id = ?', updates)
+            self.conn.executemany('UPDATE fills SET pair_id = ? WHERE venue = ? AND order_id = ?', links)
+        return len(pending), issues
+
+    def orphans(self, settled_before):
+        """早于 settled_before、不属于任何套利记录或三角环的成交（手动交易或丢失的订单），返回后标记为已报告"""
+        rows = self.conn.execute(
+            'SELECT venue, id, order_id, symbol, side, amount, price, timestamp FROM fills '
+            'WHERE pair_id IS NULL AND flagged = 0 AND timestamp < ? '
+            'AND NOT EXISTS (SELECT 1 FROM pairs WHERE (sell_venue = fills.venue AND sell_order_id = fills.order_id) '
+            'OR (buy_venue = fills.venue AND buy_order_id = fills.order_id)) '
+            'AND NOT EXISTS (SELECT 1 FROM cycle_legs WHERE venue = fills.venue AND order_id = fills.order_id)',
+            (settled_before,)).fetchall()
+        with self.conn:
+            self.conn.executemany('UPDATE fills SET flagged = 1 WHERE venue = ? AND id = ?',
+                                  [(row[0], row[1]) for row in rows])
+        keys = ('venue', 'id', 'order', 'symbol', 'side', 'amount', 'price', 'timestamp')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def close(self):
+        self.conn.close()
+
 
 class Reconciliation:
-    def __init__(self):
-        self.trader = Trader()
-        self.position_manager = PositionManager()
-        self.notification = Notification()
-
-    def verify_trade(self, action):
-        # 验证交易是否成功
-        if action == "sell_binance_buy_okx":
-            binance_balance = self.position_manager.get_balance("binance")
-            okx_balance = self.position_manager.get_balance("okx")
-            if binance_balance < 0 or okx_balance < 0:
-                self.notification.send_telegram("Trade verification failed! Please check manually.")
-                self.hedge_position()
-
-    def hedge_position(self):
-        # 自动对冲仓位
-        self.trader.execute_trade("buy_binance_sell_okx")
\ No newline at end of file
+    """与交易所成交记录对账
+
+    交易路径上只调用 record_pair / record_cycle，把套利结果追加到内存列表。后台任务每 interval 秒：
+    1. 并发地按 (交易所, 交易对) 用 fetch_my_trades 从上次的游标开始分页拉取成交（OKX 从新到旧往回翻页），
+       写入本地 SQLite 并推进游标，重启后不会重新下载历史
+    2. 把累积的套利记录写入库中，超过 settle_delay 的套利按订单号汇总两条腿的成交：
+       成交数量不一致为 unhedged，按成交记录算出的盈亏与下单回报偏差过大为 pnl_drift
+    3. 不属于任何套利记录、也不是三角环订单的成交报告为 orphaned
+    SQLite 操作都在单独的线程里执行，不阻塞事件循环。
+    """
+
+    def __init__(self, exchanges, notifier=None, symbols=None, path=None, interval=None):
+        self.exchanges = exchanges
+        self.notifier = notifier
+        self.symbols = symbols or Config.SYMBOLS
+        self.interval = interval or Config.RECON_INTERVAL
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix='reconciliation')
+        self.store = ReconciliationStore(path or Config.RECON_DB)
+        self.pending_pairs = []
+        self.pending_cycles = []
+        self.task = None
+
+    def record_pair(self, symbol, result):
+        """记录一次发出了订单的套利（交易路径上只做 list append）"""
+        if result is not None and result.status != 'rejected':
+            self.pending_pairs.append((int(time.time() * 1000), symbol, result))
+
+    def record_cycle(self, triangle, result):
+        """记录一次发出了订单的三角环，各条腿的订单号用于排除 orphaned（交易路径上只做 list append）"""
+        if result is not None and result.status != 'rejected':
+            self.pending_cycles.append((int(time.time() * 1000), triangle, result))
+
+    @staticmethod
+    def _cycle_rows(created, triangle, result):
+        path = '>'.join(triangle.path)
+        return [(created, leg.exchange, path, result.status, i, symbol, leg.side, (leg.order or {}).get('id'))
+                for i, ((symbol, _, _), leg) in enumerate(zip(triangle.legs, result.legs))]
+
+    def _pair_row(self, created, symbol, result):
+        legs = []
+        pnl = 0.0
+        for leg in (result.sell_leg, result.buy_leg):
+            order = leg.order or {}
+            filled = order.get('filled') or 0.0
+            price = order.get('average') or order.get('price') or 0.0
+            cost = order.get('cost') or filled * price
+            pnl += (cost if leg.side == 'sell' else -cost) - fee_in_quote(order.get('fee'), symbol, price)
+            legs.append((leg.exchange, order.get('id')))
+        (sell_venue, sell_order), (buy_venue, buy_order) = legs
+        return created, symbol, result.status, sell_venue, sell_order, buy_venue, buy_order, pnl
+
+    async def _db(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def fetch_fills(self, venue, symbol):
+        """从游标开始分页拉取一个交易对的成交，返回新写入的条数"""
+        exchange = self.exchanges[venue]
+        since = await self._db(self.store.cursor_since, venue, symbol)
+        if since is None:
+            since = int((time.time() - Config.RECON_START_LOOKBACK) * 1000)
+        limit = Config.RECON_PAGE_LIMITS.get(venue, 100)
+        if venue in Config.RECON_NEWEST_FIRST:
+            return await self.fetch_fills_backward(venue, symbol, since, limit)
+        inserted = 0
+        while True:
+            trades = await exchange.fetch_my_trades(symbol, since, limit)
+            if not trades:
+                break
+            # since 是包含的，下一页从最后一笔的时间戳开始，重复的成交按主键去重；
+            # 一整页都是同一毫秒时只能跳过这一毫秒
+            full = len(trades) >= limit
+            last = max(trade['timestamp'] for trade in trades)
+            next_since = last
+            if full and last <= since:
+                logger.warning(f"{venue} {symbol}: {len(trades)} fills at {since}ms fill a whole page, skipping ahead")
+                next_since = since + 1
+            inserted += await self._db(self.store.save_fills, venue, symbol, trades, next_since)
+            if not full:
+                break
+            since = next_since
+        return inserted
+
+    async def fetch_fills_backward(self, venue, symbol, since, limit):
+        """从新到旧翻页的交易所（OKX）：带 since 时返回的是窗口内最新的一页，用最旧一笔的 billId（after）
+        继续往回翻，直到不满一页。全部翻完后才一次性写入并把游标推进到最新一笔，中途失败时游标不动，
+        下一轮重新拉取，重复的成交按主键去重"""
+        exchange = self.exchanges[venue]
+        fills = []
+        params = {}
+        while True:
+            trades = await exchange.fetch_my_trades(symbol, since, limit, params)
+            fills.extend(trades)
+            if len(trades) < limit:
+                break
+            oldest = min(trades, key=lambda trade: int(trade['info']['billId']))
+            params = {'after': oldest['info']['billId']}
+        if not fills:
+            return 0
+        newest = max(trade['timestamp'] for trade in fills)
+        return await self._db(self.store.save_fills, venue, symbol, fills, max(newest, since))
+
+    async def run_once(self):
+        """执行一轮对账，返回报告"""
+        jobs = [(venue, symbol) for venue in self.exchanges for symbol in self.symbols]
+        results = await asyncio.gather(*(self.fetch_fills(venue, symbol) for venue, symbol in jobs),
+                                       return_exceptions=True)
+        fetched = 0
+        for (venue, symbol), result in zip(jobs, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to fetch fills for {symbol} on {venue}: {result}")
+            else:
+                fetched += result
+
+        pairs, self.pending_pairs = self.pending_pairs, []
+        if pairs:
+            await self._db(self.store.save_pairs, [self._pair_row(*pair) for pair in pairs])
+        cycles, self.pending_cycles = self.pending_cycles, []
+        if cycles:
+            await self._db(self.store.save_cycles, [row for cycle in cycles for row in self._cycle_rows(*cycle)])
+        settled_before = int((time.time() - Config.RECON_SETTLE_DELAY) * 1000)
+        checked, issues = await self._db(self.store.match, settled_before, Config.RECON_QTY_TOLERANCE,
+                                         Config.RECON_PNL_TOLERANCE)
+        orphaned = await self._db(self.store.orphans, settled_before)
+
+        report = {
+            'fetched': fetched,
+            'checked': checked,
+            'unhedged': [issue for issue in issues if issue['issue'] == 'unhedged'],
+            'pnl_drift': [issue for issue in issues if issue['issue'] == 'pnl_drift'],
+            'orphaned': orphaned,
+        }
+        logger.info(f"Reconciliation: fetched {fetched} fills, checked {checked} pairs, "
+                    f"{len(report['unhedged'])} unhedged, {len(report['pnl_drift'])} PnL drift, "
+                    f"{len(orphaned)} orphaned fills")
+        if issues or orphaned:
+            self.alert(report)
+        return report
+
+    def alert(self, report):
+        lines = [f"Reconciliation found {len(report['unhedged'])} unhedged pairs, "
+                 f"{len(report['pnl_drift'])} PnL drifts, {len(report['orphaned'])} orphaned fills"]
+        for issue in report['unhedged'][:10]:
+            lines.append(f"unhedged pair {issue['pair']} {issue['symbol']}: sold {issue['sold']} bought {issue['bought']}")
+        for issue in report['pnl_drift'][:10]:
+            lines.append(f"PnL drift pair {issue['pair']} {issue['symbol']}: recorded {issue['pnl']:.4f} "
+                         f"exchange {issue['exchange_pnl']:.4f}")
+        for fill in report['orphaned'][:10]:
+            lines.append(f"orphaned fill {fill['venue']} {fill['id']} order {fill['order']} {fill['symbol']} "
+                         f"{fill['side']} {fill['amount']}@{fill['price']}")
+        msg = '\n'.join(lines)
+        logger.warning(msg)
+        if self.notifier is not None:
+            self.notifier.send_alert(msg)
+
+    async def run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Reconciliation failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+        return self.task
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+        await self._db(self.store.close)
+        self.executor.shutdown()
@@ -0,0 +1,99 @@
+# File: recorder.py
+import logging
+import mmap
+import os
+import struct
+import time
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'TBFRAME1'
+# 每条记录的头部：接收时间（time.time_ns）、来源编号、负载长度
+RECORD_HEADER = struct.Struct('<qBI')
+
+# 来源编号，写入文件后不能再改
+SOURCES = {
+    'binance': 0,
+    'okx': 1,
+    'binance_snapshot': 2,  # Binance REST 深度快照，回放时用来对齐增量流
+}
+SOURCE_NAMES = {code: name for name, code in SOURCES.items()}
+
+
+class FrameRecorder:
+    """把收到的原始 websocket 帧追加写入紧凑的二进制日志，按大小滚动文件
+
+    文件格式：8 字节魔数，之后是连续的 (头部, 负载) 记录。写入走带缓冲的文件对象，
+    每帧只有一次 struct.pack 和一次内存拷贝，不在接收路径上做格式化或刷盘。
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, buffer_size=1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.buffer_size = buffer_size
+        self.file = None
+        self.path = None
+        self.size = 0
+        self.sequence = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _open(self):
+        self.sequence += 1
+        name = time.strftime('frames-%Y%m%d-%H%M%S') + f"-{self.sequence:04d}.bin"
+        self.path = os.path.join(self.directory, name)
+        self.file = open(self.path, 'ab', buffering=self.buffer_size)
+        self.file.write(MAGIC)
+        self.size = len(MAGIC)
+        logger.info(f"Recording market data to {self.path}")
+
+    def record(self, source, payload, received_ns=None):
+        """记录一帧；payload 可以是 str 或 bytes"""
+        if isinstance(payload, str):
+            payload = payload.encode()
+        if self.file is None or self.size >= self.max_bytes:
+            self.rotate()
+        header = RECORD_HEADER.pack(received_ns or time.time_ns(), SOURCES[source], len(payload))
+        self.file.write(header)
+        self.file.write(payload)
+        self.size += RECORD_HEADER.size + len(payload)
+
+    def rotate(self):
+        if self.file is not None:
+            self.file.close()
+        self._open()
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class FrameReader:
+    """用 mmap 顺序读取 FrameRecorder 写出的文件，逐条产出 (接收时间 ns, 来源名, 负载 bytes)"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size <= len(MAGIC):
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if data[:len(MAGIC)] != MAGIC:
+                    raise ValueError(f"{self.path} is not a frame log")
+                offset = len(MAGIC)
+                end = len(data)
+                unpack = RECORD_HEADER.unpack_from
+                header_size = RECORD_HEADER.size
+                while offset + header_size <= end:
+                    received_ns, source, length = unpack(data, offset)
+                    offset += header_size
+                    if offset + length > end:
+                        logger.warning(f"Truncated record at end of {self.path}")
+                        return
+                    yield received_ns, SOURCE_NAMES[source], data[offset:offset + length]
+                    offset += length
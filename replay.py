@@ -0,0 +1,177 @@
+# File: replay.py
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import time
+from arbitrage import ArbitrageEngine
+from config import Config
+from data_collector import PriceCollector
+from latency import LatencyTracker
+from recorder import FrameReader
+from risk_control import RiskEngine
+from trader import CycleResult, LegResult, PairResult
+
+logger = logging.getLogger(__name__)
+
+
+class SimulatedTrader:
+    """回放用的模拟交易模块：按机会给出的预计成交价立即成交，按 taker 费率扣除手续费"""
+
+    def __init__(self, fees=None):
+        self.exchanges = {}
+        self.fees = fees or Config.TAKER_FEES
+        self.trades = []
+        self.pnl = 0.0
+
+    async def execute_pair(self, sell_ex, buy_ex, symbol=Config.SYMBOL, quantity=Config.QUANTITY,
+                           sell_price=None, buy_price=None, trace=None, on_send=None):
+        if trace is not None:
+            for venue in (sell_ex, buy_ex):
+                for stage in ('order_sent', 'exchange_ack', 'fill_confirmed'):
+                    trace.mark(venue, stage)
+        fee = (sell_price * self.fees.get(sell_ex, 0.0) + buy_price * self.fees.get(buy_ex, 0.0)) * quantity
+        pnl = (sell_price - buy_price) * quantity - fee
+        self.pnl += pnl
+        self.trades.append({'symbol': symbol, 'sell_exchange': sell_ex, 'buy_exchange': buy_ex,
+                            'sell_price': sell_price, 'buy_price': buy_price, 'quantity': quantity,
+                            'fee': fee, 'pnl': pnl})
+        quote = symbol.split('/')[1]
+        sell_order = {'price': sell_price, 'filled': quantity, 'status': 'closed',
+                      'fee': {'cost': sell_price * quantity * self.fees.get(sell_ex, 0.0), 'currency': quote}}
+        buy_order = {'price': buy_price, 'filled': quantity, 'status': 'closed',
+                     'fee': {'cost': buy_price * quantity * self.fees.get(buy_ex, 0.0), 'currency': quote}}
+        return PairResult('filled', LegResult(sell_ex, 'sell', sell_order, filled=True),
+                          LegResult(buy_ex, 'buy', buy_order, filled=True))
+
+    async def execute_cycle(self, venue, legs, quantity, trace=None, on_send=None):
+        """三角环按预计成交价依次成交；收益以起始货币计，不计入按计价币种汇总的 pnl"""
+        fee = self.fees.get(venue, 0.0)
+        amount = quantity
+        filled_legs = []
+        for i, (symbol, side, price) in enumerate(legs):
+            if i:
+                amount = holding if side == 'sell' else holding / price
+            holding = (amount * price if side == 'sell' else amount) * (1 - fee)
+            filled_legs.append(LegResult(venue, side, {'price': price, 'filled': amount, 'status': 'closed'},
+                                         filled=True, amount=amount))
+        start = quantity * legs[0][2] if legs[0][1] == 'buy' else quantity
+        self.trades.append({'venue': venue, 'path': [symbol for symbol, _, _ in legs], 'quantity': quantity,
+                            'return': holding / start - 1})
+        return CycleResult('filled', filled_legs)
+
+
+class ReplayDriver:
+    """把录制的原始帧按顺序喂给 PriceCollector
+
+    speed 为 None 时尽可能快地回放；否则按录制时的时间间隔除以 speed 回放（N 倍速）。
+    """
+
+    def __init__(self, collector, engine, paths, speed=None):
+        self.collector = collector
+        self.engine = engine
+        self.paths = paths
+        self.speed = speed
+        collector.fetch_snapshots = False
+        self.now = 0.0
+        collector.clock = lambda: self.now  # 报价年龄按录制时间计算
+
+    async def run(self):
+        collector = self.collector
+        decision_task = asyncio.create_task(self.engine.run())
+        handlers = {
+            'binance': collector.on_binance_frame,
+            'okx': collector.on_okx_frame,
+            'binance_snapshot': lambda payload, received_ns: collector.on_binance_snapshot(json.loads(payload)),
+        }
+        frames = 0
+        payload_bytes = 0
+        first_ns = None
+        last_ns = None
+        start = time.perf_counter()
+
+        for path in self.paths:
+            for received_ns, source, payload in FrameReader(path):
+                if first_ns is None:
+                    first_ns = received_ns
+                last_ns = received_ns
+                self.now = received_ns / 1e9
+                if self.speed:
+                    delay = start + (received_ns - first_ns) / 1e9 / self.speed - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                try:
+                    handlers[source](payload, received_ns)
+                except Exception as e:
+                    logger.error(f"Failed to replay {source} frame: {e}")
+                frames += 1
+                payload_bytes += len(payload)
+                # 每帧让出一次事件循环，相当于每帧单独到达；决策任务和模拟成交在这里运行
+                await asyncio.sleep(0)
+
+        await asyncio.sleep(0)
+        decision_task.cancel()
+        await self.engine.drain()
+        elapsed = time.perf_counter() - start
+        recorded = (last_ns - first_ns) / 1e9 if first_ns is not None else 0.0
+        return {
+            'frames': frames,
+            'bytes': payload_bytes,
+            'elapsed': elapsed,
+            'recorded_span': recorded,
+            'frames_per_sec': frames / elapsed if elapsed else 0.0,
+            'speedup': recorded / elapsed if elapsed else 0.0,
+            'ticks': collector.tick_count,
+            'evaluations': self.engine.evaluation_count,
+            'opportunities': self.engine.opportunity_count,
+            'skipped_in_flight': self.engine.skipped_count,
+            'risk_rejected': self.engine.rejected_count,
+        }
+
+
+async def replay(paths, speed=None, symbols=None):
+    trader = SimulatedTrader()
+    latency = LatencyTracker()
+    collector = PriceCollector(trader, symbols=symbols, latency=latency)
+    risk = RiskEngine()
+    engine = ArbitrageEngine(collector, trader, latency, risk)
+    stats = await ReplayDriver(collector, engine, paths, speed).run()
+    stats['trades'] = len(trader.trades)
+    stats['pnl'] = trader.pnl
+    stats['risk'] = risk.snapshot()
+    stats['latency'] = latency.snapshot()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded market data through the arbitrage pipeline')
+    parser.add_argument('paths', nargs='+', help='frame log files or glob patterns')
+    parser.add_argument('--speed', type=float, default=None, help='replay at N x wall-clock speed (default: as fast as possible)')
+    parser.add_argument('--symbols', default=None, help='comma separated symbols (default: Config.SYMBOLS)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    paths = sorted(path for pattern in args.paths for path in glob.glob(pattern))
+    symbols = args.symbols.split(',') if args.symbols else None
+    stats = asyncio.run(replay(paths, args.speed, symbols))
+
+    print(f"files:          {len(paths)}")
+    print(f"frames:         {stats['frames']} ({stats['bytes'] / 1e6:.1f} MB)")
+    print(f"recorded span:  {stats['recorded_span']:.1f}s")
+    print(f"replay time:    {stats['elapsed']:.2f}s ({stats['speedup']:.0f}x)")
+    print(f"throughput:     {stats['frames_per_sec']:,.0f} frames/s")
+    print(f"quote ticks:    {stats['ticks']} (evaluated {stats['evaluations']} times)")
+    print(f"opportunities:  {stats['opportunities']} ({stats['skipped_in_flight']} skipped while in flight)")
+    print(f"trades:         {stats['trades']}")
+    print(f"simulated PnL:  {stats['pnl']:.4f}")
+    print(f"risk rejected:  {stats['risk_rejected']} {stats['risk']['rejections']}")
+    for venue, stages in stats['latency']['stages'].items():
+        for stage in ('parsed', 'decision', 'tick_to_order'):
+            summary = stages.get(stage)
+            if summary and summary['count']:
+                print(f"{venue:<8} {stage:<14} p50={summary['p50']}us p99={summary['p99']}us max={summary['max']}us")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,317 @@
+import logging
 import time
 from config import Config
 
-class RiskControl:
-    def __init__(self):
-        self.last_trade_time = 0
-        self.max_loss = -100  # 最大允许亏损金额（以 USDT 计）
+logger = logging.getLogger(__name__)
 
-    def can_trade(self):
-        current_time = time.time()
-        if current_time - self.last_trade_time >= 60:  # 60秒内只能交易一次
-            self.last_trade_time = current_time
-            return True
+
+def leg_flow(symbol, side, order):
+    """一条腿实际付出和得到的货币数量，返回 (付出币种, 数量, 得到币种, 数量)，同币种的手续费计入对应一侧"""
+    base, quote = symbol.split('/')
+    filled = order.get('filled') or 0.0
+    cost = order.get('cost') or filled * (order.get('average') or order.get('price') or 0.0)
+    if side == 'buy':
+        spent_currency, spent, received_currency, received = quote, cost, base, filled
+    else:
+        spent_currency, spent, received_currency, received = base, filled, quote, cost
+    fee = order.get('fee') or {}
+    if fee.get('cost'):
+        if fee.get('currency') == received_currency:
+            received -= fee['cost']
+        elif fee.get('currency') == spent_currency:
+            spent += fee['cost']
+    return spent_currency, spent, received_currency, received
+
+
+class RiskEngine:
+    """内存中的下单前风控
+
+    所有状态都由成交增量更新，can_trade 只做 dict 查找和算术，不访问交易所：
+    - 已实现 / 未实现盈亏：按交易对汇总所有交易所的净持仓，平均成本法计算；
+      亏损达到 max_loss 时自动触发总开关
+    - 各交易所各交易对的库存变化（相对启动时），防止单向套利把某个交易所的币或资金耗尽
+    - 各交易所未完成订单的名义金额
+    - 各交易对的净敞口：按任一条腿失败时的最坏情况检查
+    - 熔断：同一交易所连续 max_consecutive_failures 条腿失败后暂停 breaker_cooldown 秒，
+      恢复后再失败一次立即重新熔断
+    金额都以 currency（默认 Config.RISK_CURRENCY）计：持仓和平均成本保留交易对自己的计价币种，
+    名义金额、敞口和盈亏按 计价币种/currency（或 currency/计价币种）的最新标记价折算，
+    没有可用的标记价时 can_trade 拒绝该交易对。
+    """
+
+    def __init__(self, notifier=None, max_loss=None, max_symbol_exposure=None, symbol_exposure_limits=None,
+                 max_venue_inventory=None, max_open_notional=None, max_consecutive_failures=None,
+                 breaker_cooldown=None, currency=None):
+        self.notifier = notifier
+        self.currency = currency or Config.RISK_CURRENCY
+        self.max_loss = Config.RISK_MAX_LOSS if max_loss is None else max_loss
+        self.max_symbol_exposure = Config.RISK_MAX_SYMBOL_EXPOSURE if max_symbol_exposure is None else max_symbol_exposure
+        self.symbol_exposure_limits = Config.RISK_SYMBOL_EXPOSURE_LIMITS if symbol_exposure_limits is None else symbol_exposure_limits
+        self.max_venue_inventory = Config.RISK_MAX_VENUE_INVENTORY if max_venue_inventory is None else max_venue_inventory
+        self.max_open_notional = Config.RISK_MAX_OPEN_NOTIONAL if max_open_notional is None else max_open_notional
+        self.max_consecutive_failures = max_consecutive_failures or Config.RISK_MAX_CONSECUTIVE_FAILURES
+        self.breaker_cooldown = Config.RISK_BREAKER_COOLDOWN if breaker_cooldown is None else breaker_cooldown
+
+        self.positions = {}      # symbol -> [净持仓, 平均成本]
+        self.inventory = {}      # (venue, symbol) -> 相对启动时的基础币数量变化
+        self.open_notional = {}  # venue -> 未完成订单的名义金额
+        self.marks = {}          # symbol -> 最新中间价
+        self.quotes = {}         # symbol -> 计价币种
+        self.unrealized = {}     # symbol -> 未实现盈亏
+        self.realized_pnl = 0.0
+        self.unrealized_pnl = 0.0
+        self.failures = {}       # venue -> 连续失败的腿数
+        self.breaker_until = {}  # venue -> 熔断结束的 monotonic 时间
+        self.killed = False
+        self.kill_reason = None
+        self.last_reason = None
+        self.rejections = {}     # 拒绝原因 -> 次数
+
+    @property
+    def total_pnl(self):
+        return self.realized_pnl + self.unrealized_pnl
+
+    def rate(self, currency):
+        """1 单位 currency 折合多少风控货币，没有标记价时返回 None"""
+        if currency == self.currency:
+            return 1.0
+        mark = self.marks.get(f"{currency}/{self.currency}")
+        if mark:
+            return mark
+        mark = self.marks.get(f"{self.currency}/{currency}")
+        return 1.0 / mark if mark else None
+
+    def quote_rate(self, symbol):
+        """交易对计价币种的折算汇率"""
+        quote = self.quotes.get(symbol)
+        if quote is None:
+            quote = self.quotes[symbol] = symbol.split('/')[1]
+        return 1.0 if quote == self.currency else self.rate(quote)
+
+    def _reject(self, key, reason):
+        self.last_reason = reason
+        self.rejections[key] = self.rejections.get(key, 0) + 1
         return False
 
-    def check_loss(self, pnl):
-        if pnl <= self.max_loss:
-            return False
-        return True
\ No newline at end of file
+    def can_trade(self, opportunity, quantity):
+        """下单前检查，不通过时返回 False，原因记录在 last_reason"""
+        if self.killed:
+            return self._reject('killed', f"kill switch: {self.kill_reason}")
+
+        sell_ex, buy_ex = opportunity.sell_ex, opportunity.buy_ex
+        breaker_until = self.breaker_until
+        if breaker_until:
+            now = time.monotonic()
+            if breaker_until.get(sell_ex, 0.0) > now:
+                return self._reject('circuit_breaker', f"circuit breaker open on {sell_ex}")
+            if breaker_until.get(buy_ex, 0.0) > now:
+                return self._reject('circuit_breaker', f"circuit breaker open on {buy_ex}")
+
+        symbol = opportunity.symbol
+        sell_price, buy_price = opportunity.sell_price, opportunity.buy_price
+        self.mark(symbol, (sell_price + buy_price) * 0.5)
+        if self.realized_pnl + self.unrealized_pnl <= -self.max_loss:
+            reason = f"loss limit reached: pnl {self.total_pnl:.2f}"
+            self.kill(reason)
+            return self._reject('max_loss', reason)
+        rate = self.quote_rate(symbol)
+        if rate is None:
+            return self._reject('no_rate', f"no {self.quotes[symbol]}/{self.currency} mark to value {symbol}")
+
+        sell_price *= rate
+        buy_price *= rate
+        sell_notional = quantity * sell_price
+        buy_notional = quantity * buy_price
+        open_notional = self.open_notional
+        if open_notional.get(sell_ex, 0.0) + sell_notional > self.max_open_notional:
+            return self._reject('open_notional', f"open notional limit on {sell_ex}")
+        if open_notional.get(buy_ex, 0.0) + buy_notional > self.max_open_notional:
+            return self._reject('open_notional', f"open notional limit on {buy_ex}")
+
+        # 任一条腿失败时留下的单边敞口
+        position = self.positions.get(symbol)
+        net = position[0] if position is not None else 0.0
+        limit = self.symbol_exposure_limits.get(symbol, self.max_symbol_exposure)
+        if (abs(net) + quantity) * buy_price > limit:
+            return self._reject('symbol_exposure', f"{symbol} exposure limit")
+
+        inventory = self.inventory
+        if abs(inventory.get((sell_ex, symbol), 0.0) - quantity) * sell_price > self.max_venue_inventory:
+            return self._reject('venue_inventory', f"{symbol} inventory limit on {sell_ex}")
+        if abs(inventory.get((buy_ex, symbol), 0.0) + quantity) * buy_price > self.max_venue_inventory:
+            return self._reject('venue_inventory', f"{symbol} inventory limit on {buy_ex}")
+        return True
+
+    def can_trade_venue(self, venue):
+        """单交易所三角套利的下单前检查：总开关、亏损上限和该交易所的熔断；敞口按交易对计，不适用于三角环"""
+        if self.killed:
+            return self._reject('killed', f"kill switch: {self.kill_reason}")
+        if self.realized_pnl + self.unrealized_pnl <= -self.max_loss:
+            reason = f"loss limit reached: pnl {self.total_pnl:.2f}"
+            self.kill(reason)
+            return self._reject('max_loss', reason)
+        if self.breaker_until.get(venue, 0.0) > time.monotonic():
+            return self._reject('circuit_breaker', f"circuit breaker open on {venue}")
+        return True
+
+    def open_pair(self, opportunity, quantity):
+        """通过检查后、发出订单前调用，计入未完成订单金额；返回交给 close_pair 的凭据"""
+        rate = self.quote_rate(opportunity.symbol) or 0.0
+        legs = ((opportunity.sell_ex, quantity * opportunity.sell_price * rate),
+                (opportunity.buy_ex, quantity * opportunity.buy_price * rate))
+        for venue, notional in legs:
+            self.open_notional[venue] = self.open_notional.get(venue, 0.0) + notional
+        return opportunity.symbol, legs
+
+    def close_pair(self, ticket, result=None):
+        """套利结束后调用：释放未完成订单金额，按两条腿的订单记入成交并更新熔断状态"""
+        symbol, legs = ticket
+        for venue, notional in legs:
+            self.open_notional[venue] = max(self.open_notional.get(venue, 0.0) - notional, 0.0)
+        if result is None:
+            return
+        for leg in (result.sell_leg, result.buy_leg):
+            if leg is None:
+                continue
+            order = leg.order or {}
+            filled = order.get('filled') or 0.0
+            if filled:
+                price = order.get('average') or order.get('price') or 0.0
+                self.on_fill(leg.exchange, symbol, leg.side, filled, price, self._fee_cost(order, symbol, price))
+            self.on_leg(leg.exchange, leg.filled and not leg.partial)
+
+    def close_cycle(self, legs, result=None):
+        """三角套利结束后调用：记入盈亏和停留的库存，按发出了订单的腿更新熔断状态
+
+        legs 为三角环的 ((交易对, 方向, 预计成交价), ...)，先把各条腿的预计成交价记为标记价，
+        中间货币据此折算成风控货币。完整的环不改变持仓，最后一条腿得到的起始货币减去第一条腿付出的
+        起始货币（含手续费和滑点）折算后记入已实现盈亏；partial 时资金停留在中间货币，把有成交的腿
+        按各自的交易对记入成交，停留的库存由此计入净敞口、库存和盈亏。
+        因低于最小数量或金额而没有发出的腿不计入熔断。
+        """
+        if result is None:
+            return
+        for symbol, _, price in legs:
+            self.mark(symbol, price)
+        if result.status == 'filled':
+            first, last = result.legs[0], result.legs[-1]
+            currency, spent, _, _ = leg_flow(legs[0][0], first.side, first.order or {})
+            _, _, received_currency, received = leg_flow(legs[-1][0], last.side, last.order or {})
+            rate = self.rate(currency)
+            if received_currency != currency or rate is None:
+                logger.error(f"Cannot value triangle PnL: {spent} {currency} -> {received} {received_currency}")
+            else:
+                self.realized_pnl += (received - spent) * rate
+        for (symbol, _, _), leg in zip(legs, result.legs):
+            order = leg.order or {}
+            filled = order.get('filled') or 0.0
+            if result.status == 'partial' and filled:
+                price = order.get('average') or order.get('price') or 0.0
+                self.on_fill(leg.exchange, symbol, leg.side, filled, price, self._fee_cost(order, symbol, price))
+            if leg.amount:  # amount 为 0 的腿没有发出订单
+                self.on_leg(leg.exchange, leg.filled and not leg.partial)
+
+    @staticmethod
+    def _fee_cost(order, symbol, price):
+        """订单手续费折算为计价币种"""
+        fee = order.get('fee')
+        if not fee or not fee.get('cost'):
+            return 0.0
+        if fee.get('currency') == symbol.split('/')[0]:
+            return fee['cost'] * price
+        return fee['cost']
+
+    def on_fill(self, venue, symbol, side, amount, price, fee=0.0):
+        """记入一笔成交：更新库存、净持仓、平均成本和已实现盈亏（price、fee 为计价币种金额，盈亏折算后累计）"""
+        signed = amount if side == 'buy' else -amount
+        key = (venue, symbol)
+        self.inventory[key] = self.inventory.get(key, 0.0) + signed
+
+        position = self.positions.get(symbol)
+        if position is None:
+            position = self.positions[symbol] = [0.0, 0.0]
+        qty, cost = position
+        realized = -fee
+        new_qty = qty + signed
+        if qty == 0 or (qty > 0) == (signed > 0):
+            # 加仓
+            position[1] = (cost * abs(qty) + price * amount) / abs(new_qty)
+        else:
+            # 减仓或反手
+            closed = min(amount, abs(qty))
+            realized += closed * (price - cost) * (1.0 if qty > 0 else -1.0)
+            if abs(new_qty) < 1e-12:
+                new_qty = 0.0
+                position[1] = 0.0
+            elif (new_qty > 0) != (qty > 0):
+                position[1] = price
+        position[0] = new_qty
+        rate = self.quote_rate(symbol)
+        if rate is None:
+            logger.error(f"No {self.quotes[symbol]}/{self.currency} mark, {symbol} fill PnL {realized} not counted")
+        else:
+            self.realized_pnl += realized * rate
+        mark = self.marks.get(symbol)
+        self.mark(symbol, price if mark is None else mark)
+
+    def mark(self, symbol, price):
+        """更新中间价并增量重算该交易对的未实现盈亏（按此时计价币种的汇率折算）"""
+        self.marks[symbol] = price
+        position = self.positions.get(symbol)
+        if position is None:
+            return
+        rate = self.quote_rate(symbol)
+        if rate is None:
+            return
+        value = position[0] * (price - position[1]) * rate
+        self.unrealized_pnl += value - self.unrealized.get(symbol, 0.0)
+        self.unrealized[symbol] = value
+
+    def on_leg(self, venue, ok):
+        """记录一条腿的结果，连续失败达到上限时熔断该交易所"""
+        if ok:
+            self.failures[venue] = 0
+            return
+        failures = self.failures.get(venue, 0) + 1
+        if failures < self.max_consecutive_failures:
+            self.failures[venue] = failures
+            return
+        self.breaker_until[venue] = time.monotonic() + self.breaker_cooldown
+        # 熔断结束后处于半开状态：再失败一次立即重新熔断
+        self.failures[venue] = self.max_consecutive_failures - 1
+        msg = f"Circuit breaker opened on {venue} after {failures} failed legs, pausing {self.breaker_cooldown:.0f}s"
+        logger.error(msg)
+        if self.notifier is not None:
+            self.notifier.send_alert(msg)
+
+    def kill(self, reason='manual'):
+        """总开关：停止所有新的套利，已发出的订单不受影响"""
+        if self.killed:
+            return
+        self.killed = True
+        self.kill_reason = reason
+        msg = f"Kill switch engaged: {reason}"
+        logger.critical(msg)
+        if self.notifier is not None:
+            self.notifier.send_alert(msg)
+
+    def resume(self):
+        self.killed = False
+        self.kill_reason = None
+        self.breaker_until.clear()
+        self.failures.clear()
+        logger.warning("Kill switch released, trading resumed")
+
+    def snapshot(self):
+        return {
+            'killed': self.killed,
+            'kill_reason': self.kill_reason,
+            'realized_pnl': self.realized_pnl,
+            'unrealized_pnl': self.unrealized_pnl,
+            'positions': {symbol: {'qty': qty, 'avg_cost': cost} for symbol, (qty, cost) in self.positions.items()},
+            'inventory': {f"{venue}:{symbol}": qty for (venue, symbol), qty in self.inventory.items()},
+            'open_notional': dict(self.open_notional),
+            'breakers': {venue: until - time.monotonic() for venue, until in self.breaker_until.items()
+                         if until > time.monotonic()},
+            'rejections': dict(self.rejections),
+        }
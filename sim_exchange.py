@@ -0,0 +1,788 @@
+# File: sim_exchange.py
+"""本地模拟交易所：在一个 HTTP 端口上同时模拟 Binance（/binance）和 OKX（/okx）
+
+- 公开行情：按两家交易所的 websocket 协议推送增量深度，推送速率可配置；OKX 相对 Binance 的溢价
+  按脚本化的价差场景变化（平稳、周期性尖峰、正负交替等），用于触发套利
+- 撮合：REST 接口按 ccxt 的请求格式实现 Trader 用到的 fetch_balance / fetch_ticker /
+  create_market_*_order / fetch_order，以及深度快照、fetch_my_trades、load_markets、fetch_time；
+  市价单按模拟盘口逐档成交（不消耗盘口），余额不足时按交易所的错误码拒绝
+- 私有推送：Binance 的 listenKey 用户数据流和 OKX 的 private 频道（orders / account）
+- 故障注入：REST 请求的固定延迟和随机抖动、下单失败率，断开所有 websocket 连接
+
+运行时通过 GET /sim/stats 查看统计，POST /sim/control 修改速率、场景和故障参数。
+ccxt 客户端和行情连接用 attach(trader, url) 指向模拟交易所，main.py 在设置了 SIM_URL 时自动调用；
+多进程行情的工作进程用 attach_exchange 把拉取深度快照的客户端也指向模拟交易所。
+
+用法: python sim_exchange.py [--port 18080] [--rate 1000] [--scenario spikes] [--latency 0.005] [--fail-rate 0]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import time
+from urllib.parse import urlsplit
+
+from aiohttp import WSMsgType, web
+from config import Config
+from ws_harness import SimulatedBook
+
+logger = logging.getLogger(__name__)
+
+# 价差场景：[(持续秒数, OKX 相对 Binance 的溢价（基点）)]，循环播放
+SCENARIOS = {
+    'flat': [(1.0, 0.0)],
+    'spikes': [(5.0, 0.0), (0.5, 60.0)],
+    'alternating': [(5.0, 0.0), (0.5, 60.0), (5.0, 0.0), (0.5, -60.0)],
+    'wide': [(1.0, 60.0)],
+}
+
+BASE_PRICES = {'BTC': 60000.0, 'ETH': 3000.0, 'SOL': 150.0, 'BNB': 600.0}
+
+
+def parse_scenario(text):
+    """场景名，或 '秒数:基点,秒数:基点' 形式的自定义场景"""
+    if text in SCENARIOS:
+        return SCENARIOS[text]
+    steps = []
+    for part in text.split(','):
+        seconds, bps = part.split(':')
+        steps.append((float(seconds), float(bps)))
+    return steps
+
+
+class Scenario:
+    """按时间循环播放的价差脚本"""
+
+    def __init__(self, steps):
+        self.steps = steps
+        self.period = sum(seconds for seconds, _ in steps)
+        self.start = time.monotonic()
+
+    def premium(self, now=None):
+        """当前 OKX 相对 Binance 的溢价（比例）"""
+        offset = ((now or time.monotonic()) - self.start) % self.period
+        for seconds, bps in self.steps:
+            if offset < seconds:
+                return bps / 1e4
+            offset -= seconds
+        return self.steps[-1][1] / 1e4
+
+
+class OrderRejected(Exception):
+    """下单被模拟交易所拒绝（余额不足等），由各交易所转换为自己的错误格式"""
+
+
+class _WsClient:
+    """一条 websocket 连接：推送经队列由单独的任务发送，行情循环不等待网络"""
+
+    def __init__(self, ws, transport):
+        self.ws = ws
+        self.transport = transport
+        self.symbols = set()
+        self.queue = asyncio.Queue()
+        self.sender = asyncio.create_task(self._send_loop())
+
+    def push(self, frame):
+        self.queue.put_nowait(frame)
+
+    async def _send_loop(self):
+        while True:
+            frame = await self.queue.get()
+            try:
+                await self.ws.send_str(frame)
+            except (ConnectionError, RuntimeError):
+                return
+
+
+class SimVenue:
+    """一个模拟交易所的盘口、账户和撮合，协议格式由子类实现
+
+    只有一个账户，余额为可用余额；市价单按当前盘口逐档成交，手续费以计价币种扣除。
+    """
+
+    name = None
+
+    def __init__(self, sim, symbols, balances, fee_rate):
+        self.sim = sim
+        self.symbols = symbols
+        self.books = {symbol: SimulatedBook(symbol, sim.prices[symbol]) for symbol in symbols}
+        self.balances = dict(balances)
+        self.fee_rate = fee_rate
+        self.orders = {}
+        self.trades = []
+        self.ids = itertools.count(int(time.time() * 1000))
+        self.public = set()   # 订阅了行情的连接
+        self.private = set()  # 私有推送的连接
+        self.frames = 0       # 已推送的行情帧
+
+    # ---- 行情 ----
+
+    def step(self, symbol, mid):
+        bids, asks = self.books[symbol].step(mid)
+        frame = None
+        for client in self.public:
+            if symbol in client.symbols:
+                if frame is None:
+                    frame = self.depth_frame(self.books[symbol], bids, asks)
+                client.push(frame)
+                self.frames += 1
+
+    def depth_frame(self, book, bids, asks):
+        raise NotImplementedError
+
+    # ---- 撮合 ----
+
+    def match(self, symbol, side, amount):
+        """按盘口逐档成交市价单，返回订单 dict；余额不足时抛出 OrderRejected"""
+        base, quote = symbol.split('/')
+        book = self.books[symbol]
+        levels = sorted(book.asks.items()) if side == 'buy' else sorted(book.bids.items(), reverse=True)
+        fills = []
+        remaining = amount
+        for price, size in levels:
+            if remaining <= 1e-12:
+                break
+            quantity = min(size, remaining)
+            fills.append((price, quantity))
+            remaining -= quantity
+        filled = sum(quantity for _, quantity in fills)
+        cost = sum(price * quantity for price, quantity in fills)
+        fee = cost * self.fee_rate
+        if side == 'sell':
+            if self.balances.get(base, 0.0) < filled:
+                raise OrderRejected(base)
+            self._add(base, -filled)
+            self._add(quote, cost - fee)
+        else:
+            if self.balances.get(quote, 0.0) < cost + fee:
+                raise OrderRejected(quote)
+            self._add(quote, -cost - fee)
+            self._add(base, filled)
+
+        now = int(time.time() * 1000)
+        order = {'id': str(next(self.ids)), 'symbol': symbol, 'side': side, 'amount': amount, 'filled': filled,
+                 'cost': cost, 'fee': fee, 'quote': quote, 'time': now,
+                 'status': 'filled' if filled >= amount - 1e-12 else 'expired'}
+        self.orders[order['id']] = order
+        for price, quantity in fills:
+            self.trades.append({'id': str(next(self.ids)), 'order': order['id'], 'symbol': symbol, 'side': side,
+                                'price': price, 'amount': quantity, 'fee': fee * price * quantity / cost,
+                                'quote': quote, 'time': now})
+        self.sim.orders += 1
+        self.push_private(order, (base, quote))
+        return order
+
+    def _add(self, currency, amount):
+        self.balances[currency] = self.balances.get(currency, 0.0) + amount
+
+    def push_private(self, order, currencies):
+        for client in self.private:
+            for frame in self.private_frames(order, currencies):
+                client.push(frame)
+
+    def private_frames(self, order, currencies):
+        return []
+
+    # ---- HTTP ----
+
+    async def delay(self, request):
+        """注入延迟，下单接口按失败率返回 503"""
+        sim = self.sim
+        wait = sim.latency + random.random() * sim.jitter
+        if wait > 0:
+            await asyncio.sleep(wait)
+        sim.requests += 1
+        if request.method == 'POST' and 'order' in request.path and random.random() < sim.fail_rate:
+            sim.failures += 1
+            raise web.HTTPServiceUnavailable(text='simulated outage')
+
+    async def params(self, request):
+        params = dict(request.query)
+        if request.method == 'POST' and request.can_read_body:
+            if request.content_type == 'application/json':
+                params.update(await request.json())
+            else:
+                params.update(await request.post())
+        return params
+
+    async def websocket(self, request, on_message, clients=None):
+        ws = web.WebSocketResponse(autoping=True)
+        await ws.prepare(request)
+        client = _WsClient(ws, request.transport)
+        self.sim.clients.add(client)
+        if clients is not None:
+            clients.add(client)
+        try:
+            async for message in ws:
+                if message.type != WSMsgType.TEXT:
+                    continue
+                if message.data == 'ping':
+                    client.push('pong')
+                    continue
+                on_message(client, json.loads(message.data))
+        finally:
+            self.sim.clients.discard(client)
+            self.public.discard(client)
+            self.private.discard(client)
+            client.sender.cancel()
+        return ws
+
+
+class SimBinance(SimVenue):
+    """Binance 现货 REST（/api/v3）、增量深度流（/ws）和用户数据流（/ws/<listenKey>）"""
+
+    name = 'binance'
+
+    def routes(self, prefix):
+        return [
+            web.get(f'{prefix}/api/v3/time', self.time),
+            web.get(f'{prefix}/api/v3/exchangeInfo', self.exchange_info),
+            web.get(f'{prefix}/api/v3/depth', self.depth),
+            web.get(f'{prefix}/api/v3/ticker/24hr', self.ticker),
+            web.get(f'{prefix}/api/v3/account', self.account),
+            web.post(f'{prefix}/api/v3/order', self.create_order),
+            web.get(f'{prefix}/api/v3/order', self.fetch_order),
+            web.get(f'{prefix}/api/v3/myTrades', self.my_trades),
+            web.post(f'{prefix}/api/v3/userDataStream', self.listen_key),
+            web.put(f'{prefix}/api/v3/userDataStream', self.listen_key),
+            web.get(f'{prefix}/ws', self.public_ws),
+            web.get(f'{prefix}/ws/{{listen_key}}', self.private_ws),
+        ]
+
+    @staticmethod
+    def market_id(symbol):
+        return symbol.replace('/', '')
+
+    def symbol(self, market_id):
+        for symbol in self.symbols:
+            if self.market_id(symbol) == market_id:
+                return symbol
+        raise web.HTTPBadRequest(text=json.dumps({'code': -1121, 'msg': 'Invalid symbol.'}),
+                                 content_type='application/json')
+
+    async def time(self, request):
+        await self.delay(request)
+        return web.json_response({'serverTime': int(time.time() * 1000)})
+
+    async def exchange_info(self, request):
+        await self.delay(request)
+        symbols = []
+        for symbol in self.symbols:
+            base, quote = symbol.split('/')
+            symbols.append({
+                'symbol': self.market_id(symbol), 'status': 'TRADING', 'baseAsset': base, 'baseAssetPrecision': 8,
+                'quoteAsset': quote, 'quotePrecision': 8, 'quoteAssetPrecision': 8,
+                'orderTypes': ['LIMIT', 'MARKET'], 'isSpotTradingAllowed': True, 'isMarginTradingAllowed': False,
+                'quoteOrderQtyMarketAllowed': True, 'permissions': ['SPOT'],
+                'filters': [
+                    {'filterType': 'PRICE_FILTER', 'minPrice': '0.01', 'maxPrice': '1000000', 'tickSize': '0.01'},
+                    {'filterType': 'LOT_SIZE', 'minQty': '0.00001', 'maxQty': '9000', 'stepSize': '0.00001'},
+                    {'filterType': 'NOTIONAL', 'minNotional': '5', 'applyMinToMarket': True,
+                     'maxNotional': '9000000', 'applyMaxToMarket': False, 'avgPriceMins': 5},
+                ],
+            })
+        return web.json_response({'timezone': 'UTC', 'serverTime': int(time.time() * 1000), 'symbols': symbols})
+
+    async def depth(self, request):
+        await self.delay(request)
+        book = self.books[self.symbol(request.query.get('symbol'))]
+        bids, asks = book.levels()
+        return web.json_response({'lastUpdateId': book.update_id,
+                                  'bids': [[str(p), str(q)] for p, q in bids],
+                                  'asks': [[str(p), str(q)] for p, q in asks]})
+
+    async def ticker(self, request):
+        await self.delay(request)
+        symbol = self.symbol(request.query.get('symbol'))
+        bids, asks = self.books[symbol].levels()
+        now = int(time.time() * 1000)
+        last = str(self.books[symbol].mid)
+        return web.json_response({
+            'symbol': self.market_id(symbol), 'priceChange': '0', 'priceChangePercent': '0',
+            'weightedAvgPrice': last, 'prevClosePrice': last, 'lastPrice': last, 'lastQty': '0',
+            'bidPrice': str(bids[0][0]), 'bidQty': str(bids[0][1]), 'askPrice': str(asks[0][0]),
+            'askQty': str(asks[0][1]), 'openPrice': last, 'highPrice': last, 'lowPrice': last,
+            'volume': '0', 'quoteVolume': '0', 'openTime': now - 86400000, 'closeTime': now,
+            'firstId': 0, 'lastId': 0, 'count': 0})
+
+    def balance_entries(self, currencies=None):
+        return [{'asset': currency, 'free': f"{amount:.8f}", 'locked': '0.00000000'}
+                for currency, amount in self.balances.items() if currencies is None or currency in currencies]
+
+    async def account(self, request):
+        await self.delay(request)
+        return web.json_response({
+            'makerCommission': 10, 'takerCommission': 10, 'buyerCommission': 0, 'sellerCommission': 0,
+            'canTrade': True, 'canWithdraw': True, 'canDeposit': True, 'updateTime': int(time.time() * 1000),
+            'accountType': 'SPOT', 'balances': self.balance_entries(), 'permissions': ['SPOT']})
+
+    def order_info(self, order, client_order_id=''):
+        return {
+            'symbol': self.market_id(order['symbol']), 'orderId': int(order['id']), 'orderListId': -1,
+            'clientOrderId': client_order_id, 'transactTime': order['time'], 'time': order['time'],
+            'updateTime': order['time'], 'workingTime': order['time'], 'price': '0.00000000',
+            'origQty': f"{order['amount']:.8f}", 'executedQty': f"{order['filled']:.8f}",
+            'cummulativeQuoteQty': f"{order['cost']:.8f}", 'status': order['status'].upper(),
+            'timeInForce': 'GTC', 'type': 'MARKET', 'side': order['side'].upper(), 'isWorking': True,
+            'selfTradePreventionMode': 'NONE'}
+
+    async def create_order(self, request):
+        await self.delay(request)
+        params = await self.params(request)
+        symbol = self.symbol(params.get('symbol'))
+        side = params.get('side', '').lower()
+        if 'quantity' in params:
+            amount = float(params['quantity'])
+        else:
+            # quoteOrderQty：按计价币种金额折算数量
+            amount = float(params['quoteOrderQty']) / self.books[symbol].mid
+        try:
+            order = self.match(symbol, side, amount)
+        except OrderRejected:
+            return web.json_response({'code': -2010, 'msg': 'Account has insufficient balance for requested action.'},
+                                     status=400)
+        info = self.order_info(order, params.get('newClientOrderId', ''))
+        info['fills'] = [{'price': f"{trade['price']:.8f}", 'qty': f"{trade['amount']:.8f}",
+                          'commission': f"{trade['fee']:.8f}", 'commissionAsset': trade['quote'],
+                          'tradeId': int(trade['id'])}
+                         for trade in self.trades if trade['order'] == order['id']]
+        return web.json_response(info)
+
+    async def fetch_order(self, request):
+        await self.delay(request)
+        order = self.orders.get(request.query.get('orderId'))
+        if order is None:
+            return web.json_response({'code': -2013, 'msg': 'Order does not exist.'}, status=400)
+        return web.json_response(self.order_info(order))
+
+    async def my_trades(self, request):
+        await self.delay(request)
+        symbol = self.symbol(request.query.get('symbol'))
+        since = int(request.query.get('startTime', 0))
+        limit = int(request.query.get('limit', 500))
+        trades = [trade for trade in self.trades if trade['symbol'] == symbol and trade['time'] >= since][:limit]
+        return web.json_response([{
+            'symbol': self.market_id(symbol), 'id': int(trade['id']), 'orderId': int(trade['order']),
+            'orderListId': -1, 'price': f"{trade['price']:.8f}", 'qty': f"{trade['amount']:.8f}",
+            'quoteQty': f"{trade['price'] * trade['amount']:.8f}", 'commission': f"{trade['fee']:.8f}",
+            'commissionAsset': trade['quote'], 'time': trade['time'], 'isBuyer': trade['side'] == 'buy',
+            'isMaker': False, 'isBestMatch': True} for trade in trades])
+
+    async def listen_key(self, request):
+        await self.delay(request)
+        return web.json_response({'listenKey': 'sim-listen-key'} if request.method == 'POST' else {})
+
+    def depth_frame(self, book, bids, asks):
+        return json.dumps({'e': 'depthUpdate', 'E': int(time.time() * 1000), 's': self.market_id(book.symbol),
+                           'U': book.update_id, 'u': book.update_id, 'b': bids, 'a': asks})
+
+    async def public_ws(self, request):
+        return await self.websocket(request, self.on_public_message, self.public)
+
+    def on_public_message(self, client, request):
+        if request.get('method') == 'SUBSCRIBE':
+            for stream in request.get('params', []):
+                name = stream.split('@')[0].upper()
+                client.symbols.update(symbol for symbol in self.symbols if self.market_id(symbol) == name)
+            client.push(json.dumps({'result': None, 'id': request.get('id')}))
+
+    async def private_ws(self, request):
+        return await self.websocket(request, lambda client, message: None, self.private)
+
+    def private_frames(self, order, currencies):
+        now = int(time.time() * 1000)
+        execution = {
+            'e': 'executionReport', 'E': now, 's': self.market_id(order['symbol']), 'c': '', 'S': order['side'].upper(),
+            'o': 'MARKET', 'f': 'GTC', 'q': f"{order['amount']:.8f}", 'p': '0.00000000', 'P': '0.00000000',
+            'F': '0.00000000', 'g': -1, 'C': '', 'x': 'TRADE', 'X': order['status'].upper(), 'r': 'NONE',
+            'i': int(order['id']), 'l': f"{order['filled']:.8f}", 'z': f"{order['filled']:.8f}",
+            'L': f"{order['cost'] / order['filled'] if order['filled'] else 0:.8f}", 'n': f"{order['fee']:.8f}",
+            'N': order['quote'], 'T': order['time'], 't': -1, 'I': 0, 'w': False, 'm': False, 'M': True,
+            'O': order['time'], 'Z': f"{order['cost']:.8f}", 'Y': f"{order['cost']:.8f}", 'Q': '0.00000000'}
+        position = {'e': 'outboundAccountPosition', 'E': now, 'u': now,
+                    'B': [{'a': entry['asset'], 'f': entry['free'], 'l': entry['locked']}
+                          for entry in self.balance_entries(currencies)]}
+        return [json.dumps(execution), json.dumps(position)]
+
+
+class SimOkx(SimVenue):
+    """OKX 现货 REST（/api/v5）、books 频道（/ws/v5/public）和 orders / account 频道（/ws/v5/private）"""
+
+    name = 'okx'
+
+    def routes(self, prefix):
+        return [
+            web.get(f'{prefix}/api/v5/public/time', self.time),
+            web.get(f'{prefix}/api/v5/public/instruments', self.instruments),
+            web.get(f'{prefix}/api/v5/market/ticker', self.ticker),
+            web.get(f'{prefix}/api/v5/account/balance', self.balance),
+            web.get(f'{prefix}/api/v5/account/trade-fee', self.trade_fee),
+            web.post(f'{prefix}/api/v5/trade/order', self.create_order),
+            web.post(f'{prefix}/api/v5/trade/batch-orders', self.create_order),
+            web.get(f'{prefix}/api/v5/trade/order', self.fetch_order),
+            web.get(f'{prefix}/api/v5/trade/fills-history', self.fills),
+            web.get(f'{prefix}/api/v5/trade/fills', self.fills),
+            web.get(f'{prefix}/ws/v5/public', self.public_ws),
+            web.get(f'{prefix}/ws/v5/private', self.private_ws),
+        ]
+
+    @staticmethod
+    def inst_id(symbol):
+        return symbol.replace('/', '-')
+
+    def symbol(self, inst_id):
+        symbol = (inst_id or '').replace('-', '/')
+        if symbol not in self.books:
+            raise web.HTTPBadRequest(text=json.dumps({'code': '51001', 'msg': "Instrument ID doesn't exist.", 'data': []}),
+                             content_type='application/json')
+        return symbol
+
+    @staticmethod
+    def ok(data):
+        return web.json_response({'code': '0', 'msg': '', 'data': data})
+
+    async def time(self, request):
+        await self.delay(request)
+        return self.ok([{'ts': str(int(time.time() * 1000))}])
+
+    async def instruments(self, request):
+        await self.delay(request)
+        data = []
+        for symbol in self.symbols:
+            base, quote = symbol.split('/')
+            data.append({
+                'instType': 'SPOT', 'instId': self.inst_id(symbol), 'uly': '', 'instFamily': '', 'baseCcy': base,
+                'quoteCcy': quote, 'settleCcy': '', 'ctVal': '', 'ctMult': '', 'ctValCcy': '', 'optType': '',
+                'stk': '', 'listTime': '1606468572000', 'expTime': '', 'lever': '10', 'tickSz': '0.01',
+                'lotSz': '0.00000001', 'minSz': '0.00001', 'ctType': '', 'alias': '', 'state': 'live',
+                'maxLmtSz': '9999999999', 'maxMktSz': '1000000'})
+        return self.ok(data)
+
+    async def ticker(self, request):
+        await self.delay(request)
+        symbol = self.symbol(request.query.get('instId'))
+        bids, asks = self.books[symbol].levels()
+        last = str(self.books[symbol].mid)
+        return self.ok([{
+            'instType': 'SPOT', 'instId': self.inst_id(symbol), 'last': last, 'lastSz': '0',
+            'askPx': str(asks[0][0]), 'askSz': str(asks[0][1]), 'bidPx': str(bids[0][0]), 'bidSz': str(bids[0][1]),
+            'open24h': last, 'high24h': last, 'low24h': last, 'volCcy24h': '0', 'vol24h': '0',
+            'ts': str(int(time.time() * 1000)), 'sodUtc0': last, 'sodUtc8': last}])
+
+    def balance_details(self, currencies=None):
+        now = str(int(time.time() * 1000))
+        return [{'ccy': currency, 'availBal': f"{amount:.8f}", 'cashBal': f"{amount:.8f}", 'eq': f"{amount:.8f}",
+                 'availEq': f"{amount:.8f}", 'frozenBal': '0', 'ordFrozen': '0', 'uTime': now}
+                for currency, amount in self.balances.items() if currencies is None or currency in currencies]
+
+    async def balance(self, request):
+        await self.delay(request)
+        return self.ok([{'uTime': str(int(time.time() * 1000)), 'totalEq': '0', 'details': self.balance_details()}])
+
+    async def trade_fee(self, request):
+        # OKX 的费率为负数表示收取手续费
+        await self.delay(request)
+        return self.ok([{'category': '1', 'delivery': '', 'exercise': '', 'instType': 'SPOT', 'level': 'Lv1',
+                         'maker': str(-self.fee_rate), 'taker': str(-self.fee_rate), 'ts': str(int(time.time() * 1000))}])
+
+    def order_info(self, order, client_order_id=''):
+        average = order['cost'] / order['filled'] if order['filled'] else 0.0
+        return {
+            'instType': 'SPOT', 'instId': self.inst_id(order['symbol']), 'ccy': '', 'ordId': order['id'],
+            'clOrdId': client_order_id, 'tag': '', 'px': '', 'sz': f"{order['amount']:.8f}", 'pnl': '0',
+            'ordType': 'market', 'side': order['side'], 'posSide': 'net', 'tdMode': 'cash',
+            'accFillSz': f"{order['filled']:.8f}", 'fillPx': f"{average:.8f}", 'tradeId': '',
+            'fillSz': f"{order['filled']:.8f}", 'fillTime': str(order['time']), 'avgPx': f"{average:.8f}",
+            'state': 'filled' if order['status'] == 'filled' else 'canceled', 'lever': '',
+            'feeCcy': order['quote'], 'fee': f"{-order['fee']:.8f}", 'rebateCcy': order['quote'], 'rebate': '0',
+            'tgtCcy': 'base_ccy', 'source': '', 'category': 'normal', 'uTime': str(order['time']),
+            'cTime': str(order['time'])}
+
+    async def create_order(self, request):
+        """单个下单和批量下单（ccxt 默认走 batch-orders，请求体为订单列表）"""
+        await self.delay(request)
+        body = await request.json()
+        results = [self.place(params) for params in (body if isinstance(body, list) else [body])]
+        if any(result['sCode'] != '0' for result in results):
+            return web.json_response({'code': '1', 'msg': 'Operation failed.', 'data': results})
+        return self.ok(results)
+
+    def place(self, params):
+        symbol = self.symbol(params.get('instId'))
+        amount = float(params['sz'])
+        if params.get('tgtCcy') == 'quote_ccy':
+            amount /= self.books[symbol].mid
+        try:
+            order = self.match(symbol, params.get('side'), amount)
+        except OrderRejected as e:
+            return {'clOrdId': params.get('clOrdId', ''), 'ordId': '', 'tag': '', 'sCode': '51008',
+                    'sMsg': f"Order failed. Insufficient {e} balance in account."}
+        return {'clOrdId': params.get('clOrdId', ''), 'ordId': order['id'], 'tag': '', 'sCode': '0',
+                'sMsg': 'Order placed'}
+
+    async def fetch_order(self, request):
+        await self.delay(request)
+        order = self.orders.get(request.query.get('ordId'))
+        if order is None:
+            return web.json_response({'code': '51603', 'msg': 'Order does not exist', 'data': []})
+        return self.ok([self.order_info(order)])
+
+    async def fills(self, request):
+        await self.delay(request)
+        # 与 OKX 相同：从新到旧返回窗口内最新的 limit 笔，after / before 按 billId 翻页
+        symbol = self.symbol(request.query['instId']) if 'instId' in request.query else None
+        begin = int(request.query.get('begin', 0))
+        end = int(request.query.get('end', 0)) or None
+        after = int(request.query.get('after', 0)) or None
+        before = int(request.query.get('before', 0)) or None
+        limit = int(request.query.get('limit', 100))
+        trades = [trade for trade in reversed(self.trades)
+                  if (symbol is None or trade['symbol'] == symbol) and trade['time'] >= begin
+                  and (end is None or trade['time'] <= end) and (after is None or int(trade['id']) < after)
+                  and (before is None or int(trade['id']) > before)][:limit]
+        return self.ok([{
+            'instType': 'SPOT', 'instId': self.inst_id(trade['symbol']), 'tradeId': trade['id'],
+            'ordId': trade['order'], 'clOrdId': '', 'billId': trade['id'], 'tag': '',
+            'fillPx': f"{trade['price']:.8f}", 'fillSz': f"{trade['amount']:.8f}", 'side': trade['side'],
+            'posSide': 'net', 'execType': 'T', 'feeCcy': trade['quote'], 'fee': f"{-trade['fee']:.8f}",
+            'ts': str(trade['time']), 'fillTime': str(trade['time'])} for trade in trades])
+
+    def depth_frame(self, book, bids, asks, action='update'):
+        if action == 'snapshot':
+            bids, asks = book.levels()
+            bids = [[str(p), str(q), '0', '1'] for p, q in bids]
+            asks = [[str(p), str(q), '0', '1'] for p, q in asks]
+            prev_seq_id = -1
+        else:
+            bids = [level + ['0', '1'] for level in bids]
+            asks = [level + ['0', '1'] for level in asks]
+            prev_seq_id = book.seq_id - 1
+        data = {'bids': bids, 'asks': asks, 'ts': str(int(time.time() * 1000)),
+                'seqId': book.seq_id, 'prevSeqId': prev_seq_id}
+        return json.dumps({'arg': {'channel': 'books', 'instId': self.inst_id(book.symbol)},
+                           'action': action, 'data': [data]})
+
+    async def public_ws(self, request):
+        return await self.websocket(request, self.on_public_message, self.public)
+
+    def on_public_message(self, client, request):
+        if request.get('op') not in ('subscribe', 'unsubscribe'):
+            return
+        for arg in request.get('args', []):
+            symbol = (arg.get('instId') or '').replace('-', '/')
+            if symbol not in self.books:
+                continue
+            client.push(json.dumps({'event': request['op'], 'arg': arg}))
+            if request['op'] == 'unsubscribe':
+                client.symbols.discard(symbol)
+            else:
+                client.symbols.add(symbol)
+                client.push(self.depth_frame(self.books[symbol], None, None, 'snapshot'))
+
+    async def private_ws(self, request):
+        return await self.websocket(request, self.on_private_message, self.private)
+
+    def on_private_message(self, client, request):
+        op = request.get('op')
+        if op == 'login':
+            client.push(json.dumps({'event': 'login', 'code': '0', 'msg': ''}))
+        elif op == 'subscribe':
+            for arg in request.get('args', []):
+                client.symbols.add(arg.get('channel'))  # 私有连接上记录订阅的频道
+                client.push(json.dumps({'event': 'subscribe', 'arg': arg}))
+
+    def private_frames(self, order, currencies):
+        return [json.dumps({'arg': {'channel': 'orders', 'instType': 'ANY', 'uid': 'sim'},
+                            'data': [self.order_info(order)]}),
+                json.dumps({'arg': {'channel': 'account', 'uid': 'sim'},
+                            'data': [{'uTime': str(order['time']), 'totalEq': '0',
+                                      'details': self.balance_details(currencies)}]})]
+
+    def push_private(self, order, currencies):
+        for client in self.private:
+            orders, account = self.private_frames(order, currencies)
+            if 'orders' in client.symbols:
+                client.push(orders)
+            if 'account' in client.symbols:
+                client.push(account)
+
+
+class SimExchange:
+    """本地模拟交易所服务
+
+    rate 为每个交易所每秒推送的行情帧数（按交易对轮流更新）。参考中间价随机游走，
+    Binance 的中间价等于参考价，OKX 按场景加上溢价，两边再各自加上 noise 基点以内的随机偏差。
+    """
+
+    def __init__(self, symbols=None, rate=None, scenario=None, latency=None, jitter=None, fail_rate=None,
+                 noise=None, balance=None, fee_rate=None, host='127.0.0.1', port=None):
+        self.symbols = list(symbols or Config.SYMBOLS)
+        self.rate = rate or Config.SIM_RATE
+        self.scenario = Scenario(parse_scenario(scenario or Config.SIM_SCENARIO))
+        self.latency = Config.SIM_LATENCY if latency is None else latency
+        self.jitter = Config.SIM_JITTER if jitter is None else jitter
+        self.fail_rate = Config.SIM_FAIL_RATE if fail_rate is None else fail_rate
+        self.noise = (Config.SIM_NOISE_BPS if noise is None else noise) / 1e4
+        balance = Config.SIM_BALANCE if balance is None else balance  # 每个币种的初始资金（按计价币种折算）
+        self.host = host
+        self.port = Config.SIM_PORT if port is None else port
+        self.prices = {symbol: BASE_PRICES.get(symbol.split('/')[0], 1000.0) for symbol in self.symbols}
+        balances = {}
+        for symbol, price in self.prices.items():
+            base, quote = symbol.split('/')
+            balances[base] = balance / price
+            balances[quote] = balance
+        fee_rate = 0.001 if fee_rate is None else fee_rate
+        self.venues = {'binance': SimBinance(self, self.symbols, balances, fee_rate),
+                       'okx': SimOkx(self, self.symbols, balances, fee_rate)}
+        self.clients = set()
+        self.requests = 0
+        self.orders = 0
+        self.failures = 0
+        self.runner = None
+        self.ticker = None
+
+    def url(self, venue=None):
+        return f"http://{self.host}:{self.port}" + (f"/{venue}" if venue else '')
+
+    async def start(self):
+        app = web.Application()
+        for venue in self.venues.values():
+            app.add_routes(venue.routes(f'/{venue.name}'))
+        app.add_routes([web.get('/sim/stats', self.stats), web.post('/sim/control', self.control)])
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        self.ticker = asyncio.create_task(self._tick_loop())
+        logger.info("Simulated exchange listening on %s (%d symbols, %d msg/s per venue)",
+                    self.url(), len(self.symbols), self.rate)
+        return self
+
+    async def close(self):
+        if self.ticker is not None:
+            self.ticker.cancel()
+        for client in list(self.clients):
+            await client.ws.close()
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    def disconnect(self):
+        """断开所有 websocket 连接（不发送关闭帧）"""
+        for client in list(self.clients):
+            if client.transport is not None:
+                client.transport.abort()
+
+    async def _tick_loop(self):
+        """按 rate 补齐应推送的帧数，事件循环调度的误差不会累积"""
+        mids = dict(self.prices)
+        symbols = itertools.cycle(self.symbols)
+        start = time.monotonic()
+        emitted = 0
+        while True:
+            await asyncio.sleep(0.001)
+            now = time.monotonic()
+            due = int((now - start) * self.rate) - emitted
+            if due > self.rate:
+                # 落后超过一秒（进程被挂起等），不再补推
+                start, emitted, due = now, 0, 0
+            premium = self.scenario.premium(now)
+            for _ in range(due):
+                symbol = next(symbols)
+                mid = mids[symbol] = max(mids[symbol] + random.choice((-1.0, 0.0, 1.0)), 1.0)
+                for venue in self.venues.values():
+                    offset = premium if venue.name == 'okx' else 0.0
+                    noise = random.uniform(-self.noise, self.noise)
+                    venue.step(symbol, round(mid * (1 + offset + noise), 2))
+            emitted += due
+
+    async def stats(self, request):
+        return web.json_response({
+            'frames': {venue.name: venue.frames for venue in self.venues.values()},
+            'backlog': max((client.queue.qsize() for client in self.clients), default=0),
+            'clients': len(self.clients), 'requests': self.requests, 'orders': self.orders,
+            'failures': self.failures, 'premium_bps': self.scenario.premium() * 1e4,
+            'balances': {venue.name: venue.balances for venue in self.venues.values()}})
+
+    async def control(self, request):
+        """修改运行参数：rate / latency / jitter / fail_rate / scenario，disconnect=true 时断开所有连接"""
+        params = await request.json()
+        for name in ('rate', 'latency', 'jitter', 'fail_rate'):
+            if name in params:
+                setattr(self, name, params[name])
+        if 'scenario' in params:
+            self.scenario = Scenario(parse_scenario(params['scenario']))
+        if params.get('disconnect'):
+            self.disconnect()
+        return await self.stats(request)
+
+
+def retarget(urls, http_base, ws_base):
+    """把 ccxt urls 中的域名替换为模拟交易所的地址，保留原路径"""
+    if isinstance(urls, dict):
+        return {key: retarget(value, http_base, ws_base) for key, value in urls.items()}
+    if not isinstance(urls, str):
+        return urls
+    parts = urlsplit(urls)
+    base = ws_base if parts.scheme in ('ws', 'wss') else http_base
+    return base + parts.path
+
+
+def attach_exchange(exchange, venue, url=None):
+    """把一个 ccxt 客户端的 REST / WebSocket 地址指向本地模拟交易所"""
+    url = (url or Config.SIM_URL).rstrip('/')
+    ws = 'ws://' + urlsplit(url).netloc
+    # 按模拟盘处理：binance 不请求 sapi，okx 不拉取需要签名的币种信息
+    exchange.set_sandbox_mode(True)
+    exchange.urls['api'] = retarget(exchange.urls['api'], f"{url}/{venue}", f"{ws}/{venue}")
+    # 模拟交易所不校验签名，但 ccxt 发私有请求前要求有密钥
+    exchange.apiKey = exchange.apiKey or 'sim'
+    exchange.secret = exchange.secret or 'sim'
+    exchange.password = exchange.password or 'sim'
+
+
+def attach(trader, url=None):
+    """把 Trader 的 ccxt 客户端、行情连接地址和交易对缓存指向本地模拟交易所"""
+    from warmup import MarketCache
+
+    url = (url or Config.SIM_URL).rstrip('/')
+    ws = 'ws://' + urlsplit(url).netloc
+    for venue, exchange in trader.exchanges.items():
+        attach_exchange(exchange, venue, url)
+    trader.warmup.cache = MarketCache(os.path.join(Config.MARKET_CACHE_DIR, 'sim'))
+    Config.BINANCE_WS_URL = f"{ws}/binance/ws"
+    Config.OKX_WS_URL = f"{ws}/okx/ws/v5/public"
+    logger.info("Trading against simulated exchange at %s", url)
+
+
+async def serve(args):
+    sim = SimExchange(args.symbols.split(',') if args.symbols else None, args.rate, args.scenario, args.latency,
+                      args.jitter, args.fail_rate, port=args.port)
+    await sim.start()
+    print(f"simulated exchange listening on {sim.url()}", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await sim.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='本地模拟的 Binance / OKX 行情和撮合服务')
+    parser.add_argument('--symbols', help='逗号分隔的交易对，默认 Config.SYMBOLS')
+    parser.add_argument('--port', type=int, default=Config.SIM_PORT)
+    parser.add_argument('--rate', type=int, default=Config.SIM_RATE, help='每个交易所每秒推送的行情帧数')
+    parser.add_argument('--scenario', default=Config.SIM_SCENARIO,
+                        help=f"价差场景：{', '.join(SCENARIOS)}，或 '秒数:基点,...'")
+    parser.add_argument('--latency', type=float, default=Config.SIM_LATENCY, help='REST 请求的固定延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=Config.SIM_JITTER, help='REST 请求的随机附加延迟上限（秒）')
+    parser.add_argument('--fail-rate', type=float, default=Config.SIM_FAIL_RATE, help='下单请求返回 503 的概率')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
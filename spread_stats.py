@@ -0,0 +1,101 @@
+# File: spread_stats.py
+import math
+
+import numpy as np
+
+# moments 第二维的含义
+SUM, SQ_SUM, EWMA = range(3)
+
+
+class SpreadStats:
+    """每个交易对、每个方向的价差滚动统计
+
+    values[row, d, :] 是长度为 window 的环形缓冲区；moments[row] 保存滚动和、平方和与 EWMA，
+    随写入增量维护，滚动均值和方差是 O(1)。push 对一批行做向量化更新，每次 tick 的开销
+    与窗口长度无关。每行的状态放在同一个数组里，一次更新只需要一次 gather 和一次 scatter。
+    缓冲区每绕一圈按缓冲区重算一次和，消除浮点累积误差。
+    """
+
+    def __init__(self, rows, directions, window=1000, alpha=0.01):
+        self.window = window
+        self.alpha = alpha
+        self.values = np.zeros((rows, directions, window))
+        self.moments = np.zeros((rows, 3, directions))
+        self.pos = np.zeros(rows, dtype=np.int64)
+        self.counts = np.zeros(rows, dtype=np.int64)
+        self.directions = np.arange(directions)
+
+    def push(self, rows, samples):
+        """每行写入一个样本，samples 的形状为 (len(rows), directions)，rows 不能重复
+
+        返回这些行更新后的 (样本数, 滚动标准差, EWMA)。
+        """
+        counts = self.counts[rows]
+        moments = self.moments[rows]
+        pos = self.pos[rows]
+        index = (rows[:, None], self.directions, pos[:, None])
+        # 缓冲区初始为 0，未写满时减去的旧值也是 0
+        old = self.values[index]
+        self.values[index] = samples
+        moments[:, SUM] += samples - old
+        moments[:, SQ_SUM] += samples * samples - old * old
+        # 前 1/alpha 个样本按累计均值更新，第一个样本直接作为初值
+        alpha = np.maximum(self.alpha, 1.0 / (counts + 1))[:, None]
+        moments[:, EWMA] += alpha * (samples - moments[:, EWMA])
+
+        pos = (pos + 1) % self.window
+        self.pos[rows] = pos
+        counts = np.minimum(counts + 1, self.window)
+        self.counts[rows] = counts
+        wrapped = pos == 0
+        if wrapped.any():
+            values = self.values[rows[wrapped]]
+            moments[wrapped, SUM] = values.sum(axis=2)
+            moments[wrapped, SQ_SUM] = (values * values).sum(axis=2)
+        self.moments[rows] = moments
+
+        n = counts[:, None]
+        mean = moments[:, SUM] / n
+        std = np.sqrt(np.maximum(moments[:, SQ_SUM] / n - mean * mean, 0.0))
+        return counts, std, moments[:, EWMA]
+
+    def push_row(self, row, samples):
+        """push 的单行版本，samples 是长度为 directions 的 list，返回 (样本数, 标准差 list, EWMA list)
+
+        只更新一行时用 Python 标量计算，避免小数组上 numpy 调用的固定开销。
+        """
+        count = int(self.counts[row])
+        pos = int(self.pos[row])
+        sums, sq_sums, ewma = self.moments[row].tolist()
+        old = self.values[row, :, pos].tolist()
+        self.values[row, :, pos] = samples
+        alpha = max(self.alpha, 1.0 / (count + 1))
+        for d, x in enumerate(samples):
+            o = old[d]
+            sums[d] += x - o
+            sq_sums[d] += x * x - o * o
+            ewma[d] += alpha * (x - ewma[d])
+
+        pos += 1
+        if pos == self.window:
+            pos = 0
+            values = self.values[row]
+            sums = values.sum(axis=1).tolist()
+            sq_sums = (values * values).sum(axis=1).tolist()
+        count = min(count + 1, self.window)
+        self.moments[row] = (sums, sq_sums, ewma)
+        self.pos[row] = pos
+        self.counts[row] = count
+        std = [math.sqrt(max(sq / count - (s / count) ** 2, 0.0)) for s, sq in zip(sums, sq_sums)]
+        return count, std, ewma
+
+    def mean(self, rows):
+        return self.moments[rows, SUM] / np.maximum(self.counts[rows], 1)[:, None]
+
+    def std(self, rows):
+        n = np.maximum(self.counts[rows], 1)[:, None]
+        mean = self.moments[rows, SUM] / n
+        return np.sqrt(np.maximum(self.moments[rows, SQ_SUM] / n - mean * mean, 0.0))
+
+    def ewma(self, rows):
+        return self.moments[rows, EWMA]
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import socket
+import sys
+
+from aiosmtpd.controller import Controller
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+from notification import EmailChannel, Notifier  # noqa: E402
+
+
+class Inbox:
+    """aiosmtpd 处理器：记录收到的邮件"""
+
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope.content.decode())
+        return '250 OK'
+
+
+def start_smtp(inbox):
+    """在空闲端口上启动本地 SMTP 服务"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    controller = Controller(inbox, hostname='127.0.0.1', port=port)
+    controller.start()
+    return controller
+
+
+def email_channel(monkeypatch, port, starttls):
+    monkeypatch.setattr(Config, 'SMTP_SERVER', '127.0.0.1')
+    monkeypatch.setattr(Config, 'SMTP_PORT', port)
+    monkeypatch.setattr(Config, 'SMTP_STARTTLS', starttls)
+    monkeypatch.setattr(Config, 'EMAIL', 'bot@example.com')
+    monkeypatch.setattr(Config, 'EMAIL_PASSWORD', None)
+    monkeypatch.setattr(Config, 'ALERT_RECIPIENTS', ['ops@example.com'])
+    return EmailChannel()
+
+
+def test_email_batches_and_flushes_on_close(monkeypatch):
+    """窗口内的多条通知合并成一封摘要；close 时把还没到期的通知立即发出"""
+    inbox = Inbox()
+    controller = start_smtp(inbox)
+    try:
+        async def main():
+            notifier = Notifier([email_channel(monkeypatch, controller.port, False)],
+                                digest_window=0.2, min_intervals={'email': 0})
+            notifier.start()
+            for i in range(3):
+                notifier.send_alert(f"alert {i}")
+            await asyncio.sleep(1.0)
+            assert len(inbox.messages) == 1
+            assert 'Subject: Arbitrage Bot Alert (+2 more)' in inbox.messages[0]
+            assert all(f"alert {i}" in inbox.messages[0] for i in range(3))
+
+            notifier.send_alert("last words")
+            await notifier.close()
+            assert len(inbox.messages) == 2
+            assert 'last words' in inbox.messages[1]
+            assert notifier.sent == 2
+
+        asyncio.run(main())
+    finally:
+        controller.stop()
+
+
+def test_starttls_toggle(monkeypatch):
+    """开启 STARTTLS 时不支持 TLS 的服务器拒绝会话，关闭后正常投递"""
+    inbox = Inbox()
+    controller = start_smtp(inbox)
+    try:
+        async def main():
+            port = controller.port
+            tls = email_channel(monkeypatch, port, True)
+            try:
+                await tls.send('with tls', 'body')
+                raise AssertionError('STARTTLS was not attempted')
+            except Exception as e:
+                assert 'STARTTLS' in str(e)
+            await tls.close()
+
+            plain = email_channel(monkeypatch, port, False)
+            await plain.send('without tls', 'body')
+            await plain.close()
+            assert len(inbox.messages) == 1 and 'Subject: without tls' in inbox.messages[0]
+
+        asyncio.run(main())
+    finally:
+        controller.stop()
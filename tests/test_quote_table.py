@@ -0,0 +1,113 @@
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from feed_shards import ShardedPriceCollector  # noqa: E402
+from quote_table import QuoteTable, BID, ASK  # noqa: E402
+
+context = multiprocessing.get_context('spawn')
+
+
+def die_mid_write(name, shape, row, col):
+    """模拟写入进程在两次写版本号之间退出：版本号已加 1（奇数），字段只写了一半"""
+    table = QuoteTable(*shape, name=name)
+    table.seq[row, col] = int(table.seq[row, col]) + 1
+    table.data[row, col, BID] = 12345.0
+    os._exit(1)
+
+
+def write_forever(name, shape, row, col):
+    table = QuoteTable(*shape, name=name)
+    price = 0.0
+    while True:
+        price += 1.0
+        table.write(row, col, price, price + 1.0)
+
+
+def write_once(name, shape, row, col, bid, ask):
+    table = QuoteTable(*shape, name=name)
+    table.write(row, col, bid, ask)
+    table.close()
+
+
+def run(target, *args):
+    process = context.Process(target=target, args=args)
+    process.start()
+    process.join(30)
+    return process
+
+
+def test_writer_dies_mid_write_and_reader_recovers():
+    table = QuoteTable(2, 2)
+    try:
+        last_seq = np.zeros(table.shape, dtype=np.uint64)
+        run(write_once, table.name, table.shape, 0, 1, 100.0, 101.0)
+        slots, _ = table.read_changed(last_seq)
+        assert slots.tolist() == [1]
+
+        run(die_mid_write, table.name, table.shape, 0, 1)
+        assert int(table.seq[0, 1]) % 2 == 1
+        slots, _ = table.read_changed(last_seq)
+        assert slots.size == 0  # 写了一半的槽位不会被读到
+
+        # 重新拉起的写入进程写完后读取方拿到完整的新报价
+        run(write_once, table.name, table.shape, 0, 1, 200.0, 201.0)
+        assert int(table.seq[0, 1]) % 2 == 0
+        slots, values = table.read_changed(last_seq)
+        assert slots.tolist() == [1]
+        assert values[0, BID] == 200.0 and values[0, ASK] == 201.0
+
+        # 奇偶性没有反转：正在写（奇数）的槽位仍然被跳过
+        table.seq[0, 1] += 1
+        slots, _ = table.read_changed(last_seq)
+        assert slots.size == 0
+    finally:
+        table.close()
+
+
+def test_writer_killed_at_random_points():
+    table = QuoteTable(1, 1)
+    try:
+        last_seq = np.zeros(table.shape, dtype=np.uint64)
+        for i in range(5):
+            process = context.Process(target=write_forever, args=(table.name, table.shape, 0, 0))
+            process.start()
+            deadline = time.monotonic() + 30
+            while int(table.seq[0, 0]) < 1000 * (i + 1) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            process.kill()
+            process.join()
+            table.read_changed(last_seq)
+            run(write_once, table.name, table.shape, 0, 0, -1.0 - i, 1.0 + i)
+            slots, values = table.read_changed(last_seq)
+            assert slots.tolist() == [0]
+            assert values[0, BID] == -1.0 - i and values[0, ASK] == 1.0 + i
+    finally:
+        table.close()
+
+
+def test_shard_down_restores_even_seq_and_invalidates():
+    collector = ShardedPriceCollector(None, ['BTC/USDT'], ['binance', 'okx'], shards=2)
+    try:
+        venue, rows = collector.shards[0]
+        col = collector.symbol_map.col[venue]
+        collector.table.write(0, col, 100.0, 101.0)
+        collector.poll()
+        assert collector.matrix.bids[0, col] == 100.0
+
+        run(die_mid_write, collector.table.name, collector.table.shape, 0, col)
+        collector.on_shard_down(0)
+        assert int(collector.table.seq[0, col]) % 2 == 0
+        collector.poll()
+        assert collector.matrix.bids[0, col] == -np.inf
+
+        collector.table.write(0, col, 102.0, 103.0)
+        assert collector.poll() == 1
+        assert collector.matrix.bids[0, col] == 102.0
+    finally:
+        collector.stop()
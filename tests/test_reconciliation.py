@@ -0,0 +1,63 @@
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+from fake_exchange import FakeExchange  # noqa: E402
+from reconciliation import Reconciliation  # noqa: E402
+
+SYMBOL = 'BTC/USDT'
+
+
+async def make_fills(exchange, count, start_ms):
+    """下 count 笔市价单，成交时间从 start_ms 起每笔加 1 毫秒"""
+    for i in range(count):
+        await exchange.create_order(SYMBOL, 'market', 'buy', 0.001)
+        exchange.trades[-1]['timestamp'] = start_ms + i
+
+
+def stored_ids(recon, venue):
+    rows = recon.store.conn.execute('SELECT id FROM fills WHERE venue = ?', (venue,)).fetchall()
+    return {row[0] for row in rows}
+
+
+def test_newest_first_pages_back_to_cursor(tmp_path):
+    """OKX 返回窗口内最新的一页：超过一页的成交全部拉到，重启后只拉新的"""
+    async def main():
+        exchange = FakeExchange('okx', {'USDT': 1e9}, {SYMBOL: (60000.0, 60001.0)}, newest_first=True)
+        path = str(tmp_path / 'recon.db')
+        now = int(time.time() * 1000)
+        await make_fills(exchange, 250, now - 10000)
+
+        recon = Reconciliation({'okx': exchange}, symbols=[SYMBOL], path=path)
+        assert await recon.fetch_fills('okx', SYMBOL) == 250
+        assert stored_ids(recon, 'okx') == {trade['id'] for trade in exchange.trades}
+        assert exchange.calls.count('fetch_my_trades') == 3
+        await recon.close()
+
+        await make_fills(exchange, 120, now - 5000)
+        exchange.calls.clear()
+        recon = Reconciliation({'okx': exchange}, symbols=[SYMBOL], path=path)
+        assert await recon.fetch_fills('okx', SYMBOL) == 120
+        assert len(stored_ids(recon, 'okx')) == 370
+        await recon.close()
+
+    asyncio.run(main())
+
+
+def test_oldest_first_pages_forward(tmp_path, monkeypatch):
+    """Binance 从 since 开始从旧到新翻页"""
+    monkeypatch.setitem(Config.RECON_PAGE_LIMITS, 'binance', 50)
+
+    async def main():
+        exchange = FakeExchange('binance', {'USDT': 1e9}, {SYMBOL: (60000.0, 60001.0)})
+        await make_fills(exchange, 120, int(time.time() * 1000) - 10000)
+        recon = Reconciliation({'binance': exchange}, symbols=[SYMBOL], path=str(tmp_path / 'recon.db'))
+        assert await recon.fetch_fills('binance', SYMBOL) == 120
+        assert stored_ids(recon, 'binance') == {trade['id'] for trade in exchange.trades}
+        await recon.close()
+
+    asyncio.run(main())
@@ -1,172 +1,409 @@
-import ccxt
+import asyncio
+import ccxt.pro as ccxtpro
+import itertools
 import logging
 import time
 from config import Config
 from notification import Notifier  # 新增通知模块
+from balance_ledger import BalanceLedger
+from order_tracker import OrderTracker, TERMINAL_STATUSES
+from warmup import Warmup
 
 logger = logging.getLogger(__name__)
 
+
+class LegResult:
+    """单边订单的执行结果"""
+
+    def __init__(self, exchange, side, order=None, filled=False, partial=False, error=None, amount=None,
+                 client_order_id=None):
+        self.exchange = exchange
+        self.side = side
+        self.order = order
+        self.filled = filled    # 有成交（全部或部分）
+        self.partial = partial  # 只部分成交
+        self.error = error
+        self.amount = amount    # 下单数量（基础币）
+        self.client_order_id = client_order_id
+
+    def __repr__(self):
+        return f"LegResult({self.exchange} {self.side}, filled={self.filled}, partial={self.partial}, error={self.error})"
+
+
+class PairResult:
+    """双边套利的执行结果
+
+    status 取值:
+    - 'filled': 两边都成交
+    - 'partial': 两边都有成交，但至少一边只部分成交
+    - 'unhedged': 只有一边成交，需要人工或自动对冲
+    - 'failed': 两边都没有成交
+    - 'rejected': 下单前检查未通过，没有发出订单
+    """
+
+    def __init__(self, status, sell_leg=None, buy_leg=None, reason=None):
+        self.status = status
+        self.sell_leg = sell_leg
+        self.buy_leg = buy_leg
+        self.reason = reason
+
+    @property
+    def success(self):
+        return self.status == 'filled'
+
+    def __bool__(self):
+        return self.success
+
+    def __repr__(self):
+        return f"PairResult({self.status}, sell={self.sell_leg}, buy={self.buy_leg}, reason={self.reason})"
+
+
+class CycleResult:
+    """单交易所三角套利的执行结果
+
+    status 取值:
+    - 'filled': 三条腿依次全部成交，资金回到起始货币
+    - 'partial': 前面的腿成交后某条腿失败或只部分成交，资金停留在中间货币，需要人工或自动处理
+    - 'failed': 第一条腿没有成交
+    - 'rejected': 下单前检查未通过，没有发出订单
+    """
+
+    def __init__(self, status, legs=(), reason=None):
+        self.status = status
+        self.legs = list(legs)
+        self.reason = reason
+
+    @property
+    def success(self):
+        return self.status == 'filled'
+
+    def __bool__(self):
+        return self.success
+
+    def __repr__(self):
+        return f"CycleResult({self.status}, legs={self.legs}, reason={self.reason})"
+
+
 class Trader:
     def __init__(self):
-        # 修改为模拟盘的 API 地址
-        okx_url = 'https://www.okx.com/api/v5/account/balance' if Config.OKX_SANDBOX else 'https://www.okx.com/api/v5/account/balance'
-        binance_url = 'https://testnet.binance.vision/api' if Config.BINANCE_SANDBOX else 'https://api.binance.com'
-
+        # 使用 ccxt 的异步客户端（ccxt.pro 额外支持私有 websocket 推送），下单和查询不会阻塞事件循环；
+        # 只交易现货，只加载现货交易对，减少冷启动时 load_markets 的请求
         self.exchanges = {
-            'binance': ccxt.binance({
+            'binance': ccxtpro.binance({
                 'apiKey': Config.BINANCE_API_KEY,
                 'secret': Config.BINANCE_API_SECRET,
                 'enableRateLimit': True,
-                'urls': {
-                    'api': binance_url  # 根据是否为模拟盘设置正确的 URL
-                }
+                'options': {'fetchMarkets': ['spot']},
             }),
-            'okx': ccxt.okx({
+            'okx': ccxtpro.okx({
                 'apiKey': Config.OKX_API_KEY,
                 'secret': Config.OKX_API_SECRET,
                 'password': Config.OKX_PASSPHRASE,
                 'enableRateLimit': True,
-                'urls': {
-                    'api': okx_url  # 根据是否为模拟盘设置正确的 URL
-                },
-                'headers': {
-                    'x-simulated-trading': '1' if Config.OKX_SANDBOX else None  # 模拟盘需要加入此头部信息
-                }
+                'options': {'fetchMarkets': ['spot']},
             })
         }
-        self.notifier = Notifier()  # 初始化通知系统
+        # 模拟盘：binance 切换到 testnet 域名，okx 在请求上加 x-simulated-trading 头
+        self.sandbox = {'binance': Config.BINANCE_SANDBOX, 'okx': Config.OKX_SANDBOX}
+        for venue, enabled in self.sandbox.items():
+            self.exchanges[venue].set_sandbox_mode(enabled)
+        self.notifier = Notifier()  # 初始化通知系统（后台发送，交易路径上只入队）
+        self.ledger = BalanceLedger(self.exchanges, self.notifier)  # 本地余额账本，下单前不再查询 REST 余额
+        self.ledger_task = None
+        self.order_tracker = OrderTracker(self.exchanges)  # 订单推送跟踪，替代轮询 fetch_order
+        self.tracker_task = None
+        self.warmup = Warmup(self.exchanges, sandbox=self.sandbox)  # 交易对缓存、时钟偏差和预热的连接池
+        self.tables = None  # 可选的 MarketTables：费率、数量步长和最小下单量，下单数量取整和手续费核算用
+        # 客户端订单号从启动时的纳秒时间戳开始递增，重启后不会重复（OKX 最长 32 位，只能是字母和数字）
+        self.client_order_ids = itertools.count(time.time_ns())
+
+    async def start(self):
+        """预热交易所连接，建交易规则表，拉取一次余额，并启动余额同步、订单推送跟踪和通知发送的后台任务"""
+        self.notifier.start()
+        await self.warmup.run()
+        self.warmup.start()
+        if self.tables is not None:
+            await self.tables.start()
+        await self.ledger.seed()
+        self.ledger_task = asyncio.create_task(self.ledger.run())
+        self.tracker_task = asyncio.create_task(self.order_tracker.run())
 
     def check_balance(self, exchange, currency):
-        """检查账户余额"""
+        """检查账户余额（本地账本，不发 REST 请求）"""
+        return self.ledger.available(exchange, currency)
+
+    async def execute_pair(self, sell_ex, buy_ex, symbol=Config.SYMBOL, quantity=Config.QUANTITY,
+                           sell_price=None, buy_price=None, trace=None, on_send=None):
+        """同时发出卖出和买入两条腿，返回 PairResult
+
+        sell_price / buy_price 为采集器给出的预计成交价，用于估算所需资金；
+        没有提供时才向交易所查询 ticker。trace 为可选的延迟追踪记录。
+        on_send(交易所, 交易对, 方向, 数量, 客户端订单号) 在每条腿发出前调用（用于先写日志）。
+        """
+        base, quote = symbol.split('/')
         try:
-            if exchange == 'binance':
-                return Config.QUANTITY  # 模拟余额
-
-            balance = self.exchanges[exchange].fetch_balance()
-            logger.info(f"Balance response from {exchange}: {balance}")  # 打印返回的完整数据结构
-
-            if isinstance(balance, dict):  # 确保返回的是字典类型
-                if exchange == 'okx' and 'data' in balance:
-                    logger.info(f"OKX balance data structure: {balance['data']}")  # 打印OKX返回的具体数据
-                    for item in balance['data']:
-                        if isinstance(item, dict) and item.get('currency') == currency:
-                            return float(item['available'])  # 返回余额
-                else:
-                    return balance['total'].get(currency, 0)
-            else:
-                logger.error(f"Unexpected response from {exchange}: {balance}")
-                return 0
-        except ccxt.NetworkError as e:
-            logger.error(f"Network error while checking balance on {exchange}: {str(e)}")
-            return 0
-        except ccxt.BaseError as e:
-            logger.error(f"API error while checking balance on {exchange}: {str(e)}")
-            return 0
+            if buy_price is None:
+                ticker = await self.exchanges[buy_ex].fetch_ticker(symbol)
+                buy_price = ticker['ask']
+            if sell_price is None:
+                sell_price = buy_price
         except Exception as e:
-            logger.error(f"Failed to check balance on {exchange}: {str(e)}")
-            return 0
+            logger.error(f"Pre-trade check failed: {str(e)}")
+            self.notifier.send_alert(f"Pre-trade check failed: {str(e)}")
+            return PairResult('rejected', reason=str(e))
 
-    def execute_pair(self, sell_ex, buy_ex):
-        try:
-            # 1. 资金余额检查
-            btc_balance_sell = self.check_balance(sell_ex, 'BTC')
-            usdt_balance_buy = self.check_balance(buy_ex, 'USDT')
+        # 1. 资金余额检查（内存查询）
+        base_balance_sell = self.check_balance(sell_ex, base)
+        if base_balance_sell < quantity:
+            msg = f"Insufficient {base} balance on {sell_ex}. Required: {quantity}, Available: {base_balance_sell}"
+            logger.error(msg)
+            self.notifier.send_alert(msg)
+            return PairResult('rejected', reason=msg)
 
-            if btc_balance_sell < Config.QUANTITY:
-                msg = f"Insufficient BTC balance on {sell_ex}. Required: {Config.QUANTITY}, Available: {btc_balance_sell}"
-                logger.error(msg)
-                self.notifier.send_alert(msg)
-                return False
+        estimated_cost = buy_price * quantity
+        quote_balance_buy = self.check_balance(buy_ex, quote)
+        if quote_balance_buy < estimated_cost:
+            msg = f"Insufficient {quote} balance on {buy_ex}. Required: {estimated_cost:.2f}, Available: {quote_balance_buy:.2f}"
+            logger.error(msg)
+            self.notifier.send_alert(msg)
+            return PairResult('rejected', reason=msg)
 
-            ticker = self.exchanges[buy_ex].fetch_ticker(Config.SYMBOL)
-            estimated_cost = ticker['ask'] * Config.QUANTITY
+        # 2. 乐观预扣余额，两条腿同时下单，避免串行等待
+        sell_reservation = self.ledger.reserve(sell_ex, symbol, 'sell', quantity, sell_price)
+        buy_reservation = self.ledger.reserve(buy_ex, symbol, 'buy', quantity, buy_price)
+        sell_leg, buy_leg = await asyncio.gather(
+            self._execute_leg(sell_reservation, trace, on_send),
+            self._execute_leg(buy_reservation, trace, on_send)
+        )
 
-            if usdt_balance_buy < estimated_cost:
-                msg = f"Insufficient USDT balance on {buy_ex}. Required: {estimated_cost:.2f}, Available: {usdt_balance_buy:.2f}"
+        if sell_leg.filled and buy_leg.filled:
+            if sell_leg.partial or buy_leg.partial:
+                msg = f"Partial fill: sell on {sell_ex}: {sell_leg.error}; buy on {buy_ex}: {buy_leg.error}"
                 logger.error(msg)
                 self.notifier.send_alert(msg)
-                return False
+                return PairResult('partial', sell_leg, buy_leg, reason=msg)
+            await self.verify_trade_result(sell_ex, buy_ex, symbol, sell_leg.order, buy_leg.order,
+                                           sell_price, buy_price)
+            return PairResult('filled', sell_leg, buy_leg)
 
-            # 2. 执行卖出订单
-            sell_order = self.exchanges[sell_ex].create_market_sell_order(
-                Config.SYMBOL,
-                Config.QUANTITY
-            )
-            logger.info(f"Placed sell order on {sell_ex}: {sell_order}")
+        if sell_leg.filled or buy_leg.filled:
+            filled, failed = (sell_leg, buy_leg) if sell_leg.filled else (buy_leg, sell_leg)
+            msg = (f"Unhedged position: {filled.side} leg filled on {filled.exchange}, "
+                   f"{failed.side} leg failed on {failed.exchange}: {failed.error}")
+            logger.error(msg)
+            self.notifier.send_alert(msg)
+            return PairResult('unhedged', sell_leg, buy_leg, reason=msg)
 
-            if not self.verify_order(sell_ex, sell_order['id']):
-                msg = f"Failed to verify sell order on {sell_ex}"
-                logger.error(msg)
-                self.notifier.send_alert(msg)
-                return False
+        msg = f"Both legs failed: sell on {sell_ex}: {sell_leg.error}; buy on {buy_ex}: {buy_leg.error}"
+        logger.error(msg)
+        self.notifier.send_alert(msg)
+        return PairResult('failed', sell_leg, buy_leg, reason=msg)
 
-            # 3. 执行买入订单
-            buy_order = self.exchanges[buy_ex].create_market_buy_order(
-                Config.SYMBOL,
-                Config.QUANTITY
-            )
-            logger.info(f"Placed buy order on {buy_ex}: {buy_order}")
+    async def execute_cycle(self, venue, legs, quantity, trace=None, on_send=None):
+        """在同一个交易所依次执行三角套利的三条腿，返回 CycleResult
 
-            if not self.verify_order(buy_ex, buy_order['id']):
-                msg = f"Failed to verify buy order on {buy_ex}"
-                logger.error(msg)
-                self.notifier.send_alert(msg)
-                return False
+        legs 为 ((交易对, 'buy'/'sell', 预计成交价), ...)，quantity 为第一条腿的下单数量（基础币）。
+        后面每条腿用上一条腿实际得到的货币数量（扣除手续费）下单，买入腿按预计成交价折算成基础币数量，
+        再按交易所的数量步长向下取整。on_send 与 execute_pair 相同。
+        """
+        symbol, side, price = legs[0]
+        base, quote = symbol.split('/')
+        currency, required = (base, quantity) if side == 'sell' else (quote, quantity * price)
+        available = self.check_balance(venue, currency)
+        if available < required:
+            msg = f"Insufficient {currency} balance on {venue}. Required: {required}, Available: {available}"
+            logger.error(msg)
+            self.notifier.send_alert(msg)
+            return CycleResult('rejected', reason=msg)
 
-            self.verify_trade_result(sell_order, buy_order)
+        results = []
+        amount = quantity
+        for i, (symbol, side, price) in enumerate(legs):
+            if i:
+                amount = self.floor_amount(venue, symbol, holding if side == 'sell' else holding / price, price)
+                if not amount:
+                    error = f"{symbol} amount {holding} below minimum amount or notional"
+                    results.append(LegResult(venue, side, error=error, amount=0.0))
+                    break
+            leg = await self._execute_leg(self.ledger.reserve(venue, symbol, side, amount, price), trace, on_send)
+            results.append(leg)
+            if not leg.filled or leg.partial:
+                break
+            holding = self._proceeds(symbol, side, leg.order)
 
-            return True
+        if len(results) == len(legs) and results[-1].filled and not results[-1].partial:
+            return CycleResult('filled', results)
+        failed = results[-1]
+        if len(results) == 1 and not failed.filled:
+            msg = f"Triangular cycle on {venue} failed on first leg: {failed.error}"
+            status = 'failed'
+        else:
+            msg = (f"Triangular cycle on {venue} stopped at leg {len(results)} "
+                   f"({legs[len(results) - 1][0]} {failed.side}): {failed.error}")
+            status = 'partial'
+        logger.error(msg)
+        self.notifier.send_alert(msg)
+        return CycleResult(status, results, reason=msg)
 
-        except Exception as e:
-            logger.error(f"Trade failed: {str(e)}")
-            self.notifier.send_alert(f"Trade failed: {str(e)}")
-            return False
-
-    def verify_order(self, exchange, order_id):
-        """验证订单状态"""
-        max_retries = 3
-        retry_delay = 1  # seconds
-
-        for _ in range(max_retries):
-            try:
-                order = self.exchanges[exchange].fetch_order(order_id)
-                if order['status'] == 'closed':
-                    return True
-                time.sleep(retry_delay)
-            except Exception as e:
-                logger.error(f"Failed to verify order {order_id} on {exchange}: {str(e)}")
-                time.sleep(retry_delay)
-
-        return False
-
-    def verify_trade_result(self, sell_order, buy_order):
-        """核对交易结果并计算滑点"""
+    def floor_amount(self, venue, symbol, amount, price=None):
+        """按交易规则表的数量步长向下取整，低于最小数量、或按预计成交价 price 低于最小金额时返回 0；
+        没有规则表时用 ccxt 的精度函数和 markets 中的最小金额"""
+        if self.tables is not None:
+            symbol_map = self.tables.symbol_map
+            return self.tables.floor_amount(symbol_map.row[symbol], symbol_map.col[venue], amount, price)
+        exchange = self.exchanges[venue]
+        try:
+            amount = float(exchange.amount_to_precision(symbol, amount))
+            min_cost = (exchange.market(symbol)['limits'].get('cost') or {}).get('min')
+        except Exception:
+            return 0.0
+        if price is not None and min_cost and amount * price < min_cost:
+            return 0.0
+        return amount
+
+    @staticmethod
+    def _proceeds(symbol, side, order):
+        """一条腿成交后实际得到的货币数量：卖出得到计价币，买入得到基础币，扣除同币种的手续费"""
+        base, quote = symbol.split('/')
+        filled = order.get('filled') or 0.0
+        if side == 'sell':
+            currency = quote
+            received = order.get('cost') or filled * (order.get('average') or order.get('price') or 0.0)
+        else:
+            received, currency = filled, base
+        fee = order.get('fee') or {}
+        if fee.get('cost') and fee.get('currency') == currency:
+            received -= fee['cost']
+        return received
+
+    async def _execute_leg(self, reservation, trace=None, on_send=None):
+        """下单并确认成交，异常不向外抛出，而是记录在 LegResult 中"""
+        exchange, side, symbol, quantity = reservation.venue, reservation.side, reservation.symbol, reservation.quantity
+        client_order_id = f"arb{next(self.client_order_ids)}"
+        leg = LegResult(exchange, side, amount=quantity, client_order_id=client_order_id)
+        if on_send is not None:
+            on_send(exchange, symbol, side, quantity, client_order_id)
+        params = {'clientOrderId': client_order_id}
         try:
-            sell_price = float(sell_order['price'])
-            buy_price = float(buy_order['price'])
+            if trace is not None:
+                trace.mark(exchange, 'order_sent')
+            if side == 'sell':
+                order = await self.exchanges[exchange].create_market_sell_order(symbol, quantity, params)
+            else:
+                order = await self.exchanges[exchange].create_market_buy_order(symbol, quantity, params)
+            if trace is not None:
+                trace.mark(exchange, 'exchange_ack')
+            leg.order = order
+            logger.info("Placed %s order on %s: %s", side, exchange, order)
+        except Exception as e:
+            leg.error = str(e)
+            logger.error(f"Failed to place {side} order on {exchange}: {str(e)}")
+            self.ledger.release(reservation)
+            return leg
+
+        if order.get('status') not in TERMINAL_STATUSES:
+            # 等待私有推送（推送断开时自适应轮询）确认订单终态
+            final = await self.order_tracker.wait(exchange, order['id'], symbol)
+            if final is None or final.get('status') not in TERMINAL_STATUSES:
+                leg.error = f"Failed to verify {side} order {order['id']} on {exchange}"
+                # 订单状态未知，退回预扣并以交易所余额为准
+                self.ledger.release(reservation)
+                self.ledger.request_resync(exchange)
+                return leg
+            leg.order = order = final
+
+        if trace is not None:
+            trace.mark(exchange, 'fill_confirmed')
+        filled = order.get('filled')
+        if order['status'] != 'closed' and not filled:
+            leg.error = f"{side} order {order['id']} on {exchange} {order['status']}"
+            self.ledger.release(reservation)
+            return leg
+
+        leg.filled = True
+        if order['status'] != 'closed':
+            leg.partial = True
+            leg.error = f"{side} order {order['id']} on {exchange} {order['status']} after filling {filled}/{quantity}"
+        self.ledger.confirm(reservation, order)
+        return leg
 
-            spread = sell_price - buy_price
-            expected_spread = Config.SPREAD_THRESHOLD
-            slippage = spread - expected_spread
+    async def verify_order(self, exchange, order_id, symbol=Config.SYMBOL):
+        """验证订单状态，成交后返回订单，否则返回 None"""
+        order = await self.order_tracker.wait(exchange, order_id, symbol)
+        if order is not None and order.get('status') == 'closed':
+            return order
+        return None
+
+    async def verify_trade_result(self, sell_ex, buy_ex, symbol, sell_order, buy_order, sell_price=None,
+                                  buy_price=None):
+        """按实际成交核对交易结果：成交均价、折算为计价币种的手续费、扣费后的净利润，
+        以及成交均价相对预计成交价的滑点（两条腿合计，基点，不利方向为正）"""
+        try:
+            quote = symbol.split('/')[1]
+            quantity = min(float(sell_order.get('filled') or 0.0), float(buy_order.get('filled') or 0.0))
+            sell_fill = self._fill_price(sell_order, sell_price)
+            buy_fill = self._fill_price(buy_order, buy_price)
+            fees = (self._fee_in_quote(sell_ex, symbol, sell_order, sell_fill)
+                    + self._fee_in_quote(buy_ex, symbol, buy_order, buy_fill))
+            slippage = 0.0
+            if sell_price and buy_price:
+                slippage = ((sell_price - sell_fill) / sell_price + (buy_fill - buy_price) / buy_price) * 1e4
 
             trade_result = {
-                'sell_exchange': sell_order['info']['symbol'],
-                'sell_price': sell_price,
-                'buy_exchange': buy_order['info']['symbol'],
-                'buy_price': buy_price,
-                'quantity': Config.QUANTITY,
-                'slippage': slippage,
-                'profit': spread * Config.QUANTITY
+                'symbol': symbol,
+                'sell_exchange': sell_ex,
+                'sell_price': sell_fill,
+                'buy_exchange': buy_ex,
+                'buy_price': buy_fill,
+                'quantity': quantity,
+                'quote': quote,
+                'fees': fees,
+                'slippage_bps': slippage,
+                'profit': (sell_fill - buy_fill) * quantity - fees
             }
 
             logger.info(f"Trade completed successfully: {trade_result}")
             self.notifier.send_trade_report(trade_result)
 
-            if slippage > Config.MAX_SLIPPAGE:
-                msg = f"Large slippage detected: {slippage:.2f}"
+            if slippage > Config.MAX_SLIPPAGE_BPS:
+                msg = f"Large slippage detected on {symbol}: {slippage:.1f} bps"
                 logger.warning(msg)
                 self.notifier.send_alert(msg)
+            return trade_result
 
         except Exception as e:
             logger.error(f"Failed to verify trade result: {str(e)}")
             self.notifier.send_alert(f"Failed to verify trade result: {str(e)}")
+
+    @staticmethod
+    def _fill_price(order, expected=None):
+        """成交均价：average，没有时用 cost / filled，再没有时用订单价格或预计成交价"""
+        if order.get('average'):
+            return float(order['average'])
+        if order.get('cost') and order.get('filled'):
+            return float(order['cost']) / float(order['filled'])
+        return float(order.get('price') or expected or 0.0)
+
+    def _fee_in_quote(self, venue, symbol, order, price):
+        """订单手续费折算为计价币种；没有手续费信息或以其他币种（如 BNB）扣除时按费率表估算"""
+        base, quote = symbol.split('/')
+        fee = order.get('fee') or {}
+        cost, currency = fee.get('cost'), fee.get('currency')
+        if cost is not None and currency == quote:
+            return float(cost)
+        if cost is not None and currency == base:
+            return float(cost) * price
+        rate = (self.tables.taker_fee(venue, symbol) if self.tables is not None
+                else Config.TAKER_FEES.get(venue, 0.0))
+        return float(order.get('filled') or 0.0) * price * rate
+
+    async def close(self):
+        """停止后台任务并关闭异步客户端的 HTTP 会话"""
+        self.warmup.stop()
+        if self.tables is not None:
+            self.tables.stop()
+        self.ledger.stop()
+        self.order_tracker.stop()
+        await self.notifier.close()
+        await asyncio.gather(*(exchange.close() for exchange in self.exchanges.values()),
+                             return_exceptions=True)
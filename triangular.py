@@ -0,0 +1,156 @@
+# File: triangular.py
+import logging
+import math
+from collections import namedtuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# path 为货币路径（首尾相同），legs 为三条腿 ((交易对, 'buy'/'sell', 预计成交价), ...)，
+# edge 为依次完成三次兑换、扣除每条腿 taker 手续费后的相对收益
+TriangleOpportunity = namedtuple('TriangleOpportunity', ['venue', 'path', 'legs', 'edge'])
+
+BUY, SELL = 0, 1
+SIDES = ('buy', 'sell')
+
+
+def find_cycles(symbols, start=()):
+    """枚举交易对构成的所有三角环，返回 [(货币路径, ((行号, 方向), ...))]
+
+    交易对 BASE/QUOTE 对应两条有向边：QUOTE→BASE（买入）和 BASE→QUOTE（卖出）。
+    同一个环的三种旋转只保留一种，正反两个方向是不同的环。环从 start 中最靠前的货币出发
+    （即持有库存、用来执行三角套利的货币），都不在环上时从名称最小的货币出发。
+    """
+    out = {}  # 货币 -> [(下一个货币, 行号, 方向)]
+    for row, symbol in enumerate(symbols):
+        base, quote = symbol.split('/')
+        out.setdefault(quote, []).append((base, row, BUY))
+        out.setdefault(base, []).append((quote, row, SELL))
+    cycles = []
+    for a in sorted(out):
+        for b, row_ab, side_ab in out[a]:
+            if b <= a:
+                continue
+            for c, row_bc, side_bc in out.get(b, ()):
+                if c <= a or c == b:
+                    continue
+                for d, row_ca, side_ca in out.get(c, ()):
+                    if d == a:
+                        path, legs = (a, b, c), ((row_ab, side_ab), (row_bc, side_bc), (row_ca, side_ca))
+                        i = next((path.index(currency) for currency in start if currency in path), 0)
+                        cycles.append((path[i:] + path[:i] + (path[i],), legs[i:] + legs[:i]))
+    return cycles
+
+
+class TriangleScanner:
+    """单个交易所内的三角套利检测，与跨交易所价差共用同一个价格矩阵
+
+    每个交易所一张货币图，边权重为对数汇率：买入边 -log(ask)，卖出边 log(bid)，再加上该交易所的
+    log(1 - taker 费率)，一个环的扣费后对数收益就是三条边权重之和。缺失的报价对应 -inf，不会产生 nan。
+    所有环在启动时枚举一次，同时建好 边 → 经过该边的环 的 CSR 索引。行情写入矩阵后调用 mark
+    标记该格子，evaluate 只原地刷新脏格子的两条边，并只重算经过这些边的环，不扫描整张图。
+
+    扣费后收益超过 min_edge 的环触发一次，之后需要收益回落到不赚钱（<= 0）才会再次触发；
+    环上任一报价超过 max_age 秒未更新时不触发。预计成交价是价格矩阵里按各交易对下单数量计算的 VWAP。
+    """
+
+    def __init__(self, matrix, fees=None, min_edge=0.0, max_age=0.0, start=()):
+        self.matrix = matrix
+        symbol_map = matrix.symbol_map
+        rows, cols = len(symbol_map.symbols), len(symbol_map.venues)
+        self.cols = cols
+        # 边编号 = (行号 * 列数 + 列号) * 2 + 方向，即价格矩阵扁平下标 * 2 + 方向
+        self.weights = np.full((rows * cols, 2), -np.inf)
+        self.flat_weights = self.weights.reshape(-1)
+        self.dirty = np.zeros((rows, cols), dtype=bool)
+        self.flat_dirty = self.dirty.reshape(-1)
+        self.set_fees(fees)
+
+        cycles = find_cycles(symbol_map.symbols, start)
+        self.cycle_cols = []
+        self.paths = []
+        self.cycle_legs = []
+        edges = []
+        for col in range(cols):
+            for path, legs in cycles:
+                self.cycle_cols.append(col)
+                self.paths.append(path)
+                self.cycle_legs.append(legs)
+                edges.append([(row * cols + col) * 2 + side for row, side in legs])
+        self.cycle_edges = np.array(edges, dtype=np.int64).reshape(-1, 3)
+        # CSR 索引：edge_cycles[edge_ptr[e]:edge_ptr[e + 1]] 为经过边 e 的环
+        flat = self.cycle_edges.reshape(-1)
+        order = np.argsort(flat, kind='stable')
+        self.edge_cycles = order // 3
+        self.edge_ptr = np.zeros(rows * cols * 2 + 1, dtype=np.int64)
+        np.cumsum(np.bincount(flat, minlength=rows * cols * 2), out=self.edge_ptr[1:])
+
+        self.threshold = math.log1p(min_edge)
+        self.max_age = max_age
+        self.armed = np.ones(len(self.cycle_edges), dtype=bool)
+        self.evaluated = 0  # 累计重算的环数
+
+    def __len__(self):
+        return len(self.cycle_edges)
+
+    def set_fees(self, fees):
+        """fees 为 {交易所: 费率}，或 (交易对, 交易所) 的费率数组（MarketTables.taker）；所有边在下一次 evaluate 时重算"""
+        if fees is None or isinstance(fees, dict):
+            fees = [(fees or {}).get(venue, 0.0) for venue in self.matrix.symbol_map.venues]
+        taker = np.broadcast_to(np.asarray(fees, dtype=float), self.dirty.shape)
+        self.log_fees = np.log1p(-taker).reshape(-1)  # 每个格子的 log(1 - taker 费率)
+        self.dirty[:] = True
+
+    def mark(self, row, col):
+        """价格矩阵的 (row, col) 报价有变化（更新或作废）"""
+        self.dirty[row, col] = True
+
+    def evaluate(self, now=None):
+        """刷新脏边权重并重算经过它们的环，返回超过阈值的 [(环编号, 对数收益)] 并清除脏标记"""
+        cells = np.flatnonzero(self.flat_dirty)
+        if not cells.size:
+            return []
+        self.flat_dirty[cells] = False
+        log_fees = self.log_fees[cells]
+        self.weights[cells, BUY] = log_fees - self.matrix.log_asks.reshape(-1)[cells]
+        self.weights[cells, SELL] = log_fees + self.matrix.log_bids.reshape(-1)[cells]
+
+        # 两条边的 CSR 区间拼起来，取出经过脏边的环（一个环可能经过多条脏边，去重）
+        edges = np.stack((cells * 2, cells * 2 + 1), axis=1).reshape(-1)
+        starts = self.edge_ptr[edges]
+        lengths = self.edge_ptr[edges + 1] - starts
+        total = int(lengths.sum())
+        if not total:
+            return []
+        index = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+        cycles = np.unique(self.edge_cycles[index])
+        self.evaluated += cycles.size
+
+        returns = self.flat_weights[self.cycle_edges[cycles]].sum(axis=1)
+        armed = self.armed[cycles] | (returns <= 0.0)
+        hits = armed & (returns > self.threshold)
+        if hits.any() and self.max_age and now is not None:
+            hit_cycles = cycles[hits]
+            received = self.matrix.received_times.reshape(-1)[self.cycle_edges[hit_cycles] // 2]
+            fresh = (now - received <= self.max_age).all(axis=1)
+            hits[np.flatnonzero(hits)[~fresh]] = False
+        self.armed[cycles] = armed & ~hits
+        return list(zip(cycles[hits].tolist(), returns[hits].tolist()))
+
+    def opportunities(self, now=None):
+        """返回有更新的环中超过阈值的 TriangleOpportunity 列表，按收益从大到小排序"""
+        hits = self.evaluate(now)
+        if not hits:
+            return []
+        symbols = self.matrix.symbol_map.symbols
+        venues = self.matrix.symbol_map.venues
+        bids, asks = self.matrix.bids, self.matrix.asks
+        result = []
+        for cycle, log_return in hits:
+            col = self.cycle_cols[cycle]
+            legs = tuple((symbols[row], SIDES[side], float(asks[row, col] if side == BUY else bids[row, col]))
+                         for row, side in self.cycle_legs[cycle])
+            result.append(TriangleOpportunity(venues[col], self.paths[cycle], legs, math.expm1(log_return)))
+        result.sort(key=lambda opportunity: -opportunity.edge)
+        return result
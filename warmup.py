@@ -0,0 +1,237 @@
+# File: warmup.py
+import asyncio
+import json
+import logging
+import os
+import time
+from urllib.parse import urlsplit
+
+import ccxt
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+MARKET_CACHE_VERSION = 1  # 缓存文件格式版本，格式变化时递增使旧缓存失效
+
+
+class MarketCache:
+    """各交易所 load_markets 结果的本地缓存
+
+    每个交易所一个 JSON 文件，记录缓存格式版本、ccxt 版本和是否模拟盘，任一不一致时视为没有缓存；
+    超过 ttl 的缓存仍然可用，但需要后台刷新。
+    """
+
+    def __init__(self, directory=None, ttl=None):
+        self.directory = directory or Config.MARKET_CACHE_DIR
+        self.ttl = Config.MARKET_CACHE_TTL if ttl is None else ttl
+
+    def path(self, venue):
+        return os.path.join(self.directory, f"{venue}.json")
+
+    def load(self, venue, sandbox):
+        """返回 (markets, currencies, 是否过期)，没有可用的缓存时返回 None"""
+        try:
+            with open(self.path(venue)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (data.get('version') != MARKET_CACHE_VERSION or data.get('ccxt') != ccxt.__version__
+                or data.get('sandbox') != sandbox or not data.get('markets')):
+            return None
+        stale = time.time() - data.get('fetched', 0) > self.ttl
+        return data['markets'], data.get('currencies'), stale
+
+    def save(self, venue, sandbox, markets, currencies):
+        """先写临时文件再改名，进程中途退出不会留下半个缓存文件"""
+        os.makedirs(self.directory, exist_ok=True)
+        data = {'version': MARKET_CACHE_VERSION, 'ccxt': ccxt.__version__, 'sandbox': sandbox,
+                'fetched': time.time(), 'markets': markets, 'currencies': currencies}
+        tmp = self.path(venue) + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f, default=str)
+        os.replace(tmp, self.path(venue))
+
+
+class Warmup:
+    """交易前的预热，在行情启动前完成，避免重启后的第一笔交易承担冷启动开销
+
+    - 对每个交易所的 REST 域名并发建立 pool_size 条 HTTP 连接（TCP + TLS 握手），之后每隔
+      keepalive_interval 秒发一次轻量请求，让连接池里的连接一直保持可用
+    - 用 fetch_time 测量与各交易所的时钟偏差，支持的交易所（binance）写入 timeDifference 修正签名时间戳
+    - 交易对信息优先从本地缓存加载（set_markets），没有缓存时才从交易所拉取；过期的缓存先用，后台刷新
+    run 返回各交易所的冷 / 热耗时报告。
+    """
+
+    def __init__(self, exchanges, cache=None, sandbox=None, pool_size=None, keepalive_interval=None,
+                 clock_sync_interval=None):
+        self.exchanges = exchanges
+        self.cache = cache or MarketCache()
+        self.sandbox = sandbox or {}  # venue -> 是否模拟盘，区分缓存
+        self.pool_size = pool_size or Config.HTTP_POOL_SIZE
+        self.keepalive_interval = keepalive_interval or Config.HTTP_KEEPALIVE_INTERVAL
+        self.clock_sync_interval = clock_sync_interval or Config.CLOCK_SYNC_INTERVAL
+        self.clock_offsets = {}  # venue -> 交易所时间 - 本地时间（毫秒）
+        self.report = {}
+        self.tasks = []
+
+    async def run(self):
+        """并发预热所有交易所，返回 {venue: 报告}"""
+        results = await asyncio.gather(*(self.warm_venue(venue) for venue in self.exchanges), return_exceptions=True)
+        for venue, result in zip(self.exchanges, results):
+            if isinstance(result, Exception):
+                logger.error(f"Warm-up failed on {venue}: {result}")
+                self.report[venue] = {'error': str(result)}
+        return self.report
+
+    async def warm_venue(self, venue):
+        exchange = self.exchanges[venue]
+        report = self.report[venue] = {}
+
+        # 1. 连接池：第一批请求包含 DNS、TCP 和 TLS 握手，即冷启动的连接开销
+        start = time.perf_counter()
+        await self.touch(venue, self.pool_size)
+        report['connect_cold_ms'] = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        await self.touch(venue, 1)
+        report['request_warm_ms'] = (time.perf_counter() - start) * 1000
+
+        # 2. 时钟偏差：放在 load_markets 之前，避免 ccxt 限频队列的等待计入往返时间
+        await self.sync_clock(venue)
+        report['clock_offset_ms'] = self.clock_offsets.get(venue)
+
+        # 3. 交易对信息
+        start = time.perf_counter()
+        cached = self.cache.load(venue, self.sandbox.get(venue, False))
+        if cached is not None:
+            markets, currencies, stale = cached
+            exchange.set_markets(markets, currencies)
+            report['markets'] = 'stale cache' if stale else 'cache'
+            if stale:
+                self.tasks.append(asyncio.create_task(self.refresh_markets(venue)))
+        else:
+            await self.load_markets(venue)
+            report['markets'] = 'network'
+        report['markets_ms'] = (time.perf_counter() - start) * 1000
+        report['market_count'] = len(exchange.markets or {})
+
+        logger.info(f"{venue} warm-up: {report['market_count']} markets from {report['markets']} in "
+                    f"{report['markets_ms']:.0f}ms, {self.pool_size} connections cold {report['connect_cold_ms']:.0f}ms, "
+                    f"warm request {report['request_warm_ms']:.0f}ms, clock offset {report['clock_offset_ms']}ms")
+        return report
+
+    async def load_markets(self, venue):
+        """从交易所重新拉取交易对信息并写入缓存，返回耗时（毫秒）"""
+        exchange = self.exchanges[venue]
+        start = time.perf_counter()
+        await exchange.load_markets(reload=True)
+        elapsed = (time.perf_counter() - start) * 1000
+        await asyncio.to_thread(self.cache.save, venue, self.sandbox.get(venue, False),
+                                exchange.markets, exchange.currencies)
+        return elapsed
+
+    async def refresh_markets(self, venue):
+        try:
+            elapsed = await self.load_markets(venue)
+            self.report[venue]['markets_network_ms'] = elapsed
+            logger.info(f"{venue} markets refreshed from network in {elapsed:.0f}ms")
+        except Exception as e:
+            logger.warning(f"Failed to refresh markets on {venue}: {e}")
+
+    async def sync_clock(self, venue, samples=3):
+        """按请求往返的中点估计时钟偏差，取往返时间最短的一次"""
+        exchange = self.exchanges[venue]
+        if not exchange.has.get('fetchTime'):
+            return
+        best = None
+        for _ in range(samples):
+            before = time.time() * 1000
+            server = await exchange.fetch_time()
+            after = time.time() * 1000
+            if best is None or after - before < best[0]:
+                best = (after - before, server - (before + after) / 2)
+        rtt, offset = best
+        offset = round(offset)
+        self.clock_offsets[venue] = offset
+        if 'timeDifference' in exchange.options:
+            # binance 签名用的时间戳为 milliseconds() - timeDifference
+            exchange.options['timeDifference'] = -offset
+        if abs(offset) > Config.CLOCK_OFFSET_WARN:
+            logger.warning(f"Clock offset on {venue} is {offset}ms (round trip {rtt:.0f}ms)")
+
+    def base_url(self, venue):
+        """下单所用 REST 接口的域名"""
+        exchange = self.exchanges[venue]
+        api = exchange.urls['api']
+        if isinstance(api, dict):
+            api = next((api[key] for key in ('private', 'rest', 'public') if key in api), next(iter(api.values())))
+        parts = urlsplit(exchange.implode_hostname(api))
+        return f"{parts.scheme}://{parts.netloc}/"
+
+    async def touch(self, venue, count):
+        """直接用 ccxt 的 aiohttp 会话并发发出 count 个请求，连接在读完响应后回到连接池
+
+        不经过 ccxt 的限频队列，否则请求被串行化，无法同时建立多条连接；响应状态码无所谓。
+        """
+        exchange = self.exchanges[venue]
+        exchange.open()
+        url = self.base_url(venue)
+
+        async def request():
+            async with exchange.session.get(url) as response:
+                await response.read()
+
+        await asyncio.gather(*(request() for _ in range(count)))
+
+    async def maintain(self, venue):
+        """保持连接池里的连接，定期重新测量时钟偏差，交易对缓存过期后刷新"""
+        last_clock = time.monotonic()
+        last_markets = time.monotonic()
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            try:
+                await self.touch(venue, self.pool_size)
+                if time.monotonic() - last_clock >= self.clock_sync_interval:
+                    last_clock = time.monotonic()
+                    await self.sync_clock(venue)
+                if time.monotonic() - last_markets >= self.cache.ttl:
+                    last_markets = time.monotonic()
+                    await self.refresh_markets(venue)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Keep-alive on {venue} failed: {e}")
+
+    def start(self):
+        self.tasks.extend(asyncio.create_task(self.maintain(venue)) for venue in self.exchanges)
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+
+
+async def compare():
+    """对配置的交易所做一次冷启动（空缓存、新连接）和一次热启动预热，打印两次的耗时"""
+    import tempfile
+    from trader import Trader
+
+    with tempfile.TemporaryDirectory() as empty:
+        for label, cache in (('cold', MarketCache(empty)), ('warm', MarketCache())):
+            trader = Trader()
+            warmup = Warmup(trader.exchanges, cache=cache, sandbox=trader.sandbox)
+            try:
+                report = await warmup.run()
+                if label == 'cold':
+                    # 冷启动拉取的交易对写入正式缓存，供热启动使用
+                    for venue, exchange in trader.exchanges.items():
+                        if exchange.markets:
+                            MarketCache().save(venue, trader.sandbox[venue], exchange.markets, exchange.currencies)
+            finally:
+                await asyncio.gather(*(exchange.close() for exchange in trader.exchanges.values()),
+                                     return_exceptions=True)
+            for venue, venue_report in report.items():
+                print(f"{label} {venue}: {venue_report}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(compare())
@@ -0,0 +1,337 @@
+# File: ws_harness.py
+"""行情连接的故障切换演练
+
+FlakyFeedServer 是一个本地 websocket 行情服务，按 Binance（/binance）和 OKX（/okx）的协议
+推送增量深度，并可以注入故障：直接断开所有连接、整体停顿、随机丢帧（造成序号断开）、
+给每一帧加固定延迟。同时提供 fetch_order_book，充当 Binance 的 REST 快照接口。
+
+用法: python ws_harness.py [--symbols BTC/USDT,ETH/USDT]
+依次运行各个故障场景，检查断线期间报价被作废、重连后恢复，以及丢帧后的重新同步。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import websockets
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class SimulatedBook:
+    """一个交易对的模拟盘口：每一步随机游走中间价，并重写买卖各 5 档"""
+
+    def __init__(self, symbol, mid, depth=5):
+        self.symbol = symbol
+        self.mid = mid
+        self.depth = depth
+        self.bids = {}
+        self.asks = {}
+        self.update_id = 0  # Binance 的 U/u
+        self.seq_id = 0     # OKX 的 seqId
+        self.step()
+
+    def step(self, mid=None):
+        """前进一步，返回变化的 (bids, asks) 档位，数量为 0 表示删除；mid 为 None 时中间价随机游走"""
+        self.mid = self.mid + random.choice((-1.0, 0.0, 1.0)) if mid is None else mid
+        bids = {round(self.mid - 0.5 - i, 2): round(random.uniform(0.1, 2.0), 4) for i in range(self.depth)}
+        asks = {round(self.mid + 0.5 + i, 2): round(random.uniform(0.1, 2.0), 4) for i in range(self.depth)}
+        bid_changes = [[str(p), '0'] for p in self.bids if p not in bids] + [[str(p), str(q)] for p, q in bids.items()]
+        ask_changes = [[str(p), '0'] for p in self.asks if p not in asks] + [[str(p), str(q)] for p, q in asks.items()]
+        self.bids, self.asks = bids, asks
+        self.update_id += 1
+        self.seq_id += 1
+        return bid_changes, ask_changes
+
+    def levels(self):
+        bids = sorted(([p, q] for p, q in self.bids.items()), reverse=True)
+        asks = sorted([p, q] for p, q in self.asks.items())
+        return bids, asks
+
+
+class _Client:
+    """服务端的一条客户端连接"""
+
+    def __init__(self, ws, venue):
+        self.ws = ws
+        self.venue = venue
+        self.symbols = set()
+        self.queue = asyncio.Queue()  # (发送时间, 帧)
+
+
+class FlakyFeedServer:
+    """会出故障的本地行情服务"""
+
+    def __init__(self, symbols, interval=0.01, host='127.0.0.1', port=0):
+        self.books = {symbol: SimulatedBook(symbol, 50000.0 + 1000 * i) for i, symbol in enumerate(symbols)}
+        self.binance_names = {symbol.replace('/', '').lower(): symbol for symbol in symbols}
+        self.okx_names = {symbol.replace('/', '-'): symbol for symbol in symbols}
+        self.interval = interval
+        self.host = host
+        self.port = port
+        self.clients = set()
+        self.server = None
+        self.ticker = None
+        # 故障注入
+        self.drop_rate = 0.0     # 每帧被丢弃的概率
+        self.delay = 0.0         # 每帧的额外延迟（秒）
+        self.stalled_until = 0.0  # 在此之前不发送任何数据（包括心跳回复）
+        # 统计
+        self.connections = 0
+        self.snapshots = 0
+        self.dropped = 0
+
+    async def start(self):
+        self.server = await websockets.serve(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.ticker = asyncio.create_task(self._tick_loop())
+        return self
+
+    def url(self, venue):
+        return f"ws://{self.host}:{self.port}/{venue}"
+
+    async def close(self):
+        self.ticker.cancel()
+        self.server.close()
+        await self.server.wait_closed()
+
+    # 故障注入接口
+
+    def kill_connections(self):
+        """不发送关闭帧，直接断开 TCP 连接"""
+        for client in list(self.clients):
+            client.ws.transport.abort()
+
+    def stall(self, seconds):
+        self.stalled_until = time.monotonic() + seconds
+
+    @property
+    def stalled(self):
+        return time.monotonic() < self.stalled_until
+
+    # REST 快照（充当 Binance 的 fetch_order_book）
+
+    async def fetch_order_book(self, symbol, limit=None):
+        book = self.books[symbol]
+        bids, asks = book.levels()
+        self.snapshots += 1
+        return {'symbol': symbol, 'bids': bids, 'asks': asks, 'nonce': book.update_id}
+
+    # 推送
+
+    async def _handle(self, ws):
+        venue = ws.path.strip('/')
+        client = _Client(ws, venue)
+        self.clients.add(client)
+        self.connections += 1
+        sender = asyncio.create_task(self._send_loop(client))
+        try:
+            async for message in ws:
+                if message == 'ping':
+                    self._push(client, 'pong')
+                    continue
+                self._on_request(client, json.loads(message))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.clients.discard(client)
+            sender.cancel()
+
+    def _on_request(self, client, request):
+        if client.venue == 'binance' and request.get('method') == 'SUBSCRIBE':
+            for stream in request['params']:
+                symbol = self.binance_names.get(stream.split('@')[0])
+                if symbol is not None:
+                    client.symbols.add(symbol)
+            self._push(client, json.dumps({'result': None, 'id': request.get('id')}))
+        elif client.venue == 'okx' and request.get('op') in ('subscribe', 'unsubscribe'):
+            for arg in request['args']:
+                symbol = self.okx_names.get(arg['instId'])
+                if symbol is None:
+                    continue
+                self._push(client, json.dumps({'event': request['op'], 'arg': arg}))
+                if request['op'] == 'unsubscribe':
+                    client.symbols.discard(symbol)
+                else:
+                    client.symbols.add(symbol)
+                    self.snapshots += 1
+                    self._push(client, self._okx_frame(self.books[symbol], 'snapshot'))
+
+    def _push(self, client, frame):
+        if self.stalled:
+            return
+        client.queue.put_nowait((time.monotonic() + self.delay, frame))
+
+    async def _send_loop(self, client):
+        while True:
+            due, frame = await client.queue.get()
+            wait = due - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                await client.ws.send(frame)
+            except websockets.ConnectionClosed:
+                return
+
+    async def _tick_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            for symbol, book in self.books.items():
+                bids, asks = book.step()
+                frames = {}
+                for client in self.clients:
+                    if symbol not in client.symbols:
+                        continue
+                    if self.drop_rate and random.random() < self.drop_rate:
+                        self.dropped += 1
+                        continue
+                    frame = frames.get(client.venue)
+                    if frame is None:
+                        if client.venue == 'binance':
+                            frame = self._binance_frame(book, bids, asks)
+                        else:
+                            frame = self._okx_frame(book, 'update', bids, asks)
+                        frames[client.venue] = frame
+                    self._push(client, frame)
+
+    @staticmethod
+    def _binance_frame(book, bids, asks):
+        return json.dumps({'e': 'depthUpdate', 'E': int(time.time() * 1000), 's': book.symbol.replace('/', ''),
+                           'U': book.update_id, 'u': book.update_id, 'b': bids, 'a': asks})
+
+    @staticmethod
+    def _okx_frame(book, action, bids=None, asks=None):
+        if action == 'snapshot':
+            bids, asks = book.levels()
+            bids = [[str(p), str(q), '0', '1'] for p, q in bids]
+            asks = [[str(p), str(q), '0', '1'] for p, q in asks]
+            prev_seq_id = -1
+        else:
+            bids = [level + ['0', '1'] for level in bids]
+            asks = [level + ['0', '1'] for level in asks]
+            prev_seq_id = book.seq_id - 1
+        data = {'bids': bids, 'asks': asks, 'ts': str(int(time.time() * 1000)),
+                'seqId': book.seq_id, 'prevSeqId': prev_seq_id}
+        return json.dumps({'arg': {'channel': 'books', 'instId': book.symbol.replace('/', '-')},
+                           'action': action, 'data': [data]})
+
+
+class FailoverDrill:
+    """把 PriceCollector 连到 FlakyFeedServer 上，逐个场景注入故障并检查报价状态"""
+
+    def __init__(self, symbols, stale_timeout=1.0):
+        self.symbols = symbols
+        self.stale_timeout = stale_timeout
+        self.results = []
+
+    def quotes_valid(self, collector, venue):
+        col = collector.symbol_map.col[venue]
+        matrix = collector.matrix
+        return bool(np.isfinite(matrix.bids[:, col]).all() and np.isfinite(matrix.asks[:, col]).all())
+
+    def quotes_invalid(self, collector, venue):
+        col = collector.symbol_map.col[venue]
+        return bool(np.isinf(collector.matrix.bids[:, col]).all())
+
+    async def wait_until(self, predicate, timeout):
+        """等待条件成立，返回耗时（秒），超时返回 None"""
+        start = time.monotonic()
+        while time.monotonic() - start < timeout:
+            if predicate():
+                return time.monotonic() - start
+            await asyncio.sleep(0.005)
+        return None
+
+    def check(self, name, ok, detail=''):
+        self.results.append((name, ok))
+        print(f"  [{'PASS' if ok else 'FAIL'}] {name} {detail}")
+
+    async def run(self):
+        from data_collector import PriceCollector
+        from latency import LatencyTracker
+
+        server = await FlakyFeedServer(self.symbols).start()
+        Config.BINANCE_WS_URL = server.url('binance')
+        Config.OKX_WS_URL = server.url('okx')
+        Config.WS_STALE_TIMEOUT = self.stale_timeout
+        Config.WS_HEARTBEAT_INTERVAL = self.stale_timeout / 2
+        Config.WS_RECONNECT_BASE = 0.05
+        Config.WS_RECONNECT_MAX = 0.5
+
+        trader = SimpleNamespace(exchanges={'binance': server})
+        latency = LatencyTracker()
+        collector = PriceCollector(trader, symbols=self.symbols, venues=['binance', 'okx'], latency=latency)
+        runner = asyncio.create_task(collector.run())
+        venues = collector.symbol_map.venues
+        both_valid = lambda: all(self.quotes_valid(collector, venue) for venue in venues)  # noqa: E731
+        both_invalid = lambda: all(self.quotes_invalid(collector, venue) for venue in venues)  # noqa: E731
+        try:
+            print("steady state")
+            elapsed = await self.wait_until(both_valid, 5)
+            self.check('initial sync', elapsed is not None, f"({elapsed or 0:.3f}s)")
+
+            print("connection drop")
+            connects = server.connections
+            server.kill_connections()
+            elapsed = await self.wait_until(both_invalid, 1)
+            self.check('quotes invalidated on drop', elapsed is not None, f"({elapsed or 0:.3f}s)")
+            elapsed = await self.wait_until(both_valid, 5)
+            self.check('recovered after reconnect', elapsed is not None and server.connections > connects,
+                       f"({elapsed or 0:.3f}s, {server.connections - connects} new connections)")
+
+            print("stalled feed")
+            stale = sum(conn.stale_disconnects for feed in collector.feeds for conn in feed.connections)
+            server.stall(self.stale_timeout * 2)
+            elapsed = await self.wait_until(both_invalid, self.stale_timeout * 2)
+            self.check('stale feed detected', elapsed is not None, f"({elapsed or 0:.3f}s)")
+            elapsed = await self.wait_until(both_valid, self.stale_timeout * 4)
+            stale = sum(conn.stale_disconnects for feed in collector.feeds for conn in feed.connections) - stale
+            self.check('recovered after stall', elapsed is not None and stale > 0, f"({stale} watchdog reconnects)")
+
+            print("dropped frames")
+            snapshots = server.snapshots
+            server.drop_rate = 0.02
+            await asyncio.sleep(2)
+            server.drop_rate = 0.0
+            resyncs = server.snapshots - snapshots
+            self.check('gaps trigger resync', resyncs > 0, f"({server.dropped} frames dropped, {resyncs} snapshots)")
+            elapsed = await self.wait_until(both_valid, 5)
+            self.check('books consistent after gaps', elapsed is not None)
+
+            print("delayed frames")
+            connects = server.connections
+            server.delay = 0.2
+            await asyncio.sleep(2)
+            delays = {venue: latency.feed_delay_ms(venue) for venue in venues}
+            self.check('delay visible in feed latency', all(d is not None and d > 150 for d in delays.values()),
+                       ' '.join(f"{venue}={d:.0f}ms" for venue, d in delays.items() if d is not None))
+            self.check('no reconnect under delay', server.connections == connects and both_valid())
+            server.delay = 0.0
+        finally:
+            collector.stop()
+            runner.cancel()
+            await asyncio.gather(runner, return_exceptions=True)
+            await server.close()
+        return all(ok for _, ok in self.results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='websocket 行情连接故障切换演练')
+    parser.add_argument('--symbols', default='BTC/USDT,ETH/USDT', help='逗号分隔的交易对')
+    parser.add_argument('--stale-timeout', type=float, default=1.0, help='看门狗超时（秒）')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    symbols = [s.strip() for s in args.symbols.split(',') if s.strip()]
+    ok = asyncio.run(FailoverDrill(symbols, args.stale_timeout).run())
+    print('all checks passed' if ok else 'some checks failed')
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+# File: ws_manager.py
+import asyncio
+import logging
+import random
+import time
+from functools import partial
+
+import websockets
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class FeedConnection:
+    """一条受监管的 websocket 连接
+
+    - 断开后按带抖动的指数退避重连，重连后重新发送订阅消息
+    - 协议层 ping/pong 由 websockets 处理；需要应用层心跳的交易所（OKX 的 'ping'）
+      在空闲 heartbeat_interval 秒后发送 heartbeat
+    - 看门狗：超过 stale_timeout 秒没有收到任何帧，视为假死，主动断开重连
+    - 连接建立 / 断开时调用 on_up / on_down，调用方据此把行情标记为有效 / 无效
+    """
+
+    def __init__(self, name, url, subscribe_messages, on_frame, on_up=None, on_down=None, heartbeat=None,
+                 heartbeat_interval=None, stale_timeout=None, backoff_base=None, backoff_max=None):
+        self.name = name
+        self.url = url
+        self.subscribe_messages = subscribe_messages  # 每次连上后调用，返回要发送的订阅消息列表
+        self.on_frame = on_frame  # on_frame(frame, received_wall_ns) -> 需要回发的消息列表或 None
+        self.on_up = on_up
+        self.on_down = on_down
+        self.heartbeat = heartbeat
+        self.heartbeat_interval = heartbeat_interval or Config.WS_HEARTBEAT_INTERVAL
+        self.stale_timeout = stale_timeout or Config.WS_STALE_TIMEOUT
+        self.backoff_base = backoff_base or Config.WS_RECONNECT_BASE
+        self.backoff_max = backoff_max or Config.WS_RECONNECT_MAX
+        self.connected = False
+        self.last_frame = 0.0
+        self.frames = 0
+        self.connects = 0
+        self.stale_disconnects = 0
+        self.ws = None
+        self.stopped = False
+
+    def backoff(self, attempt):
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def run(self):
+        attempt = 0
+        while not self.stopped:
+            received_any = False
+            try:
+                async with websockets.connect(self.url, ping_interval=Config.WS_PING_INTERVAL,
+                                              ping_timeout=Config.WS_PING_INTERVAL, close_timeout=1,
+                                              max_size=None) as ws:
+                    self.ws = ws
+                    for message in self.subscribe_messages():
+                        await ws.send(message)
+                    self.connects += 1
+                    self.connected = True
+                    self.last_frame = time.monotonic()
+                    logger.info("Connected to %s (%s)", self.name, self.url)
+                    if self.on_up is not None:
+                        self.on_up()
+                    watchdog = asyncio.create_task(self._watchdog(ws))
+                    watchdog.add_done_callback(partial(self._watchdog_done, ws))
+                    try:
+                        async for frame in ws:
+                            received_wall_ns = time.time_ns()
+                            self.last_frame = time.monotonic()
+                            self.frames += 1
+                            received_any = True
+                            if frame == 'pong':
+                                continue
+                            try:
+                                replies = self.on_frame(frame, received_wall_ns)
+                            except Exception as e:
+                                logger.error("Error handling frame from %s: %s", self.name, e)
+                                continue
+                            if replies:
+                                for reply in replies:
+                                    await ws.send(reply)
+                    finally:
+                        watchdog.cancel()
+                logger.warning("Connection to %s closed", self.name)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Connection to %s failed: %s", self.name, e)
+            finally:
+                self.ws = None
+                if self.connected:
+                    self.connected = False
+                    if self.on_down is not None:
+                        self.on_down()
+
+            if self.stopped:
+                break
+            if received_any:
+                attempt = 0
+            delay = self.backoff(attempt)
+            attempt += 1
+            logger.info("Reconnecting to %s in %.2fs", self.name, delay)
+            await asyncio.sleep(delay)
+
+    async def _watchdog(self, ws):
+        while True:
+            await asyncio.sleep(min(self.heartbeat_interval, self.stale_timeout) / 2)
+            idle = time.monotonic() - self.last_frame
+            if idle >= self.stale_timeout:
+                logger.warning("No data from %s for %.1fs, reconnecting", self.name, idle)
+                self.stale_disconnects += 1
+                await ws.close()
+                return
+            if self.heartbeat is not None and idle >= self.heartbeat_interval:
+                try:
+                    await ws.send(self.heartbeat)
+                except Exception as e:
+                    logger.warning("Heartbeat to %s failed, reconnecting: %s", self.name, e)
+                    await ws.close()
+                    return
+
+    def _watchdog_done(self, ws, task):
+        """看门狗意外退出时记录异常并断开连接，由 run 重连（重连后重新启动看门狗）"""
+        if task.cancelled() or task.exception() is None:
+            return
+        logger.error("Watchdog for %s failed, reconnecting: %s", self.name, task.exception())
+        asyncio.ensure_future(ws.close())
+
+    def stop(self):
+        self.stopped = True
+        if self.ws is not None:
+            asyncio.ensure_future(self.ws.close())
+
+
+class FeedSupervisor:
+    """一个交易所的所有行情连接
+
+    items（通常是交易对行号）按每条连接的订阅上限分片，每个分片一条 FeedConnection。
+    build_subscribe(shard) 返回该分片的订阅消息；on_up(shard) / on_down(shard) 在连接建立 / 断开时调用。
+    """
+
+    def __init__(self, venue, url, items, build_subscribe, on_frame, on_up=None, on_down=None,
+                 max_per_connection=None, **connection_options):
+        self.venue = venue
+        size = max_per_connection or Config.WS_MAX_STREAMS_PER_CONNECTION.get(venue, 100)
+        self.shards = [list(items[i:i + size]) for i in range(0, len(items), size)]
+        self.connections = [
+            FeedConnection(f"{venue}#{k}", url, partial(build_subscribe, shard), on_frame,
+                           on_up=partial(on_up, shard) if on_up else None,
+                           on_down=partial(on_down, shard) if on_down else None,
+                           **connection_options)
+            for k, shard in enumerate(self.shards)
+        ]
+
+    @property
+    def connected(self):
+        return all(connection.connected for connection in self.connections)
+
+    async def run(self):
+        await asyncio.gather(*(connection.run() for connection in self.connections))
+
+    def stop(self):
+        for connection in self.connections:
+            connection.stop()